@@ -0,0 +1,149 @@
+import datetime
+import functools
+
+from asgiref.sync import sync_to_async
+from constance import config
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from rest_framework import status
+from rest_framework.exceptions import APIException, MethodNotAllowed, NotAuthenticated, NotFound, ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+
+from api.authentication import CachedTokenAuthentication
+from api.idempotency import aidempotent, get_error_data
+from api.pagination import RestaurantCursorPagination
+from api.serializers import LeaderboardEntrySerializer, VoteSerializer, WinnerRestaurantSerializer
+from api.throttling import VotesThrottle
+from api.views import RestaurantsViewSet, WinnersListView
+from base import db_router, leaderboard, metrics, vote_buffer
+from base.exceptions import VotesLimitExceeded
+from base.models import Restaurant, Team, Vote, WinnerRestaurant
+
+# Async counterparts of the hot endpoints for the ASGI worker. DRF views are synchronous,
+# so these are plain Django views returning the same payloads as the DRF ones of the shared restaurants.
+
+restaurants_list_view = RestaurantsViewSet.as_view({'get': 'list'})
+
+
+def async_api_view(*methods: str):
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                if request.method not in methods:
+                    raise MethodNotAllowed(request.method)
+                return await view(request, *args, **kwargs)
+            except APIException as exc:
+                response = JsonResponse(get_error_data(exc), status=exc.status_code, safe=False, encoder=JSONEncoder)
+                if getattr(exc, 'wait', None):
+                    response['Retry-After'] = '%d' % exc.wait
+                return response
+
+        # same as for DRF views, the requests are authenticated by the token header
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+async def authenticate(request):
+    result = await CachedTokenAuthentication().aauthenticate(request)
+    if result is None:
+        raise NotAuthenticated
+    # same as DRF does, e.g. for the users who have written to be pinned to the primary
+    request.user = result[0]
+    return result[0]
+
+
+@sync_to_async
+def get_votes_config() -> tuple[int, list[float]]:
+    return config.MAX_VOTES_PER_DAY, config.VOTES_WEIGHTS
+
+
+@async_api_view('POST')
+async def vote_create(request, restaurant_pk: str):
+    # retries with the same Idempotency-Key are checked after the authentication and throttling, as by the DRF view
+    await authenticate(request)
+    await VotesThrottle().acheck(request)
+    return await cast_vote(request, restaurant_pk)
+
+
+@aidempotent
+async def cast_vote(request, restaurant_pk: str):
+    try:
+        restaurant_id = int(restaurant_pk)
+    except ValueError:
+        raise NotFound('Restaurant was not found')
+
+    max_votes, votes_weights = await get_votes_config()
+    cast = vote_buffer.acast_vote if settings.VOTES_WRITE_BEHIND else sync_to_async(Vote.objects.cast_vote)
+    try:
+        vote = await cast(
+            user_id=request.user.id,
+            restaurant_id=restaurant_id,
+            max_votes=max_votes,
+            votes_weights=votes_weights,
+            date=Team.shared_pool().voting_date()
+        )
+    except Restaurant.DoesNotExist:
+        raise NotFound('Restaurant was not found')
+    except VotesLimitExceeded:
+        raise ValidationError('Max votes per day exceeded')
+
+    return JsonResponse(VoteSerializer(vote).data, status=status.HTTP_201_CREATED, encoder=JSONEncoder)
+
+
+@async_api_view('GET')
+async def leaderboard_list(request):
+    entries = await leaderboard.aget_leaderboard(Team.shared_pool().voting_date())
+    # the anonymous reads are served by the replica, if there is one
+    with db_router.replica_reads():
+        restaurants = await Restaurant.objects.filter(team=None)\
+            .ain_bulk([entry.restaurant_id for entry in entries])
+
+    serializer = LeaderboardEntrySerializer([
+        {**entry._asdict(), 'restaurant': restaurants[entry.restaurant_id]}
+        for entry in leaderboard.select(entries, restaurants)
+    ], many=True)
+    return JsonResponse(serializer.data, safe=False, encoder=JSONEncoder)
+
+
+@async_api_view('GET')
+async def winners_list(request):
+    # ranges of dates are streamed by the synchronous endpoint
+    team = Team.shared_pool()
+    filter_date = request.GET.get('date')
+    if filter_date:
+        filter_date = WinnersListView._parse_date(filter_date)
+    else:
+        filter_date = team.voting_date() - datetime.timedelta(days=1)
+
+    cache_key = WinnerRestaurant.objects.get_list_cache_key(filter_date)
+    winners = await cache.aget(cache_key)
+    metrics.record_cache('winners', hit=winners is not None)
+    if winners is None:
+        # the cached winners are read from the primary, as by the synchronous view
+        queryset = WinnerRestaurant.objects.select_related('restaurant').filter(team=None, date=filter_date)
+        winners = WinnersListView.build_cache_entry([
+            WinnerRestaurantSerializer(winner).data async for winner in queryset
+        ])
+        await cache.aset(cache_key, winners, WinnersListView.cache_timeout)
+
+    response = get_conditional_response(
+        request, etag=winners['etag'], last_modified=winners['last_modified']
+    ) or JsonResponse(winners['data'], safe=False, encoder=JSONEncoder)
+    return WinnersListView.patch_response(response, winners, filter_date, team)
+
+
+@async_api_view('GET')
+async def restaurants_list(request):
+    # the cached first page is served right away, other pages and cache misses by the synchronous view
+    if RestaurantCursorPagination.cursor_query_param not in request.GET:
+        cache_key = await Restaurant.objects.aget_list_cache_key(request.build_absolute_uri())
+        data = await cache.aget(cache_key)
+        metrics.record_cache('restaurants', hit=data is not None)
+        if data is not None:
+            return JsonResponse(data, encoder=JSONEncoder)
+
+    return await sync_to_async(lambda: restaurants_list_view(request).render())()
@@ -0,0 +1,65 @@
+import binascii
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from knox.auth import TokenAuthentication
+from knox.crypto import hash_token
+from knox.settings import knox_settings
+from rest_framework import exceptions
+from rest_framework.authentication import get_authorization_header
+
+from base import metrics
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    # Verified tokens are cached by digest, so the token table is only queried once per timeout
+    cache_key = 'auth_token:{digest}'
+
+    def authenticate_credentials(self, token):
+        key = self.get_cache_key(token)
+        auth_token = cache.get(key)
+        metrics.record_cache('auth_token', hit=auth_token is not None)
+        if not self.is_valid(auth_token):
+            user, auth_token = super().authenticate_credentials(token)
+            cache.set(key, auth_token, timeout=self.get_cache_timeout(auth_token))
+            return user, auth_token
+
+        return self.validate_user(auth_token)
+
+    async def aauthenticate(self, request):
+        # the token is looked up in the database only when it isn't cached
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != knox_settings.AUTH_HEADER_PREFIX.encode().lower():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+
+        auth_token = await cache.aget(self.get_cache_key(auth[1]))
+        metrics.record_cache('auth_token', hit=auth_token is not None)
+        if not self.is_valid(auth_token):
+            return await sync_to_async(self.authenticate_credentials)(auth[1])
+        return self.validate_user(auth_token)
+
+    def get_cache_key(self, token: bytes) -> str:
+        try:
+            digest = hash_token(token.decode('utf-8'))
+        except (TypeError, UnicodeDecodeError, binascii.Error):
+            raise exceptions.AuthenticationFailed('Invalid token.')
+        return self.cache_key.format(digest=digest)
+
+    @staticmethod
+    def is_valid(auth_token) -> bool:
+        return auth_token is not None and not (auth_token.expiry and auth_token.expiry < timezone.now())
+
+    @staticmethod
+    def get_cache_timeout(auth_token) -> int:
+        timeout = settings.AUTH_TOKEN_CACHE_TIMEOUT
+        if auth_token.expiry:
+            timeout = min(timeout, int((auth_token.expiry - timezone.now()).total_seconds()))
+        return max(timeout, 1)
+
+    @classmethod
+    def evict(cls, digest: str):
+        cache.delete(cls.cache_key.format(digest=digest))
@@ -0,0 +1,136 @@
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.http import JsonResponse
+from drf_yasg import openapi
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from base.redis_client import get_async_redis, get_redis
+
+HEADER = 'Idempotency-Key'
+KEY = 'idempotency:{user}:{key}'
+# the request is considered failed if it hasn't finished in time, so its key can be retried
+PROCESSING_TTL = 60
+REPLAYED_HEADERS = {'Idempotent-Replayed': 'true'}
+
+IDEMPOTENCY_KEY_PARAMETER = openapi.Parameter(
+    HEADER,
+    openapi.IN_HEADER,
+    description='Unique key of the request, the retries with the same key get the response of the first one',
+    type=openapi.TYPE_STRING,
+)
+
+
+class IdempotencyKeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with the same Idempotency-Key is being processed'
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'The Idempotency-Key was used for another request'
+
+
+def idempotent(handler):
+    # Responses to the requests with the Idempotency-Key header are kept in Redis for IDEMPOTENCY_KEY_TTL,
+    # retries get them back without running the handler again. Keys are scoped by the user, the request must
+    # be the same including the body, so a key of somebody else's registration doesn't give out the token
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        idempotency_key = request.headers.get(HEADER)
+        if not idempotency_key:
+            return handler(view, request, *args, **kwargs)
+
+        redis = get_redis()
+        key, fingerprint = get_key(request, idempotency_key)
+        if not redis.set(key, json.dumps({'fingerprint': fingerprint}), nx=True, ex=PROCESSING_TTL):
+            stored = get_stored(redis.get(key), fingerprint)
+            return Response(stored['data'], status=stored['status'], headers=REPLAYED_HEADERS)
+
+        try:
+            try:
+                response = handler(view, request, *args, **kwargs)
+            except Exception as exc:
+                response = view.handle_exception(exc)
+        except BaseException:
+            redis.delete(key)
+            raise
+
+        if response.status_code >= 500:
+            redis.delete(key)
+        else:
+            redis.set(key, dump(fingerprint, response.status_code, response.data), ex=settings.IDEMPOTENCY_KEY_TTL)
+        return response
+
+    return wrapper
+
+
+def aidempotent(handler):
+    # the same for the async views, which are plain Django views returning JsonResponse,
+    # their errors are raised as APIException and stored as the body async_api_view turns them into
+    @functools.wraps(handler)
+    async def wrapper(request, *args, **kwargs):
+        idempotency_key = request.headers.get(HEADER)
+        if not idempotency_key:
+            return await handler(request, *args, **kwargs)
+
+        redis = get_async_redis()
+        key, fingerprint = get_key(request, idempotency_key)
+        if not await redis.set(key, json.dumps({'fingerprint': fingerprint}), nx=True, ex=PROCESSING_TTL):
+            stored = get_stored(await redis.get(key), fingerprint)
+            return JsonResponse(stored['data'], status=stored['status'], safe=False, headers=REPLAYED_HEADERS)
+
+        async def store(status_code: int, data):
+            if status_code >= 500:
+                await redis.delete(key)
+            else:
+                await redis.set(key, dump(fingerprint, status_code, data), ex=settings.IDEMPOTENCY_KEY_TTL)
+
+        try:
+            response = await handler(request, *args, **kwargs)
+        except APIException as exc:
+            await store(exc.status_code, get_error_data(exc))
+            raise
+        except BaseException:
+            await redis.delete(key)
+            raise
+
+        await store(response.status_code, json.loads(response.content))
+        return response
+
+    return wrapper
+
+
+def get_key(request, idempotency_key: str) -> tuple[str, str]:
+    key = KEY.format(
+        user=request.user.id if request.user.is_authenticated else 'anonymous',
+        key=hashlib.sha256(idempotency_key.encode()).hexdigest()
+    )
+    fingerprint = hashlib.sha256(
+        b'\n'.join([request.method.encode(), request.path.encode(), request.body])
+    ).hexdigest()
+    return key, fingerprint
+
+
+def get_stored(stored: str | None, fingerprint: str) -> dict:
+    # the key expired in the meantime or the first request is still running
+    stored = json.loads(stored) if stored else {}
+    if stored.get('fingerprint', fingerprint) != fingerprint:
+        raise IdempotencyKeyReused
+    if 'status' not in stored:
+        raise IdempotencyKeyInUse
+    return stored
+
+
+def get_error_data(exc: APIException) -> dict | list:
+    # the body DRF responds with to the exception
+    return exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+
+
+def dump(fingerprint: str, status_code: int, data) -> str:
+    return json.dumps({'fingerprint': fingerprint, 'status': status_code, 'data': data}, cls=JSONEncoder)
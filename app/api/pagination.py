@@ -0,0 +1,16 @@
+from rest_framework.pagination import CursorPagination
+
+
+class RestaurantCursorPagination(CursorPagination):
+    ordering = ('created', 'id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class RestaurantSearchPagination(RestaurantCursorPagination):
+    # search results are ordered by their rank, only the best matches are returned without further pages
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.has_next = self.has_previous = False
+        return list(queryset[:self.page_size])
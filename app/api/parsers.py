@@ -0,0 +1,18 @@
+from rest_framework.parsers import BaseParser
+
+from api.restaurant_import import read_csv, read_ndjson
+
+
+class CSVStreamParser(BaseParser):
+    # the rows are read lazily from the request body, which is never loaded as a whole
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return read_csv(stream)
+
+
+class NDJSONStreamParser(BaseParser):
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return read_ndjson(stream)
@@ -0,0 +1,124 @@
+import codecs
+import csv
+import io
+import itertools
+import json
+from typing import Iterable, Iterator
+
+from django.db import connection, transaction
+from rest_framework import serializers
+
+from api.serializers import RestaurantImportSerializer
+from base.models import Restaurant
+
+TABLE = Restaurant._meta.db_table
+FORMATS = ('csv', 'ndjson')
+CHUNK_SIZE = 1000
+COLUMNS = 'name, description, link'
+
+# Every chunk is copied into a temporary table and upserted from there at once. Unchanged restaurants are left
+# as they are, so repeated imports don't bloat the table
+UPSERT_SQL = f"""
+    INSERT INTO {TABLE} (team_id, name, description, link, created)
+    SELECT %(team_id)s, name, description, link, now()
+    FROM restaurant_import
+    ON CONFLICT {{conflict_target}} DO UPDATE
+    SET description = EXCLUDED.description, link = EXCLUDED.link
+    WHERE ({TABLE}.description, {TABLE}.link) IS DISTINCT FROM (EXCLUDED.description, EXCLUDED.link)
+    RETURNING xmax = 0
+"""
+# names are unique within a team and among the restaurants without a team
+SHARED_POOL_CONFLICT_TARGET = '(name) WHERE team_id IS NULL'
+TEAM_CONFLICT_TARGET = '(team_id, name)'
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def read_csv(lines: Iterable[bytes]) -> Iterator[tuple[int, object]]:
+    # rows come with the number of their last line, the columns are named by the header.
+    # CSV has no nulls, so the empty values are left out
+    reader = csv.DictReader(codecs.iterdecode(lines, 'utf-8-sig'))
+    try:
+        for row in reader:
+            yield reader.line_num, {key: value for key, value in row.items() if key and value}
+    except (csv.Error, UnicodeDecodeError) as exc:
+        raise ImportFormatError(f'Line {reader.line_num + 1}: {exc}')
+
+
+def read_ndjson(lines: Iterable[bytes]) -> Iterator[tuple[int, object]]:
+    for line_num, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_num, json.loads(line)
+        except ValueError as exc:
+            yield line_num, serializers.ValidationError({'non_field_errors': [f'Invalid JSON: {exc}']})
+
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+
+def import_restaurants(rows: Iterable[tuple[int, object]], team_id: int = None,
+                       chunk_size: int = CHUNK_SIZE) -> dict:
+    # Rows are validated by the rules of the restaurants API and upserted by the name chunk by chunk,
+    # the input is never loaded as a whole. Invalid rows are reported by their line and skipped
+    report = {'created': 0, 'updated': 0, 'unchanged': 0, 'errors': []}
+    serializer = RestaurantImportSerializer()
+    rows = iter(rows)
+
+    try:
+        while chunk := list(itertools.islice(rows, chunk_size)):
+            # the last row of a name wins, as if the rows were imported one by one
+            restaurants = {}
+            for line_num, row in chunk:
+                try:
+                    if isinstance(row, serializers.ValidationError):
+                        raise row
+                    data = serializer.run_validation(row)
+                except serializers.ValidationError as exc:
+                    report['errors'].append({'line': line_num, 'errors': serializers.as_serializer_error(exc)})
+                else:
+                    restaurants[data['name']] = {
+                        'name': data['name'],
+                        'description': data.get('description') or None,
+                        'link': data.get('link') or None,
+                    }
+
+            if restaurants:
+                created, updated = upsert(list(restaurants.values()), team_id)
+                report['created'] += created
+                report['updated'] += updated
+                report['unchanged'] += len(restaurants) - created - updated
+    finally:
+        # the chunks upserted before a broken line stay, so their restaurants are shown either way
+        if report['created'] or report['updated']:
+            Restaurant.objects.invalidate_list_cache()
+    return report
+
+
+def upsert(restaurants: list[dict], team_id: int = None) -> tuple[int, int]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for restaurant in restaurants:
+        # unquoted empty values are nulls of COPY
+        writer.writerow([restaurant['name'], restaurant['description'], restaurant['link']])
+    buffer.seek(0)
+
+    conflict_target = SHARED_POOL_CONFLICT_TARGET if team_id is None else TEAM_CONFLICT_TARGET
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("""
+            CREATE TEMPORARY TABLE restaurant_import (
+                name varchar(128) NOT NULL,
+                description text NULL,
+                link varchar(200) NULL
+            )
+        """)
+        cursor.copy_expert(f'COPY restaurant_import ({COLUMNS}) FROM STDIN WITH (FORMAT csv)', buffer)
+        cursor.execute(UPSERT_SQL.format(conflict_target=conflict_target), {'team_id': team_id})
+        inserted = [row[0] for row in cursor.fetchall()]
+        # the chunks may share an outer transaction, so the table isn't left till the commit
+        cursor.execute('DROP TABLE restaurant_import')
+    return inserted.count(True), inserted.count(False)
+
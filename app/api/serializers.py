@@ -1,8 +1,10 @@
+import datetime
+
 from django.contrib.auth.models import User
 from rest_framework import serializers
 from knox.settings import knox_settings
 
-from base.models import Restaurant, WinnerRestaurant
+from base.models import Restaurant, RestaurantPeriodStats, RestaurantStats, Team, Vote, WinnerRestaurant
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -25,10 +27,97 @@ class AuthResponseSerializer(serializers.Serializer):
     token = serializers.CharField(max_length=knox_settings.AUTH_TOKEN_CHARACTER_LENGTH)
 
 
+class TeamSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Team
+        fields = ('id', 'name', 'members', 'timezone', 'cutoff', 'created')
+
+
 class RestaurantSerializer(serializers.ModelSerializer):
+    def __init__(self, *args, fields: list[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if fields:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
     class Meta:
         model = Restaurant
         fields = '__all__'
+        read_only_fields = ('team', )
+
+    def validate_name(self, value):
+        # names are unique within the team, the team comes from the URL rather than the payload
+        team_id = self.instance.team_id if self.instance else self.context.get('team_id')
+        restaurants = Restaurant.objects.filter(team_id=team_id, name=value)
+        if self.instance:
+            restaurants = restaurants.exclude(pk=self.instance.pk)
+        if restaurants.exists():
+            raise serializers.ValidationError('restaurant with this name already exists.')
+        return value
+
+
+class RestaurantImportSerializer(RestaurantSerializer):
+    class Meta(RestaurantSerializer.Meta):
+        fields = ('name', 'description', 'link')
+        read_only_fields = ()
+
+    def validate_name(self, value):
+        # the imported restaurants update the existing ones of the same name
+        return value
+
+
+class RestaurantImportErrorSerializer(serializers.Serializer):
+    line = serializers.IntegerField()
+    errors = serializers.DictField(child=serializers.ListField(child=serializers.CharField()))
+
+
+class RestaurantImportReportSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    updated = serializers.IntegerField()
+    unchanged = serializers.IntegerField()
+    errors = RestaurantImportErrorSerializer(many=True)
+
+
+class RestaurantPeriodStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RestaurantPeriodStats
+        fields = ('start', 'score_sum', 'voter_count', 'voted_days', 'wins')
+
+
+class RestaurantStatsSerializer(serializers.ModelSerializer):
+    average_daily_score = serializers.FloatField()
+    weekly = RestaurantPeriodStatsSerializer(many=True)
+    monthly = RestaurantPeriodStatsSerializer(many=True)
+
+    class Meta:
+        model = RestaurantStats
+        fields = ('restaurant', 'total_wins', 'current_win_streak', 'longest_win_streak', 'last_win_date',
+                  'voted_days', 'total_score', 'average_daily_score', 'total_voters', 'weekly', 'monthly')
+
+
+class VoteSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Vote
+        fields = ('restaurant', 'date', 'amount', 'score')
+
+
+class BatchVoteItemSerializer(serializers.Serializer):
+    restaurant_id = serializers.IntegerField()
+    count = serializers.IntegerField(min_value=1)
+
+
+class RemainingVotesSerializer(serializers.Serializer):
+    max_votes = serializers.IntegerField()
+    votes_used = serializers.IntegerField()
+    votes_remaining = serializers.IntegerField()
+
+
+class LeaderboardEntrySerializer(serializers.Serializer):
+    rank = serializers.IntegerField()
+    restaurant = RestaurantSerializer()
+    score = serializers.FloatField()
+    unique_voters = serializers.IntegerField()
 
 
 class WinnerRestaurantSerializer(serializers.ModelSerializer):
@@ -36,4 +125,29 @@ class WinnerRestaurantSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = WinnerRestaurant
-        fields = ('restaurant', 'score', 'unique_voters')
+        fields = ('restaurant', 'date', 'score', 'unique_voters')
+
+
+class WinnersSimulationSerializer(serializers.Serializer):
+    votes_weights = serializers.ListField(child=serializers.FloatField(min_value=0))
+    date_from = serializers.DateField()
+    date_to = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        attrs.setdefault('date_to', datetime.date.today())
+        if attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError('date_from must not be later than date_to')
+        return attrs
+
+
+class SimulatedWinnerSerializer(serializers.Serializer):
+    restaurant_id = serializers.IntegerField()
+    score = serializers.FloatField()
+    unique_voters = serializers.IntegerField()
+
+
+class WinnersSimulationResultSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    winners = SimulatedWinnerSerializer(many=True)
+    actual_winners = serializers.ListField(child=serializers.IntegerField())
+    changed = serializers.BooleanField()
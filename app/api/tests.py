@@ -1,18 +1,43 @@
 import datetime
+import json
 from unittest import mock
 
+import redis
+from asgiref.sync import async_to_sync
 from constance.test import override_config
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
 from knox.models import AuthToken
 from rest_framework import status
 from rest_framework.reverse import reverse
 from rest_framework.test import APITestCase
 
 from api.serializers import WinnerRestaurantSerializer
-from base.models import Restaurant, Vote, WinnerRestaurant
+from base import db_router, leaderboard, metrics, schedule
+from base.models import DailyRestaurantTally, Restaurant, RestaurantStats, Team, Vote, WinnerRestaurant
+from base.redis_client import get_redis
+
+
+def clear_redis_keys(*patterns: str):
+    # the keys of the fixture users and restaurants outlive the test databases
+    redis = get_redis()
+    for pattern in patterns:
+        for key in redis.scan_iter(pattern):
+            redis.delete(key)
+
+
+def clear_throttles():
+    # the buckets of the fixture users and the test client address outlive the test databases
+    clear_redis_keys('throttle:*')
 
 
 class RegisterViewTestCase(APITestCase):
+    def setUp(self):
+        clear_throttles()
+
     def test_register_user(self):
         # url = reverse('register')
         data = {
@@ -41,6 +66,7 @@ class RegisterViewTestCase(APITestCase):
 
 class LoginViewTestCase(APITestCase):
     def setUp(self):
+        clear_throttles()
         self.user = User.objects.create_user(
             username='test_user',
             email='test_user@example.com',
@@ -65,6 +91,7 @@ class LoginViewTestCase(APITestCase):
 class LogoutViewTestCase(APITestCase):
 
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username='testuser', password='testpass')
         _, self.token = AuthToken.objects.create(self.user)
 
@@ -82,6 +109,20 @@ class LogoutViewTestCase(APITestCase):
         response = self.client.post('/api/logout/')
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_cached_token_is_evicted_on_logout(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        response = self.client.get(reverse('votes-remaining'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('votes-remaining'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.post('/api/logout/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.get(reverse('votes-remaining'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
 
 class RestaurantsViewSetTestCase(APITestCase):
     def setUp(self):
@@ -91,12 +132,67 @@ class RestaurantsViewSetTestCase(APITestCase):
             password='test_pass'
         )
         self.restaurant = Restaurant.objects.create(name='Test Restaurant')
+        cache.clear()
 
     def test_list_restaurants(self):
         url = reverse('restaurants-list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_list_restaurants_pagination(self):
+        for i in range(4):
+            Restaurant.objects.create(name=f'Restaurant {i}')
+
+        response = self.client.get(reverse('restaurants-list'), {'page_size': 2})
+        names = [restaurant['name'] for restaurant in response.data['results']]
+        self.assertIsNone(response.data['previous'])
+
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            names.extend(restaurant['name'] for restaurant in response.data['results'])
+
+        self.assertEqual(names, ['Test Restaurant', *(f'Restaurant {i}' for i in range(4))])
+
+    def test_list_restaurants_fields(self):
+        response = self.client.get(reverse('restaurants-list'), {'fields': 'id,name'})
+        self.assertEqual(response.data['results'], [{'id': self.restaurant.id, 'name': 'Test Restaurant'}])
+
+    def test_list_restaurants_cached(self):
+        url = reverse('restaurants-list')
+        self.client.get(url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 1)
+
+        self.client.force_authenticate(user=self.user)
+        self.client.post(url, {'name': 'New Restaurant'})
+
+        response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_search_restaurants(self):
+        Restaurant.objects.create(name='Pizza Place', description='Wood-fired pizzas')
+        Restaurant.objects.create(name='Noodle Bar', description='Noodles and a pizza of the day')
+        Restaurant.objects.create(name='Burger Lab', description='Burgers and fries')
+        team = Team.objects.create(name='Team')
+        Restaurant.objects.create(name='Pizza Corner', team=team)
+
+        response = self.client.get(reverse('restaurants-list'), {'q': 'pizza'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([restaurant['name'] for restaurant in response.data['results']], ['Pizza Place', 'Noodle Bar'])
+        self.assertIsNone(response.data['next'])
+
+        # typos are matched by the trigrams
+        response = self.client.get(reverse('restaurants-list'), {'q': 'piza', 'fields': 'name'})
+        self.assertEqual(response.data['results'][0], {'name': 'Pizza Place'})
+
+        response = self.client.get(reverse('restaurants-list'), {'q': 'burgers', 'page_size': 1})
+        self.assertEqual([restaurant['name'] for restaurant in response.data['results']], ['Burger Lab'])
+
+        response = self.client.get(reverse('restaurants-list'), {'q': 'sushi'})
+        self.assertEqual(response.data['results'], [])
 
     def test_create_restaurant(self):
         data = {'name': 'New Restaurant'}
@@ -126,6 +222,46 @@ class RestaurantsViewSetTestCase(APITestCase):
         self.assertEqual(Restaurant.objects.count(), 0)
 
 
+class RestaurantStatsViewTestCase(APITestCase):
+    fixtures = ['fixtures/tests/restaurants.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = Restaurant.objects.first()
+        for days in range(2):
+            date = datetime.date(2023, 4, 10) + datetime.timedelta(days=days)
+            DailyRestaurantTally.objects.create(date=date, restaurant=cls.restaurant, score_sum=3, voter_count=2)
+            RestaurantStats.objects.roll_up(date)
+        WinnerRestaurant.objects.create(restaurant=cls.restaurant, date=datetime.date(2023, 4, 12), score=3,
+                                        unique_voters=2)
+
+    def test_get_stats(self):
+        response = self.client.get(reverse('restaurants-stats', args=[self.restaurant.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_wins'], 2)
+        self.assertEqual(response.data['current_win_streak'], 2)
+        self.assertEqual(response.data['average_daily_score'], 3.0)
+        self.assertEqual(len(response.data['weekly']), 1)
+        self.assertEqual(response.data['monthly'][0]['voter_count'], 4)
+
+    def test_broken_streak(self):
+        WinnerRestaurant.objects.create(restaurant=Restaurant.objects.last(), date=datetime.date.today(), score=1,
+                                        unique_voters=1)
+        response = self.client.get(reverse('restaurants-stats', args=[self.restaurant.id]))
+        self.assertEqual(response.data['current_win_streak'], 0)
+        self.assertEqual(response.data['longest_win_streak'], 2)
+
+    def test_restaurant_without_stats(self):
+        response = self.client.get(reverse('restaurants-stats', args=[Restaurant.objects.last().id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_wins'], 0)
+        self.assertEqual(response.data['weekly'], [])
+
+    def test_restaurant_not_found(self):
+        response = self.client.get(reverse('restaurants-stats', args=[0]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
 class VotesViewSetTestCase(APITestCase):
     fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json']
 
@@ -134,6 +270,10 @@ class VotesViewSetTestCase(APITestCase):
         cls.user = User.objects.first()
         cls.restaurants = Restaurant.objects.all()
 
+    def setUp(self):
+        cache.clear()
+        clear_throttles()
+
     def test_create_vote(self):
         url = reverse('votes-list', args=[self.restaurants[1].id])
         self.client.force_authenticate(user=self.user)
@@ -142,6 +282,16 @@ class VotesViewSetTestCase(APITestCase):
         self.assertEqual(Vote.objects.count(), 1)
         self.assertEqual(Vote.objects.first().score, 1)
 
+    def test_create_vote_redis_unavailable(self):
+        # the vote is committed before the counters are updated, so it's created anyway
+        url = reverse('votes-list', args=[self.restaurants[1].id])
+        self.client.force_authenticate(user=self.user)
+        with mock.patch('base.leaderboard.record_vote', side_effect=redis.ConnectionError), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Vote.objects.count(), 1)
+
     @override_config(MAX_VOTES_PER_DAY=4)
     def test_create_multiple_votes_same_restaurant(self):
 
@@ -216,6 +366,46 @@ class VotesViewSetTestCase(APITestCase):
         response = self.client.post(url_1)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    @override_config(MAX_VOTES_PER_DAY=1)
+    def test_create_vote_new_restaurant_limit_exceeded(self):
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.post(reverse('votes-list', args=[self.restaurants[0].id]))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.post(reverse('votes-list', args=[self.restaurants[1].id]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Vote.objects.filter(user=self.user, restaurant=self.restaurants[1]).exists())
+
+    @override_config(VOTES_WEIGHTS=[1, 0.5])
+    def test_create_vote_response(self):
+        url = reverse('votes-list', args=[self.restaurants[1].id])
+        self.client.force_authenticate(user=self.user)
+
+        self.client.post(url)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['restaurant'], self.restaurants[1].id)
+        self.assertEqual(response.data['amount'], 2)
+        self.assertEqual(response.data['score'], 1.5)
+
+    @override_settings(VOTES_WRITE_BEHIND=True)
+    def test_create_vote_write_behind(self):
+        clear_redis_keys('vote_buffer:*')
+
+        url = reverse('votes-list', args=[self.restaurants[1].id])
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['amount'], 1)
+        self.assertFalse(Vote.objects.exists())
+
+        # the user's votes and the restaurant ids are seeded once
+        with self.assertNumQueries(0):
+            response = self.client.post(url)
+        self.assertEqual(response.data['amount'], 2)
+
     def test_create_vote_unauthenticated(self):
         url = reverse('votes-list', kwargs={'restaurant_pk': self.restaurants[1].id})
         response = self.client.post(url, {}, format='json')
@@ -228,6 +418,142 @@ class VotesViewSetTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
+class BatchVotesViewTestCase(APITestCase):
+    fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.first()
+        cls.restaurants = Restaurant.objects.order_by('id')
+
+    def setUp(self):
+        cache.clear()
+        clear_throttles()
+        self.client.force_authenticate(user=self.user)
+
+    @override_config(MAX_VOTES_PER_DAY=5, VOTES_WEIGHTS=[1, 0.5, 0.25])
+    def test_batch_votes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('votes-list', args=[self.restaurants[0].id]))
+
+        data = [
+            {'restaurant_id': self.restaurants[0].id, 'count': 2},
+            {'restaurant_id': self.restaurants[1].id, 'count': 1},
+            {'restaurant_id': self.restaurants[1].id, 'count': 1},
+        ]
+        with self.assertNumQueries(6), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('votes-batch'), data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [(vote['restaurant'], vote['amount'], vote['score']) for vote in response.data],
+            [(self.restaurants[0].id, 3, 1.75), (self.restaurants[1].id, 2, 1.5)]
+        )
+        self.assertEqual(Vote.objects.get(user=self.user, restaurant=self.restaurants[0]).score, 1.75)
+        self.assertEqual(Vote.objects.votes_per_day(self.user.id), 5)
+
+    @override_config(MAX_VOTES_PER_DAY=3)
+    def test_batch_votes_limit_exceeded(self):
+        self.client.post(reverse('votes-list', args=[self.restaurants[0].id]))
+
+        data = [
+            {'restaurant_id': self.restaurants[1].id, 'count': 1},
+            {'restaurant_id': self.restaurants[2].id, 'count': 2},
+        ]
+        response = self.client.post(reverse('votes-batch'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_batch_votes_restaurant_not_found(self):
+        data = [
+            {'restaurant_id': self.restaurants[0].id, 'count': 1},
+            {'restaurant_id': 999, 'count': 1},
+        ]
+        response = self.client.post(reverse('votes-batch'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Vote.objects.exists())
+
+    def test_batch_votes_invalid(self):
+        response = self.client.post(reverse('votes-batch'), [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        data = [{'restaurant_id': self.restaurants[0].id, 'count': 0}]
+        response = self.client.post(reverse('votes-batch'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(VOTES_WRITE_BEHIND=True)
+    @override_config(VOTES_WEIGHTS=[1, 0.5])
+    def test_batch_votes_write_behind(self):
+        clear_redis_keys('vote_buffer:*')
+
+        data = [
+            {'restaurant_id': self.restaurants[0].id, 'count': 3},
+            {'restaurant_id': self.restaurants[1].id, 'count': 1},
+        ]
+        response = self.client.post(reverse('votes-batch'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [(vote['restaurant'], vote['amount'], vote['score']) for vote in response.data],
+            [(self.restaurants[0].id, 3, 2.0), (self.restaurants[1].id, 1, 1.0)]
+        )
+        self.assertFalse(Vote.objects.exists())
+
+
+class RemainingVotesViewTestCase(APITestCase):
+    fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.first()
+        cls.restaurant = Restaurant.objects.first()
+
+    def setUp(self):
+        cache.clear()
+
+    @override_config(MAX_VOTES_PER_DAY=3)
+    def test_remaining_votes(self):
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(reverse('votes-remaining'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'max_votes': 3, 'votes_used': 0, 'votes_remaining': 3})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('votes-list', args=[self.restaurant.id]))
+            self.client.post(reverse('votes-list', args=[self.restaurant.id]))
+
+        response = self.client.get(reverse('votes-remaining'))
+        self.assertEqual(response.data, {'max_votes': 3, 'votes_used': 2, 'votes_remaining': 1})
+
+    def test_remaining_votes_unauthenticated(self):
+        response = self.client.get(reverse('votes-remaining'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class LeaderboardViewTestCase(APITestCase):
+    fixtures = ['fixtures/tests/restaurants.json']
+
+    def setUp(self):
+        clear_redis_keys('leaderboard:*')
+
+    def test_get_leaderboard(self):
+        restaurants, date = Restaurant.objects.order_by('id'), Team.shared_pool().voting_date()
+        leaderboard.rebuild([(restaurants[0].id, 1.0, 1), (restaurants[1].id, 2.5, 2)], date)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('leaderboard'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([entry['restaurant']['id'] for entry in response.data], [restaurants[1].id, restaurants[0].id])
+        self.assertEqual(response.data[0]['rank'], 1)
+        self.assertEqual(response.data[0]['score'], 2.5)
+        self.assertEqual(response.data[0]['unique_voters'], 2)
+
+    def test_get_empty_leaderboard(self):
+        response = self.client.get(reverse('leaderboard'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+
+
 class WinnersListViewTestCase(APITestCase):
     fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json', 'fixtures/tests/winners.json']
 
@@ -236,15 +562,18 @@ class WinnersListViewTestCase(APITestCase):
         cls.restaurant = Restaurant.objects.first()
         cls.winner = WinnerRestaurant.objects.create(
             restaurant=cls.restaurant,
+            date=datetime.date.today(),
             score=4.5,
             unique_voters=3
         )
 
+    def setUp(self):
+        cache.clear()
+
     def test_get_winners(self):
         url = reverse('winners-list')
 
-        with mock.patch('api.views.datetime', wraps=datetime) as mock_datetime:
-            mock_datetime.date.today.return_value = datetime.date.today() + datetime.timedelta(days=1)
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + datetime.timedelta(days=1)):
             response = self.client.get(url)
             self.assertEqual(response.status_code, status.HTTP_200_OK)
             self.assertEqual(len(response.data), 1)
@@ -269,3 +598,704 @@ class WinnersListViewTestCase(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(str(response.data[0]), 'Invalid date format')
+
+    def test_cached_winners(self):
+        url = f"{reverse('winners-list')}?date=2023-04-16"
+        self.client.get(url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+    def test_not_modified(self):
+        url = f"{reverse('winners-list')}?date=2023-04-16"
+        response = self.client.get(url)
+        self.assertIn('ETag', response.headers)
+        self.assertIn('Last-Modified', response.headers)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response.headers['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"outdated"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_cache_control(self):
+        response = self.client.get(f"{reverse('winners-list')}?date=2023-04-16")
+        self.assertIn('immutable', response.headers['Cache-Control'])
+
+        response = self.client.get(f"{reverse('winners-list')}?date={datetime.date.today()}")
+        self.assertNotIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=60', response.headers['Cache-Control'])
+
+    def test_filter_by_date_range(self):
+        url = f"{reverse('winners-list')}?date_from=2023-04-15&date_to=2023-04-16"
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+            winners = json.loads(b''.join(response.streaming_content))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([winner['date'] for winner in winners], ['2023-04-15', '2023-04-16', '2023-04-16'])
+        self.assertIn('name', winners[0]['restaurant'])
+
+    def test_filter_by_date_range_ndjson(self):
+        url = f"{reverse('winners-list')}?date_to=2023-04-15"
+        response = self.client.get(url, HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers['Content-Type'], 'application/x-ndjson')
+
+        winners = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([winner['date'] for winner in winners], ['2023-04-14', '2023-04-15'])
+
+    def test_invalid_date_range(self):
+        url = f"{reverse('winners-list')}?date_from=2023-04-16&date_to=2023-04-15"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        url = f"{reverse('winners-list')}?date_from=16.04.2023"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class WinnersSimulationViewTestCase(APITestCase):
+    fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json', 'fixtures/tests/winners.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='admin', is_staff=True)
+        users = User.objects.filter(is_staff=False).order_by('id')
+        Vote.objects.bulk_create([
+            Vote(user=users[0], restaurant_id=1, date=datetime.date(2023, 4, 15), amount=3, score=1.75),
+            Vote(user=users[1], restaurant_id=3, date=datetime.date(2023, 4, 15), amount=1, score=1),
+        ])
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+
+    def test_simulate_winners(self):
+        data = {'votes_weights': [1, 0.5], 'date_from': '2023-04-15', 'date_to': '2023-04-16'}
+        response = self.client.post(reverse('winners-simulate'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content), [
+            {'date': '2023-04-15', 'winners': [], 'actual_winners': [2], 'changed': True},
+            {
+                'date': '2023-04-16',
+                'winners': [{'restaurant_id': 1, 'score': 2.0, 'unique_voters': 1}],
+                'actual_winners': [2, 3],
+                'changed': True
+            },
+        ])
+
+    def test_simulate_team_winners(self):
+        team = Team.objects.create(name='Team')
+        restaurant = Restaurant.objects.create(team=team, name='Team restaurant')
+        Vote.objects.create(user=User.objects.filter(is_staff=False).first(), restaurant=restaurant,
+                            date=datetime.date(2023, 4, 15), amount=5, score=5)
+        WinnerRestaurant.objects.create(team=team, restaurant=restaurant, date=datetime.date(2023, 4, 16),
+                                        score=5, unique_voters=1)
+
+        data = {'votes_weights': [1, 0.5], 'date_from': '2023-04-16', 'date_to': '2023-04-16'}
+        response = self.client.post(reverse('team-winners-simulate', args=[team.id]), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content), [{
+            'date': '2023-04-16',
+            'winners': [{'restaurant_id': restaurant.id, 'score': 3.0, 'unique_voters': 1}],
+            'actual_winners': [restaurant.id],
+            'changed': False,
+        }])
+
+        # the votes and the winners of the team are left out of the shared pool
+        response = self.client.post(reverse('winners-simulate'), data, format='json')
+        self.assertEqual(response.data[0]['winners'], [{'restaurant_id': 1, 'score': 2.0, 'unique_voters': 1}])
+        self.assertEqual(response.data[0]['actual_winners'], [2, 3])
+
+    def test_simulate_tie(self):
+        data = {'votes_weights': [1, 0], 'date_from': '2023-04-16', 'date_to': '2023-04-16'}
+        response = self.client.post(reverse('winners-simulate'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([winner['restaurant_id'] for winner in response.data[0]['winners']], [1, 3])
+
+    def test_simulate_default_weight(self):
+        data = {'votes_weights': [], 'date_from': '2023-04-16', 'date_to': '2023-04-16'}
+        response = self.client.post(reverse('winners-simulate'), data, format='json')
+        self.assertEqual(response.data[0]['winners'], [{'restaurant_id': 1, 'score': 3.0, 'unique_voters': 1}])
+
+    def test_invalid_date_range(self):
+        data = {'votes_weights': [1], 'date_from': '2023-04-16', 'date_to': '2023-04-15'}
+        response = self.client.post(reverse('winners-simulate'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_not_admin(self):
+        self.client.force_authenticate(User.objects.filter(is_staff=False).first())
+        data = {'votes_weights': [1], 'date_from': '2023-04-16'}
+        response = self.client.post(reverse('winners-simulate'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class TeamsTestCase(APITestCase):
+    fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member, cls.outsider = User.objects.order_by('pk')[:2]
+        cls.shared = Restaurant.objects.order_by('pk').first()
+        cls.team = Team.objects.create(name='Team')
+        cls.team.members.add(cls.member)
+        cls.other_team = Team.objects.create(name='Other team')
+        cls.team_restaurant = Restaurant.objects.create(team=cls.team, name=cls.shared.name)
+
+    def setUp(self):
+        cache.clear()
+        clear_throttles()
+        clear_redis_keys('leaderboard:*')
+
+    def test_list_teams(self):
+        self.client.force_authenticate(user=self.member)
+        response = self.client.get(reverse('teams-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([team['name'] for team in response.data], ['Team'])
+
+    def test_create_team_not_admin(self):
+        self.client.force_authenticate(user=self.member)
+        response = self.client.post(reverse('teams-list'), {'name': 'New team'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_list_team_restaurants(self):
+        self.client.force_authenticate(user=self.member)
+        response = self.client.get(reverse('team-restaurants-list', args=[self.team.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([restaurant['id'] for restaurant in response.data['results']], [self.team_restaurant.id])
+
+        response = self.client.get(reverse('restaurants-list'))
+        self.assertNotIn(self.team_restaurant.id, [restaurant['id'] for restaurant in response.data['results']])
+
+    def test_team_restaurants_not_member(self):
+        self.client.force_authenticate(user=self.outsider)
+        response = self.client.get(reverse('team-restaurants-list', args=[self.team.id]))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.client.get(reverse('team-restaurants-list', args=[0]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_create_team_restaurant(self):
+        self.client.force_authenticate(user=self.member)
+        url = reverse('team-restaurants-list', args=[self.team.id])
+        response = self.client.post(url, {'name': 'New Restaurant', 'team': self.other_team.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Restaurant.objects.get(pk=response.data['id']).team, self.team)
+
+        response = self.client.post(url, {'name': 'New Restaurant'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(reverse('restaurants-list'), {'name': 'New Restaurant'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_create_team_vote(self):
+        self.client.force_authenticate(user=self.member)
+        response = self.client.post(reverse('team-votes-list', args=[self.team.id, self.team_restaurant.id]))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.post(reverse('team-votes-list', args=[self.team.id, self.shared.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(reverse('votes-list', args=[self.team_restaurant.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        data = [{'restaurant_id': self.team_restaurant.id, 'count': 1}]
+        response = self.client.post(reverse('team-votes-batch', args=[self.team.id]), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(reverse('votes-batch'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_create_team_vote_local_date(self):
+        Team.objects.filter(pk=self.team.pk).update(timezone='Pacific/Kiritimati', cutoff=datetime.time(12))
+        self.team.refresh_from_db()
+        self.client.force_authenticate(user=self.member)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('team-votes-list', args=[self.team.id, self.team_restaurant.id]))
+        self.assertEqual(response.data['date'], self.team.voting_date().isoformat())
+        response = self.client.get(reverse('team-votes-remaining', args=[self.team.id]))
+        self.assertEqual(response.data['votes_used'], 1)
+
+    def test_update_team_cutoff(self):
+        get_redis().delete(schedule.SCHEDULE_KEY)
+        self.client.force_authenticate(user=User.objects.create_superuser('admin'))
+
+        response = self.client.patch(reverse('teams-detail', args=[self.team.id]), {'cutoff': '11:30'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(get_redis().zscore(schedule.SCHEDULE_KEY, str(self.team.id)))
+
+        response = self.client.patch(reverse('teams-detail', args=[self.team.id]), {'timezone': 'Mars/Olympus'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_team_leaderboard(self):
+        leaderboard.rebuild([(self.shared.id, 2.0, 2), (self.team_restaurant.id, 1.0, 1)], self.team.voting_date())
+        self.client.force_authenticate(user=self.member)
+
+        response = self.client.get(reverse('team-leaderboard', args=[self.team.id]))
+        self.assertEqual([(entry['rank'], entry['restaurant']['id']) for entry in response.data],
+                         [(1, self.team_restaurant.id)])
+
+        response = self.client.get(reverse('leaderboard'))
+        self.assertEqual([entry['restaurant']['id'] for entry in response.data], [self.shared.id])
+
+    def test_team_winners(self):
+        date = datetime.date.today()
+        WinnerRestaurant.objects.create(restaurant=self.shared, date=date, score=2, unique_voters=2)
+        WinnerRestaurant.objects.create(team=self.team, restaurant=self.team_restaurant, date=date, score=1,
+                                        unique_voters=1)
+        self.client.force_authenticate(user=self.member)
+
+        response = self.client.get(reverse('team-winners-list', args=[self.team.id]), {'date': date})
+        self.assertEqual([winner['restaurant']['id'] for winner in response.data], [self.team_restaurant.id])
+        self.assertIn('private', response.headers['Cache-Control'])
+        self.assertNotIn('public', response.headers['Cache-Control'])
+        self.assertIn('Authorization', response.headers['Vary'])
+
+        response = self.client.get(reverse('winners-list'), {'date': date})
+        self.assertEqual([winner['restaurant']['id'] for winner in response.data], [self.shared.id])
+        self.assertIn('public', response.headers['Cache-Control'])
+
+    def test_team_winners_final_by_cutoff(self):
+        # the voting day of the team is behind the server's date
+        self.team.timezone, self.team.cutoff = 'Etc/GMT+12', datetime.time(23, 59)
+        self.team.save()
+        self.client.force_authenticate(user=self.member)
+        url = reverse('team-winners-list', args=[self.team.id])
+
+        response = self.client.get(url, {'date': self.team.voting_date().isoformat()})
+        self.assertNotIn('immutable', response.headers['Cache-Control'])
+
+        response = self.client.get(url, {'date': (self.team.voting_date() - datetime.timedelta(days=1)).isoformat()})
+        self.assertIn('immutable', response.headers['Cache-Control'])
+
+
+class IdempotencyTestCase(APITestCase):
+    fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.first()
+        cls.restaurant = Restaurant.objects.first()
+
+    def setUp(self):
+        cache.clear()
+        clear_throttles()
+        clear_redis_keys('idempotency:*')
+
+    def test_repeated_vote(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('votes-list', args=[self.restaurant.id])
+        first = self.client.post(url, HTTP_IDEMPOTENCY_KEY='key')
+
+        with self.assertNumQueries(0):
+            response = self.client.post(url, HTTP_IDEMPOTENCY_KEY='key')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, first.data)
+        self.assertEqual(response.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(Vote.objects.get().amount, 1)
+
+        response = self.client.post(url, HTTP_IDEMPOTENCY_KEY='another key')
+        self.assertEqual(response.data['amount'], 2)
+
+    def test_keys_are_scoped_by_user(self):
+        url = reverse('votes-list', args=[self.restaurant.id])
+        for user in User.objects.all()[:2]:
+            self.client.force_authenticate(user=user)
+            response = self.client.post(url, HTTP_IDEMPOTENCY_KEY='key')
+            self.assertNotIn('Idempotent-Replayed', response.headers)
+        self.assertEqual(Vote.objects.count(), 2)
+
+    def test_concurrent_duplicate(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('votes-list', args=[self.restaurant.id])
+        cast_vote = Vote.objects.cast_vote
+        duplicates = []
+
+        def cast_vote_with_duplicate(**kwargs):
+            # the retry arrives while the first request is being processed
+            duplicates.append(self.client.post(url, HTTP_IDEMPOTENCY_KEY='key'))
+            return cast_vote(**kwargs)
+
+        with mock.patch.object(Vote.objects, 'cast_vote', side_effect=cast_vote_with_duplicate):
+            response = self.client.post(url, HTTP_IDEMPOTENCY_KEY='key')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(duplicates[0].status_code, status.HTTP_409_CONFLICT)
+
+    def test_failed_request(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('votes-list', args=[self.restaurant.id])
+        with mock.patch.object(Vote.objects, 'cast_vote', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post(url, HTTP_IDEMPOTENCY_KEY='key')
+
+        # the key of the failed request is released for the retry
+        response = self.client.post(url, HTTP_IDEMPOTENCY_KEY='key')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_repeated_registration(self):
+        data = {'username': 'new_user', 'password': 'password'}
+        first = self.client.post('/api/register/', data, HTTP_IDEMPOTENCY_KEY='key')
+        response = self.client.post('/api/register/', data, HTTP_IDEMPOTENCY_KEY='key')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['token'], first.data['token'])
+        self.assertEqual(User.objects.filter(username='new_user').count(), 1)
+
+        data['password'] = 'guess'
+        response = self.client.post('/api/register/', data, HTTP_IDEMPOTENCY_KEY='key')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+
+class RestaurantImportTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='admin', is_staff=True)
+        cls.team = Team.objects.create(name='Team')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_import_csv(self):
+        Restaurant.objects.create(name='Burger Lab', description='Burgers')
+        Restaurant.objects.create(name='Sushi House', description='Sushi')
+        Restaurant.objects.create(name='Pizza Place', team=self.team)
+        # the cached first page is dropped by the import
+        self.client.get(reverse('restaurants-list'))
+
+        body = (
+            'name,description,link\n'
+            'Pizza Place,"Wood-fired pizzas, pasta",https://pizza.example.com\n'
+            'Burger Lab,"Burgers\nand fries",\n'
+            'Sushi House,Sushi,\n'
+            ',No name,\n'
+            'Noodle Bar,,not a link\n'
+            'Pizza Place,Wood-fired pizzas,https://pizza.example.com\n'
+        )
+        response = self.client.post(reverse('restaurants-import'), body, content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {key: response.data[key] for key in ('created', 'updated', 'unchanged')},
+            {'created': 1, 'updated': 1, 'unchanged': 1}
+        )
+        self.assertEqual([error['line'] for error in response.data['errors']], [6, 7])
+        self.assertIn('name', response.data['errors'][0]['errors'])
+        self.assertIn('link', response.data['errors'][1]['errors'])
+
+        # the last row of a name wins
+        pizza = Restaurant.objects.get(name='Pizza Place', team=None)
+        self.assertEqual((pizza.description, pizza.link), ('Wood-fired pizzas', 'https://pizza.example.com'))
+        self.assertEqual(Restaurant.objects.get(name='Burger Lab').description, 'Burgers\nand fries')
+        self.assertIsNone(Restaurant.objects.get(name='Pizza Place', team=self.team).description)
+        self.assertEqual(len(self.client.get(reverse('restaurants-list')).data['results']), 3)
+
+    def test_import_ndjson(self):
+        body = '\n'.join([
+            json.dumps({'name': 'Pizza Place', 'description': 'Pizzas'}),
+            '',
+            '{"name": ',
+            json.dumps(['Burger Lab']),
+            json.dumps({'name': 'Burger Lab', 'team': None, 'link': None}),
+        ])
+        response = self.client.post(reverse('team-restaurants-import', args=[self.team.id]), body,
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['line'] for error in response.data['errors']], [3, 4])
+        self.assertEqual(set(self.team.restaurants.values_list('name', flat=True)), {'Pizza Place', 'Burger Lab'})
+        self.assertFalse(Restaurant.objects.filter(team=None).exists())
+
+    def test_import_invalid_file(self):
+        response = self.client.post(reverse('restaurants-import'), b'name\nPizza\xff Place\n', content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(reverse('restaurants-import'), {'name': 'Pizza Place'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_import_not_admin(self):
+        self.client.force_authenticate(user=User.objects.create_user(username='user'))
+        response = self.client.post(reverse('restaurants-import'), 'name\nPizza Place\n', content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(Restaurant.objects.exists())
+
+
+class ThrottlingTestCase(APITestCase):
+    fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other_user = User.objects.all()[:2]
+        cls.restaurant = Restaurant.objects.first()
+
+    def setUp(self):
+        cache.clear()
+        clear_throttles()
+
+    @override_config(VOTES_THROTTLE_RATE=1, VOTES_THROTTLE_BURST=2, MAX_VOTES_PER_DAY=10)
+    def test_votes_throttle(self):
+        url = reverse('votes-list', args=[self.restaurant.id])
+        self.client.force_authenticate(user=self.user)
+        for _ in range(2):
+            response = self.client.post(url)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertTrue(0 < int(response.headers['Retry-After']) <= 60)
+        response = self.client.post(reverse('votes-batch'), [{'restaurant_id': self.restaurant.id}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        # every user has their own bucket
+        self.client.force_authenticate(user=self.other_user)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    @override_config(AUTH_THROTTLE_RATE=1, AUTH_THROTTLE_BURST=1)
+    def test_auth_throttle(self):
+        data = {'username': self.user.username, 'password': 'wrong_password'}
+        response = self.client.post('/api/login/', data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # X-Forwarded-For is up to the client without a proxy, so it's ignored
+        response = self.client.post('/api/register/', data, HTTP_X_FORWARDED_FOR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response.headers)
+
+    @override_config(AUTH_THROTTLE_RATE=1, AUTH_THROTTLE_BURST=1)
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1})
+    def test_auth_throttle_behind_proxy(self):
+        data = {'username': self.user.username, 'password': 'wrong_password'}
+        response = self.client.post('/api/login/', data, HTTP_X_FORWARDED_FOR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/api/register/', data, HTTP_X_FORWARDED_FOR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response.headers)
+
+        # the client address is the one added by nginx
+        response = self.client.post('/api/login/', data, HTTP_X_FORWARDED_FOR='10.0.0.1, 10.0.0.2')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_config(VOTES_THROTTLE_RATE=0, VOTES_THROTTLE_BURST=1, MAX_VOTES_PER_DAY=10)
+    def test_throttle_off(self):
+        self.client.force_authenticate(user=self.user)
+        for _ in range(3):
+            response = self.client.post(reverse('votes-list', args=[self.restaurant.id]))
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(list(get_redis().scan_iter('throttle:*')))
+
+    def test_single_round_trip(self):
+        self.client.force_authenticate(user=self.user)
+        execute_command = redis.Redis.execute_command
+        with mock.patch.object(redis.Redis, 'execute_command', autospec=True,
+                               side_effect=execute_command) as execute_command_spy:
+            for _ in range(2):
+                self.client.post(reverse('votes-list', args=[self.restaurant.id]))
+
+        throttle_commands = [
+            call.args[1] for call in execute_command_spy.call_args_list
+            if any(str(arg).startswith('throttle:') for arg in call.args)
+        ]
+        # the script is loaded once, after that every check is a single EVALSHA
+        self.assertEqual(throttle_commands[-1], 'EVALSHA')
+        self.assertLessEqual(len(throttle_commands), 3)
+
+    @override_config(VOTES_THROTTLE_RATE=1, VOTES_THROTTLE_BURST=1)
+    def test_async_votes_throttle(self):
+        _, token = AuthToken.objects.create(self.user)
+        post = async_to_sync(self.async_client.post)
+        url = reverse('async-votes-list', args=[self.restaurant.id])
+        response = post(url, AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = post(url, AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertTrue(0 < int(response.headers['Retry-After']) <= 60)
+
+
+class ReplicaRoutingTestCase(APITestCase):
+    fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.first()
+        cls.restaurant = Restaurant.objects.first()
+
+    def setUp(self):
+        cache.clear()
+        clear_throttles()
+        get_redis().delete(db_router.PIN_KEY.format(user_id=self.user.id))
+
+        # the replica isn't configured for the tests, the routing of the reads is recorded instead
+        self.replica_reads = []
+
+        def db_for_read(router, model, **hints):
+            self.replica_reads.append(db_router.reads_from_replica())
+            return 'default'
+
+        self.enterContext(mock.patch('base.db_router.has_replica', return_value=True))
+        self.enterContext(mock.patch.object(db_router.ReplicaRouter, 'db_for_read', autospec=True,
+                                            side_effect=db_for_read))
+
+    def test_reads_from_replica(self):
+        self.client.get(reverse('restaurants-detail', args=[self.restaurant.id]))
+        self.assertTrue(self.replica_reads)
+        self.assertTrue(all(self.replica_reads))
+
+    def test_cache_filled_from_primary(self):
+        for url in [reverse('restaurants-list'), reverse('winners-list')]:
+            self.replica_reads.clear()
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(self.replica_reads)
+            self.assertFalse(any(self.replica_reads))
+
+    def test_pinned_after_write(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(reverse('votes-list', args=[self.restaurant.id]))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(any(self.replica_reads))
+
+        self.replica_reads.clear()
+        self.client.get(reverse('restaurants-detail', args=[self.restaurant.id]))
+        self.assertTrue(self.replica_reads)
+        self.assertFalse(any(self.replica_reads))
+
+
+class AsyncViewsTestCase(APITestCase):
+    fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json', 'fixtures/tests/winners.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.first()
+        cls.restaurant = Restaurant.objects.first()
+        _, cls.token = AuthToken.objects.create(cls.user)
+
+    def setUp(self):
+        cache.clear()
+        clear_throttles()
+        clear_redis_keys('vote_buffer:*', 'leaderboard:*', 'idempotency:*')
+
+    async def test_create_vote(self):
+        url = reverse('async-votes-list', args=[self.restaurant.id])
+        response = await self.async_client.post(url, AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['amount'], 1)
+        self.assertEqual(await Vote.objects.filter(user=self.user).acount(), 1)
+
+    async def test_create_vote_idempotent(self):
+        url = reverse('async-votes-list', args=[self.restaurant.id])
+        first = await self.async_client.post(url, AUTHORIZATION=f'Bearer {self.token}', IDEMPOTENCY_KEY='key')
+        response = await self.async_client.post(url, AUTHORIZATION=f'Bearer {self.token}', IDEMPOTENCY_KEY='key')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json(), first.json())
+        self.assertEqual(response.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual((await Vote.objects.aget(user=self.user)).amount, 1)
+
+        # errors are replayed as well, the key of another request is refused
+        url = reverse('async-votes-list', args=[0])
+        for _ in range(2):
+            response = await self.async_client.post(url, AUTHORIZATION=f'Bearer {self.token}', IDEMPOTENCY_KEY='404')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.headers['Idempotent-Replayed'], 'true')
+        response = await self.async_client.post(url, AUTHORIZATION=f'Bearer {self.token}', IDEMPOTENCY_KEY='key')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    async def test_create_vote_not_authenticated(self):
+        response = await self.async_client.post(reverse('async-votes-list', args=[self.restaurant.id]))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        url = reverse('async-votes-list', args=[self.restaurant.id])
+        response = await self.async_client.post(url, AUTHORIZATION='Bearer invalid')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_config(MAX_VOTES_PER_DAY=1)
+    def test_create_vote_limit(self):
+        post = async_to_sync(self.async_client.post)
+        url = reverse('async-votes-list', args=[self.restaurant.id])
+        post(url, AUTHORIZATION=f'Bearer {self.token}')
+        response = post(url, AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), ['Max votes per day exceeded'])
+
+        response = post(reverse('async-votes-list', args=[0]), AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(VOTES_WRITE_BEHIND=True)
+    async def test_create_vote_write_behind(self):
+        url = reverse('async-votes-list', args=[self.restaurant.id])
+        response = await self.async_client.post(url, AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(await Vote.objects.aexists())
+
+        response = await self.async_client.get(reverse('async-leaderboard'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()[0]['restaurant']['id'], self.restaurant.id)
+        self.assertEqual(response.json()[0]['score'], 1.0)
+
+    async def test_get_winners(self):
+        url = f"{reverse('async-winners-list')}?date=2023-04-16"
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()), 2)
+        self.assertIn('immutable', response.headers['Cache-Control'])
+
+        response = await self.async_client.get(url, IF_NONE_MATCH=response.headers['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = await self.async_client.get(f"{reverse('async-winners-list')}?date=16.04.2023")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_get_restaurants(self):
+        response = await self.async_client.get(reverse('async-restaurants-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        cached_response = await self.async_client.get(reverse('async-restaurants-list'))
+        self.assertEqual(cached_response.json(), response.json())
+        self.assertEqual(len(response.json()['results']), await Restaurant.objects.acount())
+
+
+class MetricsTestCase(APITestCase):
+    fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json', 'fixtures/tests/winners.json']
+
+    def setUp(self):
+        cache.clear()
+        clear_throttles()
+        metrics.flush()
+        get_redis().delete(metrics.METRICS_KEY)
+
+    def test_request_metrics(self):
+        self.client.get(reverse('restaurants-list'))
+        self.client.get(reverse('restaurants-list'))
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', lines)
+        self.assertIn('http_requests_total{route="restaurants-list",method="GET",status="200"} 2', lines)
+        self.assertIn('http_request_duration_seconds_count{route="restaurants-list",method="GET"} 2', lines)
+        self.assertIn('http_request_duration_seconds_bucket{route="restaurants-list",method="GET",le="+Inf"} 2', lines)
+        self.assertIn('cache_requests_total{cache="restaurants",result="miss"} 1', lines)
+        self.assertIn('cache_requests_total{cache="restaurants",result="hit"} 1', lines)
+        # the first page is served from the cache the second time
+        self.assertIn('http_request_db_queries_bucket{route="restaurants-list",le="0"} 1', lines)
+        self.assertIn('http_request_db_queries_count{route="restaurants-list"} 2', lines)
+
+        buckets = [line for line in lines if line.startswith('http_request_db_queries_bucket{route="restaurants-list"')]
+        self.assertTrue(buckets[-1].startswith('http_request_db_queries_bucket{route="restaurants-list",le="+Inf"}'))
+
+    async def test_async_request_metrics(self):
+        await self.async_client.get(f"{reverse('async-winners-list')}?date=2023-04-16")
+        response = await self.async_client.get(reverse('metrics'))
+
+        lines = response.content.decode().splitlines()
+        self.assertIn('http_requests_total{route="async-winners-list",method="GET",status="200"} 1', lines)
+        self.assertIn('http_request_db_queries_bucket{route="async-winners-list",le="1"} 1', lines)
+        self.assertIn('http_request_db_queries_bucket{route="async-winners-list",le="0"} 0', lines)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_metrics_disabled(self):
+        self.client_class().get(reverse('restaurants-list'))
+        metrics.flush()
+        self.assertFalse(any(sample.startswith('http_') for sample in get_redis().hkeys(metrics.METRICS_KEY)))
@@ -0,0 +1,111 @@
+import logging
+
+import redis
+from asgiref.sync import sync_to_async
+from constance import config
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+from base.redis_client import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY = 'throttle:{scope}:{ident}'
+
+# KEYS: bucket hash
+# ARGV: refilled tokens per minute, bucket capacity
+# Returns 0 when a token was taken, otherwise milliseconds till the next one. The time of the Redis server is used,
+# so the buckets are refilled the same way whichever worker checks them and there is no read-modify-write race
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local rate = tonumber(ARGV[1]) / 60000
+local capacity = tonumber(ARGV[2])
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - updated, 0) * rate)
+
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) / rate)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate))
+return wait
+"""
+
+
+class TokenBucketThrottle(BaseThrottle):
+    # The limits are read from the constance settings, requests per minute and the burst size.
+    # A zero rate switches the throttle off
+    scope = None
+    rate_setting = None
+    burst_setting = None
+
+    def __init__(self):
+        self.wait_ms = 0
+
+    def get_ident_key(self, request) -> str:
+        raise NotImplementedError('.get_ident_key() must be overridden')
+
+    def get_limits(self) -> tuple[int, int]:
+        return getattr(config, self.rate_setting), getattr(config, self.burst_setting)
+
+    def allow_request(self, request, view):
+        rate, burst = self.get_limits()
+        if not rate:
+            return True
+
+        key = KEY.format(scope=self.scope, ident=self.get_ident_key(request))
+        try:
+            self.wait_ms = get_redis().register_script(TOKEN_BUCKET_SCRIPT)(keys=[key], args=[rate, max(burst, 1)])
+        except redis.RedisError:
+            # requests are let through rather than failed while Redis is unavailable
+            logger.warning('Throttle %s could not be checked', self.scope, exc_info=True)
+            return True
+        return not self.wait_ms
+
+    async def acheck(self, request):
+        # the same check for the async views, raises Throttled the async views turn into 429
+        rate, burst = await sync_to_async(self.get_limits)()
+        if not rate:
+            return
+
+        key = KEY.format(scope=self.scope, ident=self.get_ident_key(request))
+        try:
+            self.wait_ms = await get_async_redis().register_script(TOKEN_BUCKET_SCRIPT)(
+                keys=[key], args=[rate, max(burst, 1)]
+            )
+        except redis.RedisError:
+            logger.warning('Throttle %s could not be checked', self.scope, exc_info=True)
+            return
+        if self.wait_ms:
+            raise Throttled(self.wait())
+
+    def wait(self):
+        return self.wait_ms / 1000
+
+
+class VotesThrottle(TokenBucketThrottle):
+    # voting is for the authenticated users only, so every user has their own bucket
+    scope = 'votes'
+    rate_setting = 'VOTES_THROTTLE_RATE'
+    burst_setting = 'VOTES_THROTTLE_BURST'
+
+    def get_ident_key(self, request) -> str:
+        return str(request.user.pk)
+
+
+class AuthThrottle(TokenBucketThrottle):
+    # login and registration hash the passwords, their bucket is per client IP
+    scope = 'auth'
+    rate_setting = 'AUTH_THROTTLE_RATE'
+    burst_setting = 'AUTH_THROTTLE_BURST'
+
+    def get_ident_key(self, request) -> str:
+        return self.get_ident(request)
@@ -1,5 +1,3 @@
-import knox.views
-
 from django.urls import include, path
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import permissions, status
@@ -8,7 +6,7 @@ from rest_framework_nested import routers as nested_routers
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
-from api import views
+from api import async_views, views
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -27,18 +25,41 @@ logout_view = \
    swagger_auto_schema(
       method='post',
       responses={status.HTTP_204_NO_CONTENT: ''}
-   )(knox.views.LogoutView.as_view())
+   )(views.LogoutView.as_view())
 
 router = DefaultRouter()
 router.register(r'restaurants', views.RestaurantsViewSet, basename='restaurants')
+router.register(r'teams', views.TeamsViewSet, basename='teams')
 
 votes_router = nested_routers.NestedSimpleRouter(router, 'restaurants', lookup='restaurant')
 votes_router.register(r'votes', views.VotesViewSet, basename='votes')
 
+teams_router = nested_routers.NestedSimpleRouter(router, 'teams', lookup='team')
+teams_router.register(r'restaurants', views.RestaurantsViewSet, basename='team-restaurants')
+
+team_votes_router = nested_routers.NestedSimpleRouter(teams_router, 'restaurants', lookup='restaurant')
+team_votes_router.register(r'votes', views.VotesViewSet, basename='team-votes')
+
 urlpatterns = [
     path('', include(router.urls)),
     path('', include(votes_router.urls)),
+    path('', include(teams_router.urls)),
+    path('', include(team_votes_router.urls)),
+    path('teams/<int:team_pk>/votes/batch/', views.BatchVotesView.as_view(), name='team-votes-batch'),
+    path('teams/<int:team_pk>/votes/remaining/', views.RemainingVotesView.as_view(), name='team-votes-remaining'),
+    path('teams/<int:team_pk>/leaderboard/', views.LeaderboardView.as_view(), name='team-leaderboard'),
+    path('teams/<int:team_pk>/winners/simulate/', views.WinnersSimulationView.as_view(),
+         name='team-winners-simulate'),
+    path('teams/<int:team_pk>/winners/', views.WinnersListView.as_view(), name='team-winners-list'),
+    path('votes/batch/', views.BatchVotesView.as_view(), name='votes-batch'),
+    path('votes/remaining/', views.RemainingVotesView.as_view(), name='votes-remaining'),
+    path('leaderboard/', views.LeaderboardView.as_view(), name='leaderboard'),
+    path('winners/simulate/', views.WinnersSimulationView.as_view(), name='winners-simulate'),
     path('winners/', views.WinnersListView.as_view(), name='winners-list'),
+    path('async/restaurants/', async_views.restaurants_list, name='async-restaurants-list'),
+    path('async/restaurants/<str:restaurant_pk>/votes/', async_views.vote_create, name='async-votes-list'),
+    path('async/leaderboard/', async_views.leaderboard_list, name='async-leaderboard'),
+    path('async/winners/', async_views.winners_list, name='async-winners-list'),
     path('register/', views.RegisterView.as_view()),
     path('login/', views.LoginView.as_view()),
     path('logout/', logout_view),
@@ -1,33 +1,122 @@
+import collections
 import datetime
+import hashlib
+import itertools
+import json
 
 from constance import config
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
 from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from knox.models import AuthToken
+from knox.views import LogoutView as KnoxLogoutView
 from rest_framework import status, permissions
+from rest_framework.decorators import action
 from rest_framework.authtoken.serializers import AuthTokenSerializer
-from rest_framework.exceptions import ValidationError
-from rest_framework.generics import GenericAPIView, ListAPIView, get_object_or_404
+from rest_framework.exceptions import NotFound, ParseError, ValidationError
+from rest_framework.generics import GenericAPIView, ListAPIView
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 
-from api.utils import determine_vote_weight
-from base.models import Restaurant, Vote, WinnerRestaurant
-from api.serializers import (AuthResponseSerializer, RegisterUserSerializer,
-                             RestaurantSerializer, WinnerRestaurantSerializer)
+from api import restaurant_import
+from api.authentication import CachedTokenAuthentication
+from api.idempotency import IDEMPOTENCY_KEY_PARAMETER, idempotent
+from api.pagination import RestaurantCursorPagination, RestaurantSearchPagination
+from api.parsers import CSVStreamParser, NDJSONStreamParser
+from api.renderers import NDJSONRenderer
+from api.throttling import AuthThrottle, VotesThrottle
+from base import db_router, leaderboard, metrics, schedule, vote_buffer
+from base.exceptions import VotesLimitExceeded
+from base.models import Restaurant, RestaurantPeriodStats, RestaurantStats, Team, Vote, WinnerRestaurant
+from api.serializers import (AuthResponseSerializer, BatchVoteItemSerializer, LeaderboardEntrySerializer,
+                             RegisterUserSerializer, RemainingVotesSerializer, RestaurantImportReportSerializer,
+                             RestaurantSerializer, RestaurantStatsSerializer, TeamSerializer, VoteSerializer,
+                             WinnerRestaurantSerializer, WinnersSimulationResultSerializer,
+                             WinnersSimulationSerializer)
+
+
+class IsTeamMember(permissions.BasePermission):
+    message = 'You are not a member of the team'
+
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and (
+            request.user.is_staff or request.user.teams.filter(pk=view.get_team_id()).exists()
+        )
+
+
+class TeamScopeMixin:
+    # views of the routes nested under teams/<team_pk>/ work with the restaurants of the team,
+    # the other ones with the shared restaurants which have no team
+    team_lookup_kwarg = 'team_pk'
+
+    def get_team(self) -> Team:
+        if not hasattr(self, '_team'):
+            team_pk = self.kwargs.get(self.team_lookup_kwarg)
+            if team_pk is None:
+                self._team = Team.shared_pool()
+            else:
+                try:
+                    self._team = Team.objects.only('timezone', 'cutoff').get(pk=int(team_pk))
+                except (ValueError, Team.DoesNotExist):
+                    raise NotFound('Team was not found')
+        return self._team
+
+    def get_team_id(self) -> int | None:
+        return self.get_team().pk
+
+    def get_voting_date(self) -> datetime.date:
+        # the votes are counted for the current voting day of the team's timezone
+        return self.get_team().voting_date()
+
+    def get_permissions(self):
+        permission_instances = super().get_permissions()
+        if self.team_lookup_kwarg in self.kwargs:
+            permission_instances.append(IsTeamMember())
+        return permission_instances
+
+
+class ReplicaReadsMixin:
+    # the requests of the methods read from the replica, unless the user has written lately
+    replica_methods = permissions.SAFE_METHODS
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in self.replica_methods and db_router.has_replica() \
+                and not db_router.is_pinned(request.user):
+            self._replica_token = db_router.use_replica()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, '_replica_token', None):
+            db_router.reset(self._replica_token)
+            self._replica_token = None
+        return response
 
 
 class RegisterView(GenericAPIView):
     serializer_class = RegisterUserSerializer
+    throttle_classes = [AuthThrottle, ]
 
     @swagger_auto_schema(
         security=[],
         responses={
             status.HTTP_201_CREATED: AuthResponseSerializer,
             status.HTTP_400_BAD_REQUEST: 'Not all required fields were provided',
-        }
+            status.HTTP_409_CONFLICT: 'Request with the same Idempotency-Key is being processed',
+            status.HTTP_429_TOO_MANY_REQUESTS: 'Too many requests',
+        },
+        manual_parameters=[IDEMPOTENCY_KEY_PARAMETER]
     )
+    @idempotent
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -39,12 +128,14 @@ class RegisterView(GenericAPIView):
 class LoginView(GenericAPIView):
     permission_classes = [permissions.AllowAny, ]
     serializer_class = AuthTokenSerializer
+    throttle_classes = [AuthThrottle, ]
 
     @swagger_auto_schema(
         security=[],
         responses={
             status.HTTP_201_CREATED: AuthResponseSerializer,
             status.HTTP_400_BAD_REQUEST: 'Not all required fields were provided or credentials are invalid',
+            status.HTTP_429_TOO_MANY_REQUESTS: 'Too many requests',
         }
     )
     def post(self, request, *args, **kwargs):
@@ -55,57 +146,283 @@ class LoginView(GenericAPIView):
         return Response(AuthResponseSerializer({"token": auth_token}).data, status=status.HTTP_200_OK)
 
 
-@method_decorator(name='list', decorator=swagger_auto_schema(security=[]))
-class RestaurantsViewSet(ModelViewSet):
+class LogoutView(KnoxLogoutView):
+    authentication_classes = (CachedTokenAuthentication, )
+
+    def post(self, request, format=None):
+        # the digest is the primary key, which is cleared once the token is deleted
+        digest = request.auth.digest
+        response = super().post(request, format)
+        CachedTokenAuthentication.evict(digest)
+        return response
+
+
+@method_decorator(name='list', decorator=swagger_auto_schema(
+    security=[],
+    manual_parameters=[openapi.Parameter("fields",
+                                         openapi.IN_QUERY,
+                                         description="Comma separated fields to return, e.g. id,name",
+                                         type=openapi.TYPE_STRING
+                                         ),
+                       openapi.Parameter("q",
+                                         openapi.IN_QUERY,
+                                         description="Search by the name and description, typos are allowed. "
+                                                     "The best matches are returned without further pages",
+                                         type=openapi.TYPE_STRING
+                                         )]
+))
+class RestaurantsViewSet(ReplicaReadsMixin, TeamScopeMixin, ModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, ]
     queryset = Restaurant.objects.all()
     serializer_class = RestaurantSerializer
+    pagination_class = RestaurantCursorPagination
+
+    first_page_cache_timeout = 60 * 60
+    stats_periods = 12
+    max_search_query_length = 128
+
+    def get_fields(self) -> list[str] | None:
+        fields = self.request.query_params.get('fields')
+        if self.action != 'list' or not fields:
+            return None
+        model_fields = {field.name for field in Restaurant._meta.concrete_fields}
+        return [field for field in fields.split(',') if field in model_fields]
+
+    def get_search_query(self) -> str:
+        if self.action != 'list':
+            return ''
+        return self.request.query_params.get('q', '').strip()[:self.max_search_query_length]
 
+    def get_queryset(self):
+        queryset = self.queryset.filter(team_id=self.get_team_id())
+        search_query = self.get_search_query()
+        if search_query:
+            queryset = queryset.search(search_query)
+        fields = self.get_fields()
+        if fields:
+            return queryset.only(*fields, *self.pagination_class.ordering)
+        return queryset
 
-class VotesViewSet(GenericViewSet):
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, fields=self.get_fields(), **kwargs)
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'team_id': self.get_team_id()}
+
+    def list(self, request, *args, **kwargs):
+        if self.get_search_query():
+            self.pagination_class = RestaurantSearchPagination
+        if self.paginator.cursor_query_param in request.query_params:
+            return super().list(request, *args, **kwargs)
+
+        cache_key = Restaurant.objects.get_list_cache_key(request.build_absolute_uri())
+        data = cache.get(cache_key)
+        metrics.record_cache('restaurants', hit=data is not None)
+        if data is None:
+            with db_router.primary_reads():
+                data = super().list(request, *args, **kwargs).data
+                data = {**data, 'results': list(data['results'])}
+            cache.set(cache_key, data, self.first_page_cache_timeout)
+        return Response(data)
+
+    @swagger_auto_schema(
+        security=[],
+        responses={status.HTTP_200_OK: RestaurantStatsSerializer},
+        operation_description='Get the wins, win streaks and scores of the restaurant '
+                              'with the trends of the last weeks and months'
+    )
+    @action(detail=True, methods=['get'], permission_classes=[permissions.AllowAny])
+    def stats(self, request, *args, **kwargs):
+        restaurant = self.get_object()
+        stats = RestaurantStats.objects.filter(restaurant=restaurant).first() or RestaurantStats(restaurant=restaurant)
+
+        # the streak is broken by the first day another restaurant of the team won
+        last_date = WinnerRestaurant.objects.filter(team_id=restaurant.team_id).aggregate(date=Max('date'))['date']
+        if stats.last_win_date != last_date:
+            stats.current_win_streak = 0
+
+        periods = RestaurantPeriodStats.objects.filter(restaurant=restaurant).order_by('-start')
+        stats.weekly = reversed(periods.filter(period=RestaurantPeriodStats.WEEK)[:self.stats_periods])
+        stats.monthly = reversed(periods.filter(period=RestaurantPeriodStats.MONTH)[:self.stats_periods])
+        return Response(RestaurantStatsSerializer(stats).data)
+
+    @swagger_auto_schema(
+        request_body=openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_BINARY),
+        responses={
+            status.HTTP_200_OK: RestaurantImportReportSerializer,
+            status.HTTP_400_BAD_REQUEST: 'The file could not be read',
+            status.HTTP_415_UNSUPPORTED_MEDIA_TYPE: 'Content type is neither text/csv nor application/x-ndjson',
+        },
+        operation_description='Create or update the restaurants by their names from CSV with a header of the name, '
+                              'description and link columns or NDJSON objects of these fields. The file is streamed '
+                              'and imported in chunks, the invalid rows are skipped and reported by their lines'
+    )
+    @action(detail=False, methods=['post'], url_path='import', url_name='import',
+            permission_classes=[permissions.IsAdminUser], parser_classes=[CSVStreamParser, NDJSONStreamParser])
+    def import_restaurants(self, request, *args, **kwargs):
+        try:
+            report = restaurant_import.import_restaurants(request.data, team_id=self.get_team_id())
+        except restaurant_import.ImportFormatError as exc:
+            raise ParseError(f'{exc}. The chunks before it were imported')
+        return Response(RestaurantImportReportSerializer(report).data)
+
+    def perform_create(self, serializer):
+        serializer.save(team_id=self.get_team_id())
+        Restaurant.objects.invalidate_list_cache()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        Restaurant.objects.invalidate_list_cache()
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        Restaurant.objects.invalidate_list_cache()
+
+
+class VotesViewSet(TeamScopeMixin, GenericViewSet):
     permission_classes = [permissions.IsAuthenticated, ]
+    throttle_classes = [VotesThrottle, ]
 
     def get_serializer(self, *args, **kwargs):
         return
 
     @swagger_auto_schema(
         responses={
+            status.HTTP_201_CREATED: VoteSerializer,
             status.HTTP_400_BAD_REQUEST: 'Max votes per day exceeded',
-            status.HTTP_404_NOT_FOUND: 'Restaurant was not found'
+            status.HTTP_404_NOT_FOUND: 'Restaurant was not found',
+            status.HTTP_409_CONFLICT: 'Request with the same Idempotency-Key is being processed',
+            status.HTTP_429_TOO_MANY_REQUESTS: 'Too many votes requests',
         },
         operation_description='Left the vote for the restaurant',
         manual_parameters=[openapi.Parameter("restaurant_pk",
                                              openapi.IN_PATH,
                                              description="Restaurant id",
                                              type=openapi.TYPE_INTEGER
-                                             )]
+                                             ),
+                           IDEMPOTENCY_KEY_PARAMETER]
     )
+    @idempotent
     def create(self, request, *args, **kwargs):
-        restaurant = get_object_or_404(Restaurant, pk=kwargs.get('restaurant_pk'))
+        try:
+            restaurant_id = int(kwargs.get('restaurant_pk'))
+        except (TypeError, ValueError):
+            raise NotFound('Restaurant was not found')
 
-        user_vote, created = Vote.objects.get_or_create(
-            user=request.user,
-            restaurant=restaurant,
-            defaults={'score': config.VOTES_WEIGHTS[0], 'amount': 1}
-        )
+        cast_vote = vote_buffer.cast_vote if settings.VOTES_WRITE_BEHIND else Vote.objects.cast_vote
+        try:
+            vote = cast_vote(
+                user_id=request.user.id,
+                restaurant_id=restaurant_id,
+                max_votes=config.MAX_VOTES_PER_DAY,
+                votes_weights=config.VOTES_WEIGHTS,
+                date=self.get_voting_date(),
+                team=self.get_team()
+            )
+        except Restaurant.DoesNotExist:
+            raise NotFound('Restaurant was not found')
+        except VotesLimitExceeded:
+            raise ValidationError('Max votes per day exceeded')
+
+        return Response(data=VoteSerializer(vote).data, status=status.HTTP_201_CREATED)
+
+
+class BatchVotesView(TeamScopeMixin, GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated, ]
+    throttle_classes = [VotesThrottle, ]
+    serializer_class = BatchVoteItemSerializer
+
+    @swagger_auto_schema(
+        request_body=BatchVoteItemSerializer(many=True),
+        responses={
+            status.HTTP_201_CREATED: VoteSerializer(many=True),
+            status.HTTP_400_BAD_REQUEST: 'Max votes per day exceeded',
+            status.HTTP_404_NOT_FOUND: 'Restaurant was not found',
+            status.HTTP_409_CONFLICT: 'Request with the same Idempotency-Key is being processed',
+            status.HTTP_429_TOO_MANY_REQUESTS: 'Too many votes requests',
+        },
+        operation_description='Left several votes for the restaurants at once. '
+                              'Either all of the votes are accepted or none of them',
+        manual_parameters=[IDEMPOTENCY_KEY_PARAMETER]
+    )
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True, allow_empty=False)
+        serializer.is_valid(raise_exception=True)
 
-        if not created:
-            votes_amount = Vote.objects.votes_per_day(user_id=self.request.user.id)
-            if votes_amount >= config.MAX_VOTES_PER_DAY:
-                raise ValidationError('Max votes per day exceeded')
+        votes = collections.Counter()
+        for item in serializer.validated_data:
+            votes[item['restaurant_id']] += item['count']
 
-            user_vote.amount += 1
-            user_vote.score += determine_vote_weight(config.VOTES_WEIGHTS, user_vote.amount)
-            user_vote.save(update_fields=('score', 'amount'))
+        max_votes = config.MAX_VOTES_PER_DAY
+        if sum(votes.values()) > max_votes:
+            raise ValidationError('Max votes per day exceeded')
 
-        return Response(data={}, status=status.HTTP_201_CREATED)
+        cast_votes = vote_buffer.cast_votes if settings.VOTES_WRITE_BEHIND else Vote.objects.cast_votes
+        try:
+            cast = cast_votes(
+                user_id=request.user.id,
+                votes=dict(votes),
+                max_votes=max_votes,
+                votes_weights=config.VOTES_WEIGHTS,
+                date=self.get_voting_date(),
+                team=self.get_team()
+            )
+        except Restaurant.DoesNotExist:
+            raise NotFound('Restaurant was not found')
+        except VotesLimitExceeded:
+            raise ValidationError('Max votes per day exceeded')
+
+        return Response(data=VoteSerializer(cast, many=True).data, status=status.HTTP_201_CREATED)
+
+
+class RemainingVotesView(TeamScopeMixin, GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated, ]
+    serializer_class = RemainingVotesSerializer
+
+    @swagger_auto_schema(operation_description='Get the amount of votes the user has left for today')
+    def get(self, request, *args, **kwargs):
+        votes_per_day = vote_buffer.votes_per_day if settings.VOTES_WRITE_BEHIND else Vote.objects.votes_per_day
+        votes_used = votes_per_day(user_id=request.user.id, date=self.get_voting_date(), team=self.get_team())
+        max_votes = config.MAX_VOTES_PER_DAY
+
+        serializer = self.get_serializer({
+            'max_votes': max_votes,
+            'votes_used': votes_used,
+            'votes_remaining': max(max_votes - votes_used, 0),
+        })
+        return Response(serializer.data)
+
+
+class LeaderboardView(ReplicaReadsMixin, TeamScopeMixin, GenericAPIView):
+    permission_classes = [permissions.AllowAny, ]
+    serializer_class = LeaderboardEntrySerializer
+
+    @swagger_auto_schema(
+        security=[],
+        operation_description='Get the live standings of today ranked by score and then unique voters. '
+                              'Restaurants sharing the first rank would share the win',
+        responses={status.HTTP_200_OK: LeaderboardEntrySerializer(many=True)}
+    )
+    def get(self, request, *args, **kwargs):
+        entries = leaderboard.get_leaderboard(self.get_voting_date())
+        restaurants = Restaurant.objects.filter(team_id=self.get_team_id())\
+            .in_bulk([entry.restaurant_id for entry in entries])
+
+        serializer = self.get_serializer([
+            {**entry._asdict(), 'restaurant': restaurants[entry.restaurant_id]}
+            for entry in leaderboard.select(entries, restaurants)
+        ], many=True)
+        return Response(serializer.data)
 
 
 @method_decorator(name='get', decorator=swagger_auto_schema(
     security=[],
     operation_description='Get the list of the winning restaurants by date '
                           'passed as "date" query parameter.'
-                          'If "date" was not provided winners of the previous day will be returned by default',
+                          'If "date" was not provided winners of the previous day will be returned by default. '
+                          'Winners of the range of dates passed as "date_from" and/or "date_to" query parameters '
+                          'are streamed as JSON array or as NDJSON with "Accept: application/x-ndjson" header',
     responses={
         status.HTTP_400_BAD_REQUEST: 'Invalid date format'
     },
@@ -113,21 +430,186 @@ class VotesViewSet(GenericViewSet):
                                          openapi.IN_QUERY,
                                          description="Date in format %Y-%m-%d",
                                          type=openapi.TYPE_STRING
+                                         ),
+                       openapi.Parameter("date_from",
+                                         openapi.IN_QUERY,
+                                         description="First date of the range in format %Y-%m-%d",
+                                         type=openapi.TYPE_STRING
+                                         ),
+                       openapi.Parameter("date_to",
+                                         openapi.IN_QUERY,
+                                         description="Last date of the range in format %Y-%m-%d",
+                                         type=openapi.TYPE_STRING
                                          )]
 ))
-class WinnersListView(ListAPIView):
+class WinnersListView(ReplicaReadsMixin, TeamScopeMixin, ListAPIView):
     permission_classes = [permissions.AllowAny, ]
     serializer_class = WinnerRestaurantSerializer
-    queryset = WinnerRestaurant.objects.all()
+    queryset = WinnerRestaurant.objects.select_related('restaurant')
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
 
-    def filter_queryset(self, queryset):
+    stream_chunk_size = 2000
+    cache_timeout = 24 * 60 * 60
+    # winners of the past voting days never change, others may be determined yet
+    final_max_age = 365 * 24 * 60 * 60
+    max_age = 60
+
+    def get_filter_date(self) -> datetime.date:
         filter_date = self.request.query_params.get('date')
         if not filter_date:
-            filter_date = datetime.date.today() - datetime.timedelta(days=1)
+            return self.get_voting_date() - datetime.timedelta(days=1)
+        return self._parse_date(filter_date)
+
+    def get_filter_date_range(self) -> tuple[datetime.date, datetime.date] | None:
+        date_from = self.request.query_params.get('date_from')
+        date_to = self.request.query_params.get('date_to')
+        if not date_from and not date_to:
+            return None
+
+        date_from = self._parse_date(date_from) if date_from else datetime.date.min
+        date_to = self._parse_date(date_to) if date_to else self.get_voting_date()
+        if date_from > date_to:
+            raise ValidationError('"date_from" must not be later than "date_to"')
+        return date_from, date_to
+
+    def filter_queryset(self, queryset):
+        queryset = queryset.filter(team_id=self.get_team_id())
+        date_range = self.get_filter_date_range()
+        if date_range:
+            return queryset.filter(date__range=date_range).order_by('date', 'id')
+        return queryset.filter(date=self.get_filter_date())
+
+    def list(self, request, *args, **kwargs):
+        if self.get_filter_date_range():
+            return self.stream_list(self.filter_queryset(self.get_queryset()))
+
+        filter_date = self.get_filter_date()
+        cache_key = WinnerRestaurant.objects.get_list_cache_key(filter_date, self.get_team_id())
+
+        winners = cache.get(cache_key)
+        metrics.record_cache('winners', hit=winners is not None)
+        if winners is None:
+            with db_router.primary_reads():
+                serializer = self.get_serializer(self.filter_queryset(self.get_queryset()), many=True)
+                winners = self.build_cache_entry(serializer.data)
+            cache.set(cache_key, winners, self.cache_timeout)
+
+        response = get_conditional_response(
+            request, etag=winners['etag'], last_modified=winners['last_modified']
+        ) or Response(winners['data'])
+        return self.patch_response(response, winners, filter_date, self.get_team())
+
+    @staticmethod
+    def build_cache_entry(winners: list) -> dict:
+        data = [dict(winner) for winner in winners]
+        return {
+            'data': data,
+            'etag': quote_etag(hashlib.md5(json.dumps(data).encode()).hexdigest()),
+            'last_modified': int(timezone.now().timestamp()),
+        }
+
+    @classmethod
+    def patch_response(cls, response, winners: dict, filter_date: datetime.date, team: Team):
+        response.headers['ETag'] = winners['etag']
+        response.headers['Last-Modified'] = http_date(winners['last_modified'])
+        # winners of a team are for its members only, so they are never kept by the shared caches
+        if team.pk is None:
+            cache_control = {'public': True}
+        else:
+            cache_control = {'private': True}
+            patch_vary_headers(response, ['Authorization'])
+
+        # the winners of a date are determined at the team's cutoff which starts the voting day of that date,
+        # so they never change once the team's next voting day has started
+        if filter_date < team.voting_date():
+            patch_cache_control(response, **cache_control, max_age=cls.final_max_age, immutable=True)
         else:
-            try:
-                filter_date = datetime.datetime.strptime(filter_date, '%Y-%m-%d')
-            except ValueError:
-                raise ValidationError('Invalid date format')
+            patch_cache_control(response, **cache_control, max_age=cls.max_age)
+        return response
+
+    def stream_list(self, queryset):
+        # the response is streamed after the view returns, so the database is chosen beforehand
+        queryset = queryset.using(queryset.db)
+        serializer = self.get_serializer()
+        winners = (
+            serializer.to_representation(winner)
+            for winner in queryset.iterator(chunk_size=self.stream_chunk_size)
+        )
+
+        if self.request.accepted_renderer.format == NDJSONRenderer.format:
+            content = (NDJSONRenderer.render_line(winner) for winner in winners)
+            return StreamingHttpResponse(content, content_type=NDJSONRenderer.media_type)
+
+        content = itertools.chain(
+            '[',
+            ((',' if i else '') + json.dumps(winner, cls=JSONEncoder) for i, winner in enumerate(winners)),
+            ']'
+        )
+        return StreamingHttpResponse(content, content_type='application/json')
+
+    @staticmethod
+    def _parse_date(value: str) -> datetime.date:
+        try:
+            return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise ValidationError('Invalid date format')
+
+
+class TeamsViewSet(ModelViewSet):
+    serializer_class = TeamSerializer
+
+    def get_permissions(self):
+        # the members see their teams, the teams are managed by the admins
+        if self.action in ('list', 'retrieve'):
+            return [permissions.IsAuthenticated()]
+        return [permissions.IsAdminUser()]
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False) or self.request.user.is_staff:
+            return Team.objects.order_by('pk')
+        return self.request.user.teams.order_by('pk')
+
+    def perform_update(self, serializer):
+        cutoff = serializer.instance.timezone, serializer.instance.cutoff
+        team = serializer.save()
+        if (team.timezone, team.cutoff) != cutoff:
+            schedule.reschedule(team, timezone.now())
+
+
+class WinnersSimulationView(TeamScopeMixin, ReplicaReadsMixin, GenericAPIView):
+    permission_classes = [permissions.IsAdminUser, ]
+    serializer_class = WinnersSimulationSerializer
+    # the simulation only reads the votes
+    replica_methods = ('POST', )
+
+    @swagger_auto_schema(
+        responses={status.HTTP_200_OK: WinnersSimulationResultSerializer(many=True)},
+        operation_description='Re-score the stored votes of the range of dates with the candidate votes weights '
+                              'and compare the resulting winners with the actual ones of the shared pool or the team'
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        date_from, date_to = serializer.validated_data['date_from'], serializer.validated_data['date_to']
+
+        simulated = collections.defaultdict(list)
+        for date, restaurant_id, score, unique_voters in WinnerRestaurant.objects.simulate(
+                date_from, date_to, serializer.validated_data['votes_weights'], team_id=self.get_team_id()):
+            simulated[date].append({'restaurant_id': restaurant_id, 'score': score, 'unique_voters': unique_voters})
+
+        actual = collections.defaultdict(list)
+        for date, restaurant_id in WinnerRestaurant.objects\
+                .filter(team_id=self.get_team_id(), date__range=(date_from, date_to))\
+                .order_by('date', 'restaurant_id').values_list('date', 'restaurant_id'):
+            actual[date].append(restaurant_id)
 
-        return self.queryset.filter(date=filter_date)
+        results = []
+        for date in sorted(simulated.keys() | actual.keys()):
+            winners = simulated[date]
+            results.append({
+                'date': date,
+                'winners': winners,
+                'actual_winners': actual[date],
+                'changed': [winner['restaurant_id'] for winner in winners] != actual[date],
+            })
+        return Response(WinnersSimulationResultSerializer(results, many=True).data)
@@ -0,0 +1,47 @@
+import statistics
+import time
+from typing import Callable
+
+
+def percentile(values: list[float], percent: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def measure(request: Callable[[int], object], count: int) -> list[float]:
+    latencies = []
+    for num in range(count):
+        started = time.perf_counter()
+        request(num)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def summarize(latencies: list[float], elapsed: float) -> dict:
+    # latencies in seconds, reported in milliseconds
+    latencies = [latency * 1000 for latency in latencies]
+    return {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(statistics.mean(latencies), 2),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'max_ms': round(max(latencies), 2),
+    }
+
+
+def find_regressions(results: list[dict], baseline: list[dict], threshold: float,
+                     metrics: tuple[str, ...] = ('mean_ms', 'p99_ms')) -> list[str]:
+    baseline = {(result['size'], result['scenario']): result for result in baseline}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result['size'], result['scenario']))
+        if previous is None:
+            continue
+        for metric in metrics:
+            if result[metric] > previous[metric] * (1 + threshold):
+                regressions.append(
+                    f'{result["scenario"]} ({result["size"]}): {metric} {previous[metric]} -> {result[metric]}'
+                )
+    return regressions
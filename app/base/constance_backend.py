@@ -0,0 +1,62 @@
+import time
+
+from constance.backends.database import DatabaseBackend
+from django.conf import settings
+
+MISSING = object()
+
+
+class LocalCachedDatabaseBackend(DatabaseBackend):
+    # Values are kept in the process memory and dropped when the shared version key changes.
+    # The version key is checked at most once per CONSTANCE_LOCAL_CACHE_TIMEOUT seconds,
+    # which bounds the delay for a change to reach every worker.
+    version_key = 'version'
+
+    def __init__(self):
+        self._values = {}
+        self._version = None
+        self._checked_at = None
+        super().__init__()
+
+    def get(self, key):
+        self._refresh()
+        value = self._values.get(key, MISSING)
+        if value is MISSING:
+            value = self._values[key] = super().get(key)
+        return value
+
+    def set(self, key, value):
+        super().set(key, value)
+        self._values[key] = value
+        self._bump_version()
+
+    def clear(self, sender, instance, created, **kwargs):
+        super().clear(sender, instance, created, **kwargs)
+        self._values.pop(instance.key[len(self._prefix):], None)
+        self._bump_version()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < settings.CONSTANCE_LOCAL_CACHE_TIMEOUT:
+            return
+
+        # without a shared cache the values simply expire after the timeout
+        version = self._get_version() if self._cache else None
+        if version is None or version != self._version:
+            self._values = {}
+            self._version = version
+        self._checked_at = now
+
+    def _get_version(self):
+        key = self.add_prefix(self.version_key)
+        version = self._cache.get(key)
+        if version is None:
+            self._cache.add(key, time.time_ns(), timeout=None)
+            version = self._cache.get(key)
+        return version
+
+    def _bump_version(self):
+        # this process is already up to date, the new version makes the others refresh
+        if self._cache:
+            self._version = time.time_ns()
+            self._cache.set(self.add_prefix(self.version_key), self._version, timeout=None)
@@ -0,0 +1,79 @@
+import contextlib
+import contextvars
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from base.redis_client import get_async_redis, get_redis
+
+REPLICA_DB_ALIAS = 'replica'
+PIN_KEY = 'db_pin:{user_id}'
+
+# Set for the requests whose reads may be served by the replica, everything else including the writes,
+# Celery tasks and the reads of the users who have just written uses the primary
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+
+def has_replica() -> bool:
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def reads_from_replica() -> bool:
+    return _replica_reads.get()
+
+
+def use_replica() -> contextvars.Token:
+    return _replica_reads.set(True)
+
+
+def reset(token: contextvars.Token):
+    _replica_reads.reset(token)
+
+
+@contextlib.contextmanager
+def replica_reads():
+    token = use_replica()
+    try:
+        yield
+    finally:
+        reset(token)
+
+
+@contextlib.contextmanager
+def primary_reads():
+    # for the results cached for everyone, a lagging replica would keep them stale till the cache expires
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        reset(token)
+
+
+def pin(user_id: int):
+    # the user reads from the primary till the replica catches up with their writes
+    get_redis().set(PIN_KEY.format(user_id=user_id), 1, ex=settings.REPLICA_PIN_SECONDS)
+
+
+async def apin(user_id: int):
+    await get_async_redis().set(PIN_KEY.format(user_id=user_id), 1, ex=settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user) -> bool:
+    return user.is_authenticated and bool(get_redis().exists(PIN_KEY.format(user_id=user.id)))
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and has_replica():
+            return REPLICA_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # objects read from the replica are saved to the primary as well
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
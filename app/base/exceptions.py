@@ -0,0 +1,2 @@
+class VotesLimitExceeded(Exception):
+    pass
@@ -0,0 +1,121 @@
+import csv
+import datetime
+import io
+import random
+from typing import Iterator, NamedTuple
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from api.utils import determine_vote_weight
+from base import partitions
+from base.models import DailyRestaurantTally, Restaurant, Vote
+from base.tasks import determine_team_winner
+
+VOTE_COLUMNS = 'user_id, restaurant_id, date, amount, score'
+
+
+class DataSize(NamedTuple):
+    users: int
+    restaurants: int
+    days: int
+
+
+SIZES = {
+    'small': DataSize(users=100, restaurants=20, days=30),
+    'medium': DataSize(users=1000, restaurants=100, days=90),
+    'large': DataSize(users=10000, restaurants=500, days=180),
+}
+
+
+def create_users(prefix: str, count: int, password: str, batch_size: int) -> list[int]:
+    # hashing is slow on purpose, so all the users share the same hash
+    password = make_password(password)
+    User.objects.bulk_create(
+        (User(username=f'{prefix}-user-{num}', password=password) for num in range(count)),
+        batch_size=batch_size
+    )
+    return list(User.objects.filter(username__startswith=f'{prefix}-user-').values_list('pk', flat=True))
+
+
+def create_restaurants(prefix: str, count: int, batch_size: int) -> list[int]:
+    Restaurant.objects.bulk_create(
+        (Restaurant(name=f'{prefix}-restaurant-{num}', description=f'Generated restaurant #{num}')
+         for num in range(count)),
+        batch_size=batch_size
+    )
+    Restaurant.objects.invalidate_list_cache()
+    return list(Restaurant.objects.filter(name__startswith=f'{prefix}-restaurant-')
+                .order_by('pk').values_list('pk', flat=True))
+
+
+def generate_votes(user_ids: list[int], restaurant_ids: list[int], dates: list[datetime.date],
+                   max_votes: int, votes_weights: list[float], turnout: float = 0.8, skew: float = 1.1,
+                   seed: int = None) -> Iterator[tuple[int, int, datetime.date, int, float]]:
+    # popularity of the restaurants follows Zipf's law, so a few of them get most of the votes
+    rng = random.Random(seed)
+    popularity = [1 / rank ** skew for rank in range(1, len(restaurant_ids) + 1)]
+
+    for date in dates:
+        for user_id in user_ids:
+            if rng.random() >= turnout:
+                continue
+
+            amounts = {}
+            for restaurant_id in rng.choices(restaurant_ids, weights=popularity, k=rng.randint(1, max_votes)):
+                amounts[restaurant_id] = amounts.get(restaurant_id, 0) + 1
+
+            for restaurant_id, amount in amounts.items():
+                score = sum(determine_vote_weight(votes_weights, vote_num) for vote_num in range(1, amount + 1))
+                yield user_id, restaurant_id, date, amount, score
+
+
+def copy_votes(votes: Iterator[tuple], batch_size: int) -> int:
+    copied = 0
+    with connection.cursor() as cursor:
+        while True:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            rows = 0
+            for rows, vote in enumerate(votes, start=1):
+                writer.writerow(vote)
+                if rows == batch_size:
+                    break
+            if not rows:
+                return copied
+
+            buffer.seek(0)
+            cursor.copy_expert(f'COPY {Vote._meta.db_table} ({VOTE_COLUMNS}) FROM STDIN WITH (FORMAT csv)', buffer)
+            copied += rows
+
+
+def determine_results(dates: list[datetime.date]):
+    # winners of a day are dated the next day, the generated restaurants are in the shared pool
+    for date in dates:
+        DailyRestaurantTally.objects.rebuild(date)
+
+    for date in dates[:-1]:
+        determine_team_winner(date.isoformat())
+
+
+def generate(prefix: str, size: DataSize, max_votes: int, votes_weights: list[float], password: str = 'password',
+             turnout: float = 0.8, skew: float = 1.1, seed: int = None, batch_size: int = 10000) -> dict:
+    # votes end yesterday, whose winners are left for determine_winner, as right before it runs at midnight
+    today = datetime.date.today()
+    dates = [today - datetime.timedelta(days=days) for days in range(size.days, 0, -1)]
+
+    for month in sorted({partitions.month_start(date) for date in dates}):
+        partitions.create_partition(month)
+
+    with transaction.atomic():
+        user_ids = create_users(prefix, size.users, password, batch_size)
+        restaurant_ids = create_restaurants(prefix, size.restaurants, batch_size)
+        votes = copy_votes(
+            generate_votes(user_ids, restaurant_ids, dates, max_votes, votes_weights, turnout, skew, seed),
+            batch_size
+        )
+        determine_results(dates)
+
+    return {'users': len(user_ids), 'restaurants': len(restaurant_ids), 'days': len(dates), 'votes': votes}
+
@@ -0,0 +1,85 @@
+import datetime
+from typing import Container, Iterable, NamedTuple
+
+from base.redis_client import get_async_redis, get_redis
+
+SCORES_KEY = 'leaderboard:{date}:scores'
+VOTERS_KEY = 'leaderboard:{date}:voters'
+KEY_TTL = 2 * 24 * 60 * 60
+
+
+class LeaderboardEntry(NamedTuple):
+    rank: int
+    restaurant_id: int
+    score: float
+    unique_voters: int
+
+
+def record_vote(restaurant_id: int, weight: float, new_voter: bool, date: datetime.date):
+    scores_key, voters_key = SCORES_KEY.format(date=date), VOTERS_KEY.format(date=date)
+    pipeline = get_redis().pipeline()
+    pipeline.zincrby(scores_key, weight, restaurant_id)
+    if new_voter:
+        pipeline.zincrby(voters_key, 1, restaurant_id)
+    pipeline.expire(scores_key, KEY_TTL)
+    pipeline.expire(voters_key, KEY_TTL)
+    pipeline.execute()
+
+
+def get_leaderboard(date: datetime.date) -> list[LeaderboardEntry]:
+    pipeline = get_redis().pipeline(transaction=False)
+    pipeline.zrange(SCORES_KEY.format(date=date), 0, -1, withscores=True)
+    pipeline.zrange(VOTERS_KEY.format(date=date), 0, -1, withscores=True)
+    return _rank(*pipeline.execute())
+
+
+async def aget_leaderboard(date: datetime.date) -> list[LeaderboardEntry]:
+    pipeline = get_async_redis().pipeline(transaction=False)
+    pipeline.zrange(SCORES_KEY.format(date=date), 0, -1, withscores=True)
+    pipeline.zrange(VOTERS_KEY.format(date=date), 0, -1, withscores=True)
+    return _rank(*await pipeline.execute())
+
+
+def rebuild(results: Iterable[tuple[int, float, int]], date: datetime.date):
+    scores_key, voters_key = SCORES_KEY.format(date=date), VOTERS_KEY.format(date=date)
+    scores, voters = {}, {}
+    for restaurant_id, score, unique_voters in results:
+        scores[restaurant_id] = score
+        voters[restaurant_id] = unique_voters
+
+    pipeline = get_redis().pipeline()
+    pipeline.delete(scores_key, voters_key)
+    if scores:
+        pipeline.zadd(scores_key, scores)
+        pipeline.zadd(voters_key, voters)
+        pipeline.expire(scores_key, KEY_TTL)
+        pipeline.expire(voters_key, KEY_TTL)
+    pipeline.execute()
+
+
+def select(entries: list[LeaderboardEntry], restaurant_ids: Container[int]) -> list[LeaderboardEntry]:
+    # the standings among the given restaurants only, e.g. the ones of a team
+    return _ranked(
+        (entry.restaurant_id, entry.score, entry.unique_voters)
+        for entry in entries if entry.restaurant_id in restaurant_ids
+    )
+
+
+def _rank(scores: list[tuple[str, float]], voters: list[tuple[str, float]]) -> list[LeaderboardEntry]:
+    voters = dict(voters)
+    return _ranked(sorted(
+        ((int(restaurant_id), score, int(voters.get(restaurant_id, 0))) for restaurant_id, score in scores),
+        key=lambda result: (-result[1], -result[2], result[0])
+    ))
+
+
+def _ranked(results: Iterable[tuple[int, float, int]]) -> list[LeaderboardEntry]:
+    # restaurants with the same score and amount of voters share the rank, as they would share the win
+    leaderboard = []
+    for restaurant_id, score, unique_voters in results:
+        if leaderboard and (leaderboard[-1].score, leaderboard[-1].unique_voters) == (score, unique_voters):
+            rank = leaderboard[-1].rank
+        else:
+            rank = len(leaderboard) + 1
+        leaderboard.append(LeaderboardEntry(rank, restaurant_id, score, unique_voters))
+    return leaderboard
@@ -0,0 +1,42 @@
+import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from base import partitions
+
+
+def parse_month(value: str) -> datetime.date:
+    return datetime.datetime.strptime(value, '%Y-%m').date()
+
+
+class Command(BaseCommand):
+    help = 'Detaches the old monthly partitions of the votes to compressed files and drops them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, default=settings.VOTES_KEEP_MONTHS,
+                            help='Amount of the recent months to keep, including the current one')
+        parser.add_argument('--dir', type=Path, default=settings.VOTES_ARCHIVE_DIR,
+                            help='Directory of the archived partitions')
+        parser.add_argument('--restore', type=parse_month, action='append', dest='restore_months',
+                            help='Month in format %%Y-%%m to restore from the archive instead. Can be repeated')
+
+    def handle(self, *args, **options):
+        directory = Path(options['dir'])
+
+        if options['restore_months']:
+            for month in options['restore_months']:
+                try:
+                    path = partitions.restore_partition(month, directory)
+                except FileNotFoundError as error:
+                    raise CommandError(f'Archive for {month:%Y-%m} was not found: {error.filename}')
+                self.stdout.write(f'Votes of {month:%Y-%m} were restored from {path}')
+            return
+
+        directory.mkdir(parents=True, exist_ok=True)
+        oldest_month = partitions.add_months(partitions.month_start(datetime.date.today()), 1 - options['keep_months'])
+        for month in partitions.get_partitions():
+            if month < oldest_month:
+                path = partitions.archive_partition(month, directory)
+                self.stdout.write(f'Votes of {month:%Y-%m} were archived to {path}')
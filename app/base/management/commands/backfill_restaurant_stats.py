@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from base.models import RestaurantStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the restaurants statistics from the whole history of the daily tallies and winners'
+
+    def handle(self, *args, **options):
+        days = RestaurantStats.objects.backfill()
+        self.stdout.write(f'Restaurants statistics were rebuilt from {days} days')
@@ -0,0 +1,143 @@
+import datetime
+import json
+import math
+import platform
+import random
+import time
+from pathlib import Path
+
+import django
+from constance import config
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from knox.models import AuthToken
+
+from base import benchmark, generator
+from base.models import Restaurant, WinnerRestaurant
+from base.tasks import determine_team_winner
+
+SCENARIOS = ('vote_create', 'winners_list', 'restaurants_list', 'restaurants_search', 'determine_winner')
+
+
+class Command(BaseCommand):
+    help = 'Measures latency and throughput of the main endpoints and determine_winner on generated data ' \
+           'of several sizes. Every size is generated in a separate test database, the cache and Redis are shared'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', choices=generator.SIZES, default=['small', 'medium'])
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+        parser.add_argument('--requests', type=int, default=200, help='Amount of requests per endpoint')
+        parser.add_argument('--runs', type=int, default=5, help='Amount of determine_winner runs')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the generated data and requests')
+        parser.add_argument('--output', type=Path, help='JSON file for the results, printed by default')
+        parser.add_argument('--baseline', type=Path, help='JSON results of a previous release to compare with')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed relative increase of the mean and p99 latency over the baseline')
+
+    def handle(self, *args, **options):
+        baseline = json.loads(options['baseline'].read_text())['results'] if options['baseline'] else None
+
+        results = []
+        setup_test_environment()
+        try:
+            for size in options['sizes']:
+                results.extend(self._run_size(size, options))
+        finally:
+            teardown_test_environment()
+
+        report = json.dumps({
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'results': results,
+        }, indent=2)
+        if options['output']:
+            options['output'].write_text(report + '\n')
+        else:
+            self.stdout.write(report)
+
+        if baseline is not None:
+            regressions = benchmark.find_regressions(results, baseline, options['threshold'])
+            if regressions:
+                raise CommandError('Performance regressed:\n' + '\n'.join(regressions))
+            self.stderr.write('No regressions against the baseline')
+
+    def _run_size(self, size: str, options: dict) -> list[dict]:
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # counters and cached pages of the previous database must not leak into this one
+            cache.clear()
+            counts = generator.generate('benchmark', generator.SIZES[size], max_votes=config.MAX_VOTES_PER_DAY,
+                                        votes_weights=config.VOTES_WEIGHTS, seed=options['seed'])
+            self.stderr.write(f'{size}: {counts["votes"]} votes were generated')
+
+            results = []
+            for scenario in options['scenarios']:
+                rng = random.Random(options['seed'])
+                started = time.perf_counter()
+                latencies = getattr(self, f'_{scenario}')(rng, options)
+                summary = benchmark.summarize(latencies, time.perf_counter() - started)
+                results.append({'size': size, **counts, 'scenario': scenario, **summary})
+                self.stderr.write(f'{size}: {scenario} {summary["rps"]} rps, p99 {summary["p99_ms"]}ms')
+            return results
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    @staticmethod
+    def _check(response):
+        if response.status_code >= 400:
+            raise CommandError(f'{response.request["PATH_INFO"]} responded with {response.status_code}')
+
+    def _vote_create(self, rng: random.Random, options: dict) -> list[float]:
+        # every user votes up to the limit, so the requests are spread over the needed amount of users
+        max_votes = config.MAX_VOTES_PER_DAY
+        users = User.objects.filter(username__startswith='benchmark-user-')[:math.ceil(options['requests'] / max_votes)]
+        tokens = [AuthToken.objects.create(user)[1] for user in users]
+        restaurant_ids = list(Restaurant.objects.values_list('pk', flat=True))
+        client = Client()
+
+        def vote(num: int):
+            self._check(client.post(
+                reverse('votes-list', args=[rng.choice(restaurant_ids)]),
+                HTTP_AUTHORIZATION=f'Bearer {tokens[num // max_votes]}'
+            ))
+        return benchmark.measure(vote, options['requests'])
+
+    def _winners_list(self, rng: random.Random, options: dict) -> list[float]:
+        dates = list(WinnerRestaurant.objects.values_list('date', flat=True).distinct())
+        client = Client()
+        return benchmark.measure(
+            lambda num: self._check(client.get(reverse('winners-list'), {'date': rng.choice(dates)})),
+            options['requests']
+        )
+
+    def _restaurants_list(self, rng: random.Random, options: dict) -> list[float]:
+        client = Client()
+        return benchmark.measure(lambda num: self._check(client.get(reverse('restaurants-list'))), options['requests'])
+
+    def _restaurants_search(self, rng: random.Random, options: dict) -> list[float]:
+        # names of random restaurants with a typo, the repeated queries are served by the cached first pages
+        names = list(Restaurant.objects.values_list('name', flat=True))
+        client = Client()
+
+        def search(num: int):
+            name = rng.choice(names)
+            typo = rng.randrange(len(name))
+            self._check(client.get(reverse('restaurants-list'), {'q': name[:typo] + name[typo + 1:]}))
+        return benchmark.measure(search, options['requests'])
+
+    def _determine_winner(self, rng: random.Random, options: dict) -> list[float]:
+        # the winners of yesterday are left by the generator, every run is rolled back to repeat it.
+        # The generated restaurants are shared, so the subtask of the shared pool does all of the work
+        date = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+
+        def run(num: int):
+            with transaction.atomic():
+                determine_team_winner(date)
+                transaction.set_rollback(True)
+        return benchmark.measure(run, options['runs'])
@@ -0,0 +1,54 @@
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from base.benchmark import summarize
+
+
+class Command(BaseCommand):
+    help = 'Sends concurrent requests to a running server and reports throughput and latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Full URL of the endpoint, e.g. http://localhost:8000/api/async/leaderboard/')
+        parser.add_argument('--method', default='GET', choices=['GET', 'POST'])
+        parser.add_argument('--concurrency', type=int, default=32, help='Amount of requests sent at the same time')
+        parser.add_argument('--requests', type=int, default=1000, help='Total amount of requests')
+        parser.add_argument('--token', help='Auth token sent in the Authorization header')
+
+    def handle(self, *args, **options):
+        headers = {'Authorization': f'Bearer {options["token"]}'} if options['token'] else {}
+
+        def send(_) -> tuple[float, int]:
+            request = urllib.request.Request(options['url'], method=options['method'], headers=headers)
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                    code = response.status
+            except urllib.error.HTTPError as error:
+                code = error.code
+            return time.perf_counter() - started, code
+
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                results = list(executor.map(send, range(options['requests'])))
+        except urllib.error.URLError as error:
+            raise CommandError(f'Server is not reachable: {error.reason}')
+        elapsed = time.perf_counter() - started
+
+        summary = summarize([latency for latency, _ in results], elapsed)
+        codes = {}
+        for _, code in results:
+            codes[code] = codes.get(code, 0) + 1
+
+        self.stdout.write(f'Requests: {len(results)}, concurrency: {options["concurrency"]}, {elapsed:.2f}s')
+        self.stdout.write(f'Requests/sec: {summary["rps"]}')
+        self.stdout.write(
+            f'Latency ms: mean {summary["mean_ms"]}, p50 {summary["p50_ms"]}, '
+            f'p99 {summary["p99_ms"]}, max {summary["max_ms"]}'
+        )
+        self.stdout.write(f'Status codes: {dict(sorted(codes.items()))}')
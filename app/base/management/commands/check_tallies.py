@@ -0,0 +1,61 @@
+import datetime
+import math
+
+from django.core.management.base import BaseCommand, CommandError
+
+from base.models import DailyRestaurantTally, Team
+
+
+class Command(BaseCommand):
+    help = 'Compares the daily restaurant tallies with the full aggregation of the votes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=datetime.date.fromisoformat, action='append', dest='dates',
+                            help='Date in format %%Y-%%m-%%d, the current and the previous voting days of '
+                                 'the shared pool and the teams by default. Can be repeated')
+        parser.add_argument('--fix', action='store_true', help='Rebuild the tallies that do not match')
+
+    def handle(self, *args, **options):
+        dates = options['dates'] or sorted({
+            day for date in Team.voting_dates() for day in (date - datetime.timedelta(days=1), date)
+        })
+
+        mismatched_dates = []
+        for date in dates:
+            tallies = {
+                tally['restaurant_id']: tally
+                for tally in DailyRestaurantTally.objects.filter(date=date).values(
+                    'restaurant_id', 'score_sum', 'voter_count'
+                )
+            }
+            results = {
+                result['restaurant_id']: result
+                for result in DailyRestaurantTally.objects.aggregate_votes(date)
+            }
+
+            mismatches = [
+                restaurant_id for restaurant_id in sorted(tallies.keys() | results.keys())
+                if not self._matches(tallies.get(restaurant_id), results.get(restaurant_id))
+            ]
+            for restaurant_id in mismatches:
+                self.stdout.write(
+                    f'{date} restaurant {restaurant_id}: tally {tallies.get(restaurant_id)}, '
+                    f'votes {results.get(restaurant_id)}'
+                )
+
+            if mismatches:
+                mismatched_dates.append(date)
+                if options['fix']:
+                    DailyRestaurantTally.objects.rebuild(date)
+                    self.stdout.write(f'Tallies for {date} were rebuilt')
+
+        if mismatched_dates and not options['fix']:
+            raise CommandError(f'Tallies do not match the votes for {", ".join(map(str, mismatched_dates))}')
+
+        self.stdout.write('Tallies are consistent with the votes')
+
+    @staticmethod
+    def _matches(tally: dict | None, result: dict | None) -> bool:
+        if tally is None or result is None:
+            return False
+        return math.isclose(tally['score_sum'], result['score_sum']) and tally['voter_count'] == result['voter_count']
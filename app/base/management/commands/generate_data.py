@@ -0,0 +1,51 @@
+import time
+
+from constance import config
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from base import generator
+
+
+class Command(BaseCommand):
+    help = 'Generates users, restaurants and votes with skewed popularity for the load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', choices=generator.SIZES, default='small',
+                            help='Preset of the amounts of users, restaurants and days')
+        parser.add_argument('--users', type=int, help='Amount of users, overrides the preset')
+        parser.add_argument('--restaurants', type=int, help='Amount of restaurants, overrides the preset')
+        parser.add_argument('--days', type=int, help='Amount of days of votes up to yesterday, overrides the preset')
+        parser.add_argument('--prefix', default='generated', help='Prefix of the usernames and restaurants names')
+        parser.add_argument('--password', default='password', help='Password of the generated users')
+        parser.add_argument('--turnout', type=float, default=0.8, help='Share of the users voting every day')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Exponent of the Zipf distribution of the restaurants popularity')
+        parser.add_argument('--seed', type=int, help='Seed of the random generator to reproduce the data')
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=f'{options["prefix"]}-user-').exists():
+            raise CommandError(f'Data with prefix "{options["prefix"]}" was already generated')
+
+        size = generator.SIZES[options['size']]
+        size = size._replace(**{
+            field: options[field] for field in size._fields if options[field] is not None
+        })
+
+        started = time.perf_counter()
+        counts = generator.generate(
+            options['prefix'],
+            size,
+            max_votes=config.MAX_VOTES_PER_DAY,
+            votes_weights=config.VOTES_WEIGHTS,
+            password=options['password'],
+            turnout=options['turnout'],
+            skew=options['skew'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(
+            f'Generated {counts["users"]} users, {counts["restaurants"]} restaurants and {counts["votes"]} votes '
+            f'for {counts["days"]} days in {time.perf_counter() - started:.1f}s'
+        )
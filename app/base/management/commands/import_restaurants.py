@@ -0,0 +1,46 @@
+import sys
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import restaurant_import
+from base.models import Team
+
+
+class Command(BaseCommand):
+    help = 'Creates or updates the restaurants by their names from CSV with a header of the name, description ' \
+           'and link columns or NDJSON objects of these fields. The file is streamed and imported in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the file, - for the standard input')
+        parser.add_argument('--format', choices=restaurant_import.FORMATS,
+                            help='Format of the file, by its extension by default')
+        parser.add_argument('--team', type=int, help='Id of the team of the restaurants, the shared pool by default')
+        parser.add_argument('--chunk-size', type=int, default=restaurant_import.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or Path(options['path']).suffix.lstrip('.').lower()
+        if file_format not in restaurant_import.FORMATS:
+            raise CommandError('Format of the file is unknown, pass --format')
+        if options['team'] is not None and not Team.objects.filter(pk=options['team']).exists():
+            raise CommandError(f'Team {options["team"]} does not exist')
+
+        started = time.perf_counter()
+        file = sys.stdin.buffer if options['path'] == '-' else open(options['path'], 'rb')
+        try:
+            report = restaurant_import.import_restaurants(
+                restaurant_import.READERS[file_format](file), team_id=options['team'], chunk_size=options['chunk_size']
+            )
+        except restaurant_import.ImportFormatError as exc:
+            raise CommandError(f'{exc}. The chunks before it were imported')
+        finally:
+            if file is not sys.stdin.buffer:
+                file.close()
+
+        for error in report['errors']:
+            self.stderr.write(f'Line {error["line"]}: {error["errors"]}')
+        self.stdout.write(
+            f'Created {report["created"]}, updated {report["updated"]} and left {report["unchanged"]} restaurants '
+            f'unchanged, {len(report["errors"])} rows were invalid, in {time.perf_counter() - started:.1f}s'
+        )
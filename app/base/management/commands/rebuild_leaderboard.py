@@ -0,0 +1,27 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from base import leaderboard, vote_buffer
+from base.models import DailyRestaurantTally, Team
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the live leaderboards of the voting days from the daily restaurant tallies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=datetime.date.fromisoformat, default=None,
+                            help='Date in format %%Y-%%m-%%d, the current voting days of the shared pool '
+                                 'and the teams by default')
+
+    def handle(self, *args, **options):
+        for date in [options['date']] if options['date'] else Team.voting_dates():
+            if settings.VOTES_WRITE_BEHIND:
+                vote_buffer.flush(date)
+
+            results = DailyRestaurantTally.objects.filter(date=date)\
+                .values_list('restaurant_id', 'score_sum', 'voter_count')
+            leaderboard.rebuild(results, date)
+
+            self.stdout.write(f'Leaderboard for {date} was rebuilt')
@@ -0,0 +1,153 @@
+import atexit
+import functools
+import logging
+import os
+import re
+import threading
+import time
+from typing import NamedTuple
+
+import redis
+from django.conf import settings
+
+from base.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = 'metrics'
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Metric(NamedTuple):
+    name: str
+    kind: str
+    help: str
+    buckets: tuple = ()
+
+
+METRICS = {metric.name: metric for metric in [
+    Metric('http_requests_total', 'counter', 'Requests by route, method and status'),
+    Metric('http_request_duration_seconds', 'histogram', 'Request latency by route', DURATION_BUCKETS),
+    Metric('http_request_db_queries', 'histogram', 'Database queries per request by route', QUERIES_BUCKETS),
+    Metric('http_request_db_duration_seconds', 'histogram', 'Database time per request by route', DURATION_BUCKETS),
+    Metric('cache_requests_total', 'counter', 'Cache lookups by cache and result'),
+    Metric('celery_tasks_total', 'counter', 'Finished tasks by task and state'),
+    Metric('celery_task_duration_seconds', 'histogram', 'Task run time by task', DURATION_BUCKETS),
+    Metric('celery_task_rows_total', 'counter', 'Rows processed by the tasks'),
+]}
+
+# Samples are summed up in the process memory and added to a Redis hash by a background thread once per
+# METRICS_FLUSH_INTERVAL, so the web and Celery worker processes report the same totals and requests don't wait
+# for Redis
+_samples = {}
+_lock = threading.Lock()
+_flusher_pid = None
+
+
+# names of the samples are built once per set of labels, it keeps the recording cheap on the hot paths
+@functools.lru_cache(maxsize=1024)
+def _sample(name: str, labels: tuple[tuple[str, object], ...]) -> str:
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+@functools.lru_cache(maxsize=1024)
+def _histogram_samples(name: str, labels: tuple[tuple[str, object], ...]) -> tuple[tuple, str, str]:
+    buckets = tuple(
+        (_sample(f'{name}_bucket', labels + (('le', bucket), )), bucket)
+        for bucket in (*METRICS[name].buckets, '+Inf')
+    )
+    return buckets, _sample(f'{name}_sum', labels), _sample(f'{name}_count', labels)
+
+
+def inc(name: str, value: float = 1, **labels):
+    sample = _sample(name, tuple(labels.items()))
+    with _lock:
+        _samples[sample] = _samples.get(sample, 0) + value
+    _start_flusher()
+
+
+def observe(name: str, value: float, **labels):
+    buckets, sum_sample, count_sample = _histogram_samples(name, tuple(labels.items()))
+    with _lock:
+        for sample, bucket in buckets:
+            _samples[sample] = _samples.get(sample, 0) + (bucket == '+Inf' or value <= bucket)
+        _samples[sum_sample] = _samples.get(sum_sample, 0) + value
+        _samples[count_sample] = _samples.get(count_sample, 0) + 1
+    _start_flusher()
+
+
+def record_cache(cache: str, hit: bool):
+    inc('cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+def flush():
+    global _samples
+    with _lock:
+        samples, _samples = _samples, {}
+    if not samples:
+        return
+
+    pipeline = get_redis().pipeline(transaction=False)
+    for sample, value in samples.items():
+        pipeline.hincrbyfloat(METRICS_KEY, sample, value)
+    try:
+        pipeline.execute()
+    except redis.RedisError:
+        # the samples are kept for the next flush, metrics must never fail a request
+        logger.warning('Metrics could not be flushed', exc_info=True)
+        with _lock:
+            for sample, value in samples.items():
+                _samples[sample] = _samples.get(sample, 0) + value
+
+
+def _start_flusher():
+    # started once per process, the forked workers start their own
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_periodically, name='metrics-flusher', daemon=True).start()
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        flush()
+
+
+def _reset_in_child():
+    # the samples of the parent are flushed by the parent, the lock may have been held by its other thread
+    global _samples, _lock
+    _samples, _lock = {}, threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_in_child)
+atexit.register(flush)
+
+
+def render() -> str:
+    flush()
+    families = {name: [] for name in METRICS}
+    for sample, value in get_redis().hgetall(METRICS_KEY).items():
+        name = sample.split('{', 1)[0]
+        family = re.sub(r'_(bucket|sum|count)$', '', name) if name not in METRICS else name
+        if family in families:
+            families[family].append((sample, value))
+
+    lines = []
+    for name, samples in families.items():
+        metric = METRICS[name]
+        lines.append(f'# HELP {name} {metric.help}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        lines.extend(f'{sample} {value}' for sample, value in sorted(samples, key=_sample_order))
+    return '\n'.join(lines) + '\n'
+
+
+def _sample_order(sample: tuple[str, str]) -> tuple:
+    # buckets of a histogram go in the ascending order of their bounds
+    name, labels = sample[0].split('{', 1) if '{' in sample[0] else (sample[0], '')
+    bound = re.search(r'le="([^"]+)"', labels)
+    return re.sub(r',?le="[^"]+"', '', labels), name, float(bound.group(1)) if bound else 0
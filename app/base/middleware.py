@@ -0,0 +1,120 @@
+import contextvars
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from rest_framework.permissions import SAFE_METHODS
+
+from base import db_router, metrics
+
+# The recorder of the current request. Async views run their queries in a sync thread with its own connections,
+# the context is copied there, so the queries are counted by a wrapper installed on every connection.
+_queries_recorder = contextvars.ContextVar('queries_recorder', default=None)
+
+
+class QueriesRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = _queries_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class MetricsMiddleware:
+    # records the latency, database queries and time of every request by the name of its route
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        queries = QueriesRecorder()
+        token = _queries_recorder.set(queries)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _queries_recorder.reset(token)
+        self._record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request):
+        queries = QueriesRecorder()
+        token = _queries_recorder.set(queries)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _queries_recorder.reset(token)
+        self._record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    @staticmethod
+    def _record(request, response, duration: float, queries: QueriesRecorder):
+        route = request.resolver_match.view_name if request.resolver_match else 'unmatched'
+        metrics.inc('http_requests_total', route=route, method=request.method, status=response.status_code)
+        metrics.observe('http_request_duration_seconds', duration, route=route, method=request.method)
+        metrics.observe('http_request_db_queries', queries.count, route=route)
+        metrics.observe('http_request_db_duration_seconds', queries.duration, route=route)
+
+
+class ReadYourWritesMiddleware:
+    # pins the users who have written to the primary, so their next reads don't miss their writes on the replica
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not db_router.has_replica():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        response = self.get_response(request)
+        if self._has_written(request, response):
+            db_router.pin(request.user.id)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self._has_written(request, response):
+            await db_router.apin(request.user.id)
+        return response
+
+    @staticmethod
+    def _has_written(request, response) -> bool:
+        # the user is set by the token authentication of the views, failed requests are checked first,
+        # so the session user isn't loaded in the async context
+        return request.method not in SAFE_METHODS and response.status_code < 400 \
+            and hasattr(request, 'user') and request.user.is_authenticated
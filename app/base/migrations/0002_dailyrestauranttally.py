@@ -0,0 +1,36 @@
+# Generated by Django 4.2 on 2026-10-18 09:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRestaurantTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('score_sum', models.FloatField(default=0)),
+                ('voter_count', models.IntegerField(default=0)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='base.restaurant')),
+            ],
+            options={
+                'unique_together': {('date', 'restaurant')},
+            },
+        ),
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO base_dailyrestauranttally (date, restaurant_id, score_sum, voter_count)
+                SELECT date, restaurant_id, SUM(score), COUNT(user_id)
+                FROM base_vote
+                GROUP BY date, restaurant_id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
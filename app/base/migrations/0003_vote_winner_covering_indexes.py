@@ -0,0 +1,36 @@
+# Generated by Django 4.2 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0002_dailyrestauranttally'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vote',
+            name='date',
+            field=models.DateField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='winnerrestaurant',
+            name='date',
+            field=models.DateField(auto_now_add=True),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['user', 'date'], include=('amount',), name='base_vote_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['date', 'restaurant'], include=('user', 'amount', 'score'),
+                               name='base_vote_date_restaurant_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='winnerrestaurant',
+            index=models.Index(fields=['date'], include=('restaurant',), name='base_winner_date_idx'),
+        ),
+    ]
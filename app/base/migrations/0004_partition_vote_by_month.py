@@ -0,0 +1,101 @@
+from django.db import migrations
+
+# Primary and unique keys of a partitioned table must contain the partition key, so the primary key becomes (id, date).
+# Identity columns are not supported by partitioned tables, the id is generated from an owned sequence instead.
+CONSTRAINTS_SQL = """
+    ALTER TABLE base_vote ADD CONSTRAINT base_vote_user_id_restaurant_id_date_b439c413_uniq
+        UNIQUE (user_id, restaurant_id, date);
+    ALTER TABLE base_vote ADD CONSTRAINT base_vote_restaurant_id_ce8617cd_fk_base_restaurant_id
+        FOREIGN KEY (restaurant_id) REFERENCES base_restaurant (id) DEFERRABLE INITIALLY DEFERRED;
+    ALTER TABLE base_vote ADD CONSTRAINT base_vote_user_id_36b63175_fk_auth_user_id
+        FOREIGN KEY (user_id) REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED;
+    CREATE INDEX base_vote_restaurant_id_ce8617cd ON base_vote (restaurant_id);
+    CREATE INDEX base_vote_user_id_36b63175 ON base_vote (user_id);
+    CREATE INDEX base_vote_user_date_idx ON base_vote (user_id, date) INCLUDE (amount);
+    CREATE INDEX base_vote_date_restaurant_idx ON base_vote (date, restaurant_id) INCLUDE (user_id, amount, score);
+"""
+
+PARTITION_SQL = f"""
+    ALTER TABLE base_vote RENAME TO base_vote_unpartitioned;
+
+    CREATE TABLE base_vote (
+        id bigint NOT NULL,
+        score double precision NOT NULL,
+        amount integer NOT NULL,
+        date date NOT NULL,
+        restaurant_id bigint NOT NULL,
+        user_id integer NULL
+    ) PARTITION BY RANGE (date);
+
+    CREATE TABLE base_vote_default PARTITION OF base_vote DEFAULT;
+
+    -- monthly partitions from the first voted month up to three months ahead
+    DO $$
+    DECLARE
+        month date;
+    BEGIN
+        FOR month IN
+            SELECT generate_series(
+                LEAST(
+                    date_trunc('month', (SELECT MIN(date) FROM base_vote_unpartitioned)),
+                    date_trunc('month', now())
+                ),
+                date_trunc('month', now()) + interval '3 months',
+                interval '1 month'
+            )
+        LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF base_vote FOR VALUES FROM (%L) TO (%L)',
+                'base_vote_' || to_char(month, '"y"YYYY"m"MM'), month, month + interval '1 month'
+            );
+        END LOOP;
+    END $$;
+
+    INSERT INTO base_vote (id, score, amount, date, restaurant_id, user_id)
+    SELECT id, score, amount, date, restaurant_id, user_id
+    FROM base_vote_unpartitioned;
+
+    DROP TABLE base_vote_unpartitioned;
+
+    CREATE SEQUENCE base_vote_id_seq OWNED BY base_vote.id;
+    SELECT setval('base_vote_id_seq', COALESCE(MAX(id), 0) + 1, false) FROM base_vote;
+    ALTER TABLE base_vote ALTER COLUMN id SET DEFAULT nextval('base_vote_id_seq');
+
+    ALTER TABLE base_vote ADD CONSTRAINT base_vote_pkey PRIMARY KEY (id, date);
+    {CONSTRAINTS_SQL}
+"""
+
+UNPARTITION_SQL = f"""
+    ALTER TABLE base_vote RENAME TO base_vote_partitioned;
+    ALTER SEQUENCE base_vote_id_seq RENAME TO base_vote_partitioned_id_seq;
+
+    CREATE TABLE base_vote (
+        id bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY,
+        score double precision NOT NULL,
+        amount integer NOT NULL,
+        date date NOT NULL,
+        restaurant_id bigint NOT NULL,
+        user_id integer NULL
+    );
+
+    INSERT INTO base_vote (id, score, amount, date, restaurant_id, user_id)
+    SELECT id, score, amount, date, restaurant_id, user_id
+    FROM base_vote_partitioned;
+
+    DROP TABLE base_vote_partitioned;
+
+    ALTER TABLE base_vote ADD CONSTRAINT base_vote_pkey PRIMARY KEY (id);
+    SELECT setval(pg_get_serial_sequence('base_vote', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM base_vote;
+    {CONSTRAINTS_SQL}
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0003_vote_winner_covering_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=PARTITION_SQL, reverse_sql=UNPARTITION_SQL),
+    ]
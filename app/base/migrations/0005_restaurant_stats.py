@@ -0,0 +1,44 @@
+# Generated by Django 4.2 on 2026-10-18 10:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0004_partition_vote_by_month'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestaurantStats',
+            fields=[
+                ('restaurant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='base.restaurant')),
+                ('total_wins', models.IntegerField(default=0)),
+                ('current_win_streak', models.IntegerField(default=0)),
+                ('longest_win_streak', models.IntegerField(default=0)),
+                ('last_win_date', models.DateField(null=True)),
+                ('voted_days', models.IntegerField(default=0)),
+                ('total_score', models.FloatField(default=0)),
+                ('total_voters', models.IntegerField(default=0)),
+                ('rolled_up_date', models.DateField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RestaurantPeriodStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month')], max_length=8)),
+                ('start', models.DateField()),
+                ('score_sum', models.FloatField(default=0)),
+                ('voter_count', models.IntegerField(default=0)),
+                ('voted_days', models.IntegerField(default=0)),
+                ('wins', models.IntegerField(default=0)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='base.restaurant')),
+            ],
+            options={
+                'unique_together': {('restaurant', 'period', 'start')},
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2 on 2026-10-18 10:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('base', '0005_restaurant_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Team',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128, unique=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('members', models.ManyToManyField(blank=True, related_name='teams', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='team',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='restaurants', to='base.team'),
+        ),
+        migrations.AlterField(
+            model_name='restaurant',
+            name='name',
+            field=models.CharField(max_length=128),
+        ),
+        migrations.AddConstraint(
+            model_name='restaurant',
+            constraint=models.UniqueConstraint(fields=('team', 'name'), name='base_restaurant_team_name_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='restaurant',
+            constraint=models.UniqueConstraint(condition=models.Q(('team', None)), fields=('name',), name='base_restaurant_name_uniq'),
+        ),
+        migrations.AddField(
+            model_name='winnerrestaurant',
+            name='team',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='base.team'),
+        ),
+        migrations.RemoveIndex(
+            model_name='winnerrestaurant',
+            name='base_winner_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='winnerrestaurant',
+            index=models.Index(fields=['date', 'team'], include=('restaurant',), name='base_winner_date_team_idx'),
+        ),
+    ]
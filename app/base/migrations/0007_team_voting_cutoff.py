@@ -0,0 +1,30 @@
+# Generated by Django 4.2 on 2026-10-18 10:32
+
+import base.utils
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0006_teams'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='team',
+            name='cutoff',
+            field=models.TimeField(default=datetime.time(0, 0)),
+        ),
+        migrations.AddField(
+            model_name='team',
+            name='timezone',
+            field=models.CharField(default='UTC', max_length=64, validators=[base.utils.validate_timezone]),
+        ),
+        migrations.AlterField(
+            model_name='winnerrestaurant',
+            name='date',
+            field=models.DateField(default=datetime.date.today),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2 on 2026-10-18 10:43
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class PostgresOnlyMixin:
+    # the indexes are skipped where RestaurantQuerySet.search falls back to substrings
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class PostgresTrigramExtension(PostgresOnlyMixin, TrigramExtension):
+    pass
+
+
+class PostgresAddIndex(PostgresOnlyMixin, migrations.AddIndex):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0007_team_voting_cutoff'),
+    ]
+
+    operations = [
+        PostgresTrigramExtension(),
+        PostgresAddIndex(
+            model_name='restaurant',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('name', config='english', weight='A'), '||', django.contrib.postgres.search.SearchVector('description', config='english', weight='B'), django.contrib.postgres.search.SearchConfig('english')), name='base_restaurant_search_idx'),
+        ),
+        PostgresAddIndex(
+            model_name='restaurant',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass('name', name='gin_trgm_ops'), name='base_restaurant_name_trgm_idx'),
+        ),
+        PostgresAddIndex(
+            model_name='restaurant',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass('description', name='gin_trgm_ops'), name='base_restaurant_desc_trgm_idx'),
+        ),
+    ]
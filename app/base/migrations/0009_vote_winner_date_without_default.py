@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-18 11:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0008_restaurant_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vote',
+            name='date',
+            field=models.DateField(),
+        ),
+        migrations.AlterField(
+            model_name='winnerrestaurant',
+            name='date',
+            field=models.DateField(),
+        ),
+    ]
@@ -1,22 +1,266 @@
 import datetime
+import hashlib
+import itertools
+import logging
+import time
+from typing import Iterable
 
+import redis
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Sum
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
 
+from api.utils import determine_vote_weight
+from base import leaderboard, metrics
+from base.exceptions import VotesLimitExceeded
+from base.utils import seconds_until_voting_day_end, validate_timezone, voting_date
 
-class Restaurant(models.Model):
+logger = logging.getLogger(__name__)
+
+
+# The full-text search matches the words by their stems, the trigrams of the name and description match the typos.
+# The vector is built the same way by the query and its GIN index
+SEARCH_CONFIG = 'english'
+
+
+def restaurant_search_vector() -> SearchVector:
+    return SearchVector('name', weight='A', config=SEARCH_CONFIG) + \
+        SearchVector('description', weight='B', config=SEARCH_CONFIG)
+
+
+class RestaurantQuerySet(models.QuerySet):
+    def search(self, query: str) -> 'RestaurantQuerySet':
+        # best matches go first, each condition is served by its GIN index
+        if connection.vendor != 'postgresql':
+            # other databases match a substring, the matches by the name go first
+            return self.filter(Q(name__icontains=query) | Q(description__icontains=query)).annotate(
+                rank=Case(When(name__icontains=query, then=Value(1.0)), default=Value(0.0))
+            ).order_by('-rank', 'name', 'id')
+
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        return self.alias(search=restaurant_search_vector()).annotate(
+            rank=SearchRank(F('search'), search_query)
+            + Coalesce(TrigramWordSimilarity(query, 'name'), 0.0)
+            + Coalesce(TrigramWordSimilarity(query, 'description'), 0.0) / 2,
+        ).filter(
+            Q(search=search_query) | Q(name__trigram_word_similar=query) | Q(description__trigram_word_similar=query)
+        ).order_by('-rank', 'id')
+
+
+class RestaurantManager(models.Manager.from_queryset(RestaurantQuerySet)):
+    list_cache_version_key = 'restaurants:version'
+    list_cache_key = 'restaurants:{version}:{url_hash}'
+
+    def get_list_cache_version(self) -> int:
+        return cache.get_or_set(self.list_cache_version_key, time.time_ns, timeout=None)
+
+    async def aget_list_cache_version(self) -> int:
+        return await cache.aget_or_set(self.list_cache_version_key, time.time_ns, timeout=None)
+
+    def get_list_cache_key(self, url: str) -> str:
+        version = self.get_list_cache_version()
+        return self.list_cache_key.format(version=version, url_hash=hashlib.md5(url.encode()).hexdigest())
+
+    async def aget_list_cache_key(self, url: str) -> str:
+        version = await self.aget_list_cache_version()
+        return self.list_cache_key.format(version=version, url_hash=hashlib.md5(url.encode()).hexdigest())
+
+    def invalidate_list_cache(self):
+        cache.set(self.list_cache_version_key, time.time_ns(), timeout=None)
+
+
+class Team(models.Model):
     name = models.CharField(max_length=128, unique=True)
+    members = models.ManyToManyField(User, related_name='teams', blank=True)
+    # the voting day of the team ends at the cutoff of its local time, then its winners are determined
+    timezone = models.CharField(max_length=64, default='UTC', validators=[validate_timezone])
+    cutoff = models.TimeField(default=datetime.time.min)
+    created = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def shared_pool(cls) -> 'Team':
+        # stands for the restaurants without a team, never saved
+        return cls(timezone=settings.VOTING_TIMEZONE, cutoff=datetime.time.fromisoformat(settings.VOTING_CUTOFF))
+
+    @classmethod
+    def voting_dates(cls) -> list[datetime.date]:
+        # the current voting days of the shared pool and of every team, they differ across the timezones
+        teams = [cls.shared_pool(), *cls.objects.only('timezone', 'cutoff')]
+        return sorted({team.voting_date() for team in teams})
+
+    def voting_date(self, now: datetime.datetime = None) -> datetime.date:
+        return voting_date(self.timezone, self.cutoff, now)
+
+    def seconds_until_voting_day_end(self, date: datetime.date, now: datetime.datetime = None) -> int:
+        return seconds_until_voting_day_end(self.timezone, self.cutoff, date, now)
+
+
+class Restaurant(models.Model):
+    # restaurants without a team make up the shared pool
+    team = models.ForeignKey(Team, null=True, blank=True, on_delete=models.CASCADE, related_name='restaurants')
+    name = models.CharField(max_length=128)
     description = models.TextField(null=True, blank=True)
     link = models.URLField(null=True, blank=True)
     created = models.DateTimeField(auto_now_add=True)
 
+    objects = RestaurantManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['team', 'name'], name='base_restaurant_team_name_uniq'),
+            models.UniqueConstraint(fields=['name'], condition=models.Q(team=None), name='base_restaurant_name_uniq'),
+        ]
+        indexes = [
+            GinIndex(restaurant_search_vector(), name='base_restaurant_search_idx'),
+            GinIndex(OpClass('name', name='gin_trgm_ops'), name='base_restaurant_name_trgm_idx'),
+            GinIndex(OpClass('description', name='gin_trgm_ops'), name='base_restaurant_desc_trgm_idx'),
+        ]
+
 
 class VoteManager(models.Manager):
-    def votes_per_day(self, user_id: int, date: datetime.date = None) -> int:
+    votes_per_day_cache_key = 'votes_per_day:{date}:{user_id}'
+
+    def votes_per_day(self, user_id: int, date: datetime.date = None, team: Team = None) -> int:
+        team = team or Team.shared_pool()
+        if not date:
+            date = team.voting_date()
+
+        cache_key = self.votes_per_day_cache_key.format(date=date, user_id=user_id)
+        votes_amount = cache.get(cache_key)
+        metrics.record_cache('votes_per_day', hit=votes_amount is not None)
+        if votes_amount is None:
+            votes_amount = self.filter(user_id=user_id, date=date)\
+                .aggregate(votes_amount=Sum('amount'))['votes_amount'] or 0
+            # doesn't overwrite the counter stored by a vote cast in the meantime
+            cache.add(cache_key, votes_amount, timeout=team.seconds_until_voting_day_end(date))
+        return votes_amount
+
+    def cast_vote(self, user_id: int, restaurant_id: int, max_votes: int, votes_weights: list[float],
+                  date: datetime.date = None, default_weight: float = 1.0, team: Team = None) -> 'Vote':
+        team = team or Team.shared_pool()
         if not date:
-            date = datetime.date.today()
-        return self.filter(user_id=user_id, date=date).aggregate(votes_amount=Sum('amount'))['votes_amount']
+            date = team.voting_date()
+
+        if self.votes_per_day(user_id, date, team) >= max_votes:
+            raise VotesLimitExceeded
+
+        with transaction.atomic():
+            self._lock_users([user_id])
+
+            with connection.cursor() as cursor:
+                cursor.execute(CAST_VOTE_SQL, {
+                    'user_id': user_id,
+                    'restaurant_id': restaurant_id,
+                    'team_id': team.pk,
+                    'date': date,
+                    'max_votes': max_votes,
+                    'votes_weights': list(votes_weights),
+                    'default_weight': default_weight,
+                })
+                row = cursor.fetchone()
+
+            if row is not None:
+                vote_id, amount, score, votes_amount, weight = row
+                transaction.on_commit(lambda: self._votes_cast(
+                    user_id, date, votes_amount, [(restaurant_id, weight, amount == 1)], team
+                ))
+
+        if row is None:
+            if not Restaurant.objects.filter(pk=restaurant_id, team_id=team.pk).exists():
+                raise Restaurant.DoesNotExist
+            raise VotesLimitExceeded
+
+        return self.model(id=vote_id, user_id=user_id, restaurant_id=restaurant_id,
+                          date=date, amount=amount, score=score)
+
+    def cast_votes(self, user_id: int, votes: dict[int, int], max_votes: int, votes_weights: list[float],
+                   date: datetime.date = None, default_weight: float = 1.0, team: Team = None) -> list['Vote']:
+        team = team or Team.shared_pool()
+        if not date:
+            date = team.voting_date()
+
+        if self.votes_per_day(user_id, date, team) + sum(votes.values()) > max_votes:
+            raise VotesLimitExceeded
+
+        with transaction.atomic():
+            self._lock_users([user_id])
+
+            if Restaurant.objects.filter(pk__in=votes, team_id=team.pk).count() != len(votes):
+                raise Restaurant.DoesNotExist
+
+            user_votes = {vote.restaurant_id: vote for vote in self.filter(user_id=user_id, date=date)}
+            votes_amount = sum(vote.amount for vote in user_votes.values()) + sum(votes.values())
+            if votes_amount > max_votes:
+                raise VotesLimitExceeded
+
+            cast_votes, restaurant_votes = [], []
+            for restaurant_id, count in votes.items():
+                vote = user_votes.get(restaurant_id) or self.model(
+                    user_id=user_id, restaurant_id=restaurant_id, date=date, amount=0, score=0
+                )
+                weight = sum(
+                    determine_vote_weight(votes_weights, vote_num, default_weight)
+                    for vote_num in range(vote.amount + 1, vote.amount + count + 1)
+                )
+                restaurant_votes.append((restaurant_id, weight, vote.amount == 0))
+
+                vote.amount += count
+                vote.score += weight
+                cast_votes.append(vote)
+
+            self._bulk_upsert(date, cast_votes)
+            transaction.on_commit(lambda: self._votes_cast(user_id, date, votes_amount, restaurant_votes, team))
+
+        return cast_votes
+
+    def bulk_upsert(self, date: datetime.date, votes: list['Vote']) -> int:
+        if not votes:
+            return 0
+
+        with transaction.atomic():
+            # concurrent upserts of the same votes would add their difference to the tallies twice
+            self._lock_users({vote.user_id for vote in votes})
+            return self._bulk_upsert(date, votes)
+
+    def _bulk_upsert(self, date: datetime.date, votes: list['Vote']) -> int:
+        # votes of deleted users/restaurants are skipped, stale amounts never overwrite newer ones
+        with connection.cursor() as cursor:
+            cursor.execute(UPSERT_VOTES_SQL, {
+                'date': date,
+                'user_ids': [vote.user_id for vote in votes],
+                'restaurant_ids': [vote.restaurant_id for vote in votes],
+                'amounts': [vote.amount for vote in votes],
+                'scores': [vote.score for vote in votes],
+            })
+            return cursor.fetchone()[0]
+
+    def _lock_users(self, user_ids: Iterable[int]):
+        # serializes concurrent votes of the same users, so they can't both pass the daily limit check
+        list(User.objects.select_for_update(no_key=True).filter(pk__in=user_ids).order_by('pk')
+             .values_list('pk', flat=True))
+
+    def _votes_cast(self, user_id: int, date: datetime.date, votes_amount: int,
+                    restaurant_votes: list[tuple[int, float, bool]], team: Team):
+        # the counter is set to the total computed under the lock, so it never gets ahead of the database.
+        # It's kept till the team's voting day of the date ends
+        try:
+            cache.set(
+                self.votes_per_day_cache_key.format(date=date, user_id=user_id),
+                votes_amount,
+                timeout=team.seconds_until_voting_day_end(date)
+            )
+            for restaurant_id, weight, new_voter in restaurant_votes:
+                leaderboard.record_vote(restaurant_id, weight, new_voter=new_voter, date=date)
+        except redis.RedisError:
+            # the votes are committed already, the limit is checked by the database anyway
+            # and the leaderboard can be restored with rebuild_leaderboard
+            logger.warning('Counters of the votes of user %s could not be updated', user_id, exc_info=True)
 
 
 class Vote(models.Model):
@@ -24,16 +268,304 @@ class Vote(models.Model):
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE)
     score = models.FloatField()
     amount = models.IntegerField()
-    date = models.DateField(auto_now_add=True, db_index=True)
+    # the voting day of the team, see Team.voting_date
+    date = models.DateField()
 
     objects = VoteManager()
 
     class Meta:
         unique_together = (('user', 'restaurant', 'date'), )
+        indexes = [
+            # votes used by the user per day
+            models.Index(fields=['user', 'date'], include=['amount'], name='base_vote_user_date_idx'),
+            # restaurants' tallies and simulated scores per day
+            models.Index(fields=['date', 'restaurant'], include=['user', 'amount', 'score'],
+                         name='base_vote_date_restaurant_idx'),
+        ]
+
+
+class DailyRestaurantTallyManager(models.Manager):
+    def aggregate_votes(self, date: datetime.date) -> models.QuerySet:
+        return Vote.objects.filter(date=date)\
+            .values('restaurant_id')\
+            .annotate(score_sum=Sum('score'), voter_count=Count('user_id'))\
+            .order_by('restaurant_id')
+
+    def rebuild(self, date: datetime.date):
+        with transaction.atomic():
+            self.filter(date=date).delete()
+            self.bulk_create(self.model(date=date, **result) for result in self.aggregate_votes(date))
+
+
+class DailyRestaurantTally(models.Model):
+    date = models.DateField()
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE)
+    score_sum = models.FloatField(default=0)
+    voter_count = models.IntegerField(default=0)
+
+    objects = DailyRestaurantTallyManager()
+
+    class Meta:
+        unique_together = (('date', 'restaurant'), )
+
+
+class WinnerRestaurantManager(models.Manager):
+    list_cache_key = 'winners:{date}'
+    team_list_cache_key = 'winners:team:{team_id}:{date}'
+
+    def get_list_cache_key(self, date: datetime.date, team_id: int = None) -> str:
+        if team_id is None:
+            return self.list_cache_key.format(date=date)
+        return self.team_list_cache_key.format(team_id=team_id, date=date)
+
+    def invalidate_list_cache(self, dates: Iterable[datetime.date], team_id: int = None):
+        cache.delete_many([self.get_list_cache_key(date, team_id) for date in dates])
+
+    def lock_team(self, team_id: int = None):
+        # serializes determining the winners of the team till the end of the transaction
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [WINNERS_LOCK_ID, team_id or 0])
+
+    def simulate(self, date_from: datetime.date, date_to: datetime.date, votes_weights: list[float],
+                 default_weight: float = 1.0, team_id: int = None) -> list[tuple[datetime.date, int, float, int]]:
+        # the score of a vote with the given amount is the prefix sum of the weights,
+        # every vote past the weights list counts with the last weight
+        prefix_scores = list(itertools.accumulate(votes_weights))
+        with connection.cursor() as cursor:
+            cursor.execute(SIMULATE_WINNERS_SQL, {
+                'date_from': date_from - datetime.timedelta(days=1),
+                'date_to': date_to - datetime.timedelta(days=1),
+                'prefix_scores': prefix_scores,
+                'weights_count': len(prefix_scores),
+                'weights_total': prefix_scores[-1] if prefix_scores else 0,
+                'last_weight': votes_weights[-1] if votes_weights else default_weight,
+                'team_id': team_id,
+            })
+            return cursor.fetchall()
 
 
 class WinnerRestaurant(models.Model):
+    team = models.ForeignKey(Team, null=True, blank=True, on_delete=models.CASCADE)
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE)
-    date = models.DateField(auto_now_add=True, db_index=True)
+    # the day after the voting day of the team
+    date = models.DateField()
     score = models.FloatField()
     unique_voters = models.IntegerField()
+
+    objects = WinnerRestaurantManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'team'], include=['restaurant'], name='base_winner_date_team_idx'),
+        ]
+
+
+class RestaurantStatsManager(models.Manager):
+    def roll_up(self, date: datetime.date, team_id: int = None) -> int:
+        # adds the tallies and winners of the team's day to the restaurants' totals and weekly and monthly trends,
+        # days which were already rolled up are skipped
+        with connection.cursor() as cursor:
+            cursor.execute(ROLL_UP_STATS_SQL, {
+                'date': date,
+                'winner_date': date + datetime.timedelta(days=1),
+                'team_id': team_id,
+            })
+            return cursor.fetchone()[0]
+
+    def backfill(self) -> int:
+        with transaction.atomic():
+            RestaurantPeriodStats.objects.all().delete()
+            self.all().delete()
+            dates = DailyRestaurantTally.objects.order_by('date').values_list('date', flat=True).distinct()
+            team_ids = [None, *Team.objects.order_by('pk').values_list('pk', flat=True)]
+            for date in dates:
+                for team_id in team_ids:
+                    self.roll_up(date, team_id)
+        return len(dates)
+
+
+class RestaurantStats(models.Model):
+    restaurant = models.OneToOneField(Restaurant, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    total_wins = models.IntegerField(default=0)
+    current_win_streak = models.IntegerField(default=0)
+    longest_win_streak = models.IntegerField(default=0)
+    last_win_date = models.DateField(null=True)
+    voted_days = models.IntegerField(default=0)
+    total_score = models.FloatField(default=0)
+    total_voters = models.IntegerField(default=0)
+    rolled_up_date = models.DateField(null=True)
+
+    objects = RestaurantStatsManager()
+
+    @property
+    def average_daily_score(self) -> float:
+        return self.total_score / self.voted_days if self.voted_days else 0.0
+
+
+class RestaurantPeriodStats(models.Model):
+    WEEK = 'week'
+    MONTH = 'month'
+    PERIODS = ((WEEK, 'Week'), (MONTH, 'Month'))
+
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE)
+    period = models.CharField(max_length=8, choices=PERIODS)
+    start = models.DateField()
+    score_sum = models.FloatField(default=0)
+    voter_count = models.IntegerField(default=0)
+    voted_days = models.IntegerField(default=0)
+    wins = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (('restaurant', 'period', 'start'), )
+
+
+# first key of the advisory locks of the teams' winners, the second one is the team id
+WINNERS_LOCK_ID = 1
+
+CAST_VOTE_SQL = f"""
+    WITH votes_used AS (
+        SELECT COALESCE(SUM(amount), 0) AS amount
+        FROM {Vote._meta.db_table}
+        WHERE user_id = %(user_id)s AND date = %(date)s
+    ), vote AS (
+        INSERT INTO {Vote._meta.db_table} AS vote (user_id, restaurant_id, date, amount, score)
+        SELECT %(user_id)s, restaurant.id, %(date)s, 1,
+               COALESCE((%(votes_weights)s::float8[])[1], %(default_weight)s)
+        FROM {Restaurant._meta.db_table} AS restaurant, votes_used
+        WHERE restaurant.id = %(restaurant_id)s AND restaurant.team_id IS NOT DISTINCT FROM %(team_id)s
+              AND votes_used.amount < %(max_votes)s
+        ON CONFLICT (user_id, restaurant_id, date) DO UPDATE
+        SET amount = vote.amount + 1,
+            score = vote.score + COALESCE(
+                (%(votes_weights)s::float8[])[LEAST(vote.amount + 1, cardinality(%(votes_weights)s::float8[]))],
+                %(default_weight)s
+            )
+        RETURNING vote.id, vote.restaurant_id, vote.amount, vote.score,
+                  COALESCE(
+                      (%(votes_weights)s::float8[])[LEAST(vote.amount, cardinality(%(votes_weights)s::float8[]))],
+                      %(default_weight)s
+                  ) AS weight
+    ), tally AS (
+        INSERT INTO {DailyRestaurantTally._meta.db_table} AS tally (date, restaurant_id, score_sum, voter_count)
+        SELECT %(date)s, vote.restaurant_id, vote.weight, (vote.amount = 1)::int
+        FROM vote
+        ON CONFLICT (date, restaurant_id) DO UPDATE
+        SET score_sum = tally.score_sum + EXCLUDED.score_sum,
+            voter_count = tally.voter_count + EXCLUDED.voter_count
+    )
+    SELECT vote.id, vote.amount, vote.score, votes_used.amount + 1, vote.weight
+    FROM vote, votes_used
+"""
+
+UPSERT_VOTES_SQL = f"""
+    WITH buffered AS (
+        SELECT buffered.*
+        FROM unnest(%(user_ids)s::bigint[], %(restaurant_ids)s::bigint[], %(amounts)s::int[], %(scores)s::float8[])
+            AS buffered (user_id, restaurant_id, amount, score)
+        JOIN {User._meta.db_table} ON {User._meta.db_table}.id = buffered.user_id
+        JOIN {Restaurant._meta.db_table} ON {Restaurant._meta.db_table}.id = buffered.restaurant_id
+    ), previous AS (
+        SELECT vote.user_id, vote.restaurant_id, vote.score
+        FROM {Vote._meta.db_table} AS vote
+        JOIN buffered USING (user_id, restaurant_id)
+        WHERE vote.date = %(date)s
+    ), upserted AS (
+        INSERT INTO {Vote._meta.db_table} AS vote (user_id, restaurant_id, date, amount, score)
+        SELECT buffered.user_id, buffered.restaurant_id, %(date)s, buffered.amount, buffered.score
+        FROM buffered
+        ON CONFLICT (user_id, restaurant_id, date) DO UPDATE
+        SET amount = EXCLUDED.amount, score = EXCLUDED.score
+        WHERE vote.amount < EXCLUDED.amount
+        RETURNING vote.user_id, vote.restaurant_id, vote.score
+    ), tally AS (
+        INSERT INTO {DailyRestaurantTally._meta.db_table} AS tally (date, restaurant_id, score_sum, voter_count)
+        SELECT %(date)s, upserted.restaurant_id,
+               SUM(upserted.score - COALESCE(previous.score, 0)),
+               COUNT(*) FILTER (WHERE previous.user_id IS NULL)
+        FROM upserted
+        LEFT JOIN previous USING (user_id, restaurant_id)
+        GROUP BY upserted.restaurant_id
+        ON CONFLICT (date, restaurant_id) DO UPDATE
+        SET score_sum = tally.score_sum + EXCLUDED.score_sum,
+            voter_count = tally.voter_count + EXCLUDED.voter_count
+    )
+    SELECT COUNT(*) FROM upserted
+"""
+
+# winners are determined the day after the votes, hence the date shift, every team has its own winners
+SIMULATE_WINNERS_SQL = f"""
+    WITH scored AS (
+        SELECT vote.date, vote.restaurant_id,
+               SUM(CASE
+                   WHEN vote.amount <= %(weights_count)s THEN (%(prefix_scores)s::float8[])[vote.amount]
+                   ELSE %(weights_total)s + (vote.amount - %(weights_count)s) * %(last_weight)s
+               END) AS score,
+               COUNT(*) AS unique_voters
+        FROM {Vote._meta.db_table} AS vote
+        JOIN {Restaurant._meta.db_table} AS restaurant ON restaurant.id = vote.restaurant_id
+        WHERE vote.date BETWEEN %(date_from)s AND %(date_to)s
+              AND restaurant.team_id IS NOT DISTINCT FROM %(team_id)s
+        GROUP BY vote.date, vote.restaurant_id
+    ), ranked AS (
+        SELECT scored.*, RANK() OVER (PARTITION BY date ORDER BY score DESC, unique_voters DESC) AS rank
+        FROM scored
+    )
+    SELECT date + 1, restaurant_id, score, unique_voters
+    FROM ranked
+    WHERE rank = 1
+    ORDER BY date, restaurant_id
+"""
+
+# the winners of the team are ranked the same way as by determine_winner and win the next day,
+# voter_count is the sum of the daily unique voters
+ROLL_UP_STATS_SQL = f"""
+    WITH ranked AS (
+        SELECT tally.restaurant_id, tally.score_sum, tally.voter_count,
+               RANK() OVER (ORDER BY tally.score_sum DESC, tally.voter_count DESC) = 1 AS won
+        FROM {DailyRestaurantTally._meta.db_table} AS tally
+        JOIN {Restaurant._meta.db_table} AS restaurant ON restaurant.id = tally.restaurant_id
+        WHERE tally.date = %(date)s AND restaurant.team_id IS NOT DISTINCT FROM %(team_id)s
+    ), day AS (
+        SELECT ranked.*, CASE
+                   WHEN NOT ranked.won THEN 0
+                   WHEN previous.last_win_date = %(winner_date)s::date - 1 THEN previous.current_win_streak + 1
+                   ELSE 1
+               END AS win_streak
+        FROM ranked
+        LEFT JOIN {RestaurantStats._meta.db_table} AS previous USING (restaurant_id)
+    ), stats AS (
+        INSERT INTO {RestaurantStats._meta.db_table} AS stats (
+            restaurant_id, total_wins, current_win_streak, longest_win_streak, last_win_date,
+            voted_days, total_score, total_voters, rolled_up_date
+        )
+        SELECT restaurant_id, won::int, win_streak, win_streak, CASE WHEN won THEN %(winner_date)s::date END,
+               1, score_sum, voter_count, %(date)s
+        FROM day
+        ON CONFLICT (restaurant_id) DO UPDATE
+        SET total_wins = stats.total_wins + EXCLUDED.total_wins,
+            current_win_streak = EXCLUDED.current_win_streak,
+            longest_win_streak = GREATEST(stats.longest_win_streak, EXCLUDED.current_win_streak),
+            last_win_date = COALESCE(EXCLUDED.last_win_date, stats.last_win_date),
+            voted_days = stats.voted_days + 1,
+            total_score = stats.total_score + EXCLUDED.total_score,
+            total_voters = stats.total_voters + EXCLUDED.total_voters,
+            rolled_up_date = EXCLUDED.rolled_up_date
+        WHERE stats.rolled_up_date IS NULL OR stats.rolled_up_date < EXCLUDED.rolled_up_date
+        RETURNING stats.restaurant_id
+    ), periods AS (
+        INSERT INTO {RestaurantPeriodStats._meta.db_table} AS period_stats (
+            restaurant_id, period, start, score_sum, voter_count, voted_days, wins
+        )
+        SELECT day.restaurant_id, period.name, date_trunc(period.name, %(date)s::date)::date,
+               day.score_sum, day.voter_count, 1, day.won::int
+        FROM day
+        JOIN stats USING (restaurant_id)
+        CROSS JOIN (VALUES ('{RestaurantPeriodStats.WEEK}'), ('{RestaurantPeriodStats.MONTH}')) AS period (name)
+        ON CONFLICT (restaurant_id, period, start) DO UPDATE
+        SET score_sum = period_stats.score_sum + EXCLUDED.score_sum,
+            voter_count = period_stats.voter_count + EXCLUDED.voter_count,
+            voted_days = period_stats.voted_days + 1,
+            wins = period_stats.wins + EXCLUDED.wins
+    )
+    SELECT COUNT(*) FROM stats
+"""
@@ -0,0 +1,107 @@
+import datetime
+import gzip
+from pathlib import Path
+
+from django.db import connection, transaction
+
+from base.models import Vote
+
+TABLE = Vote._meta.db_table
+PARTITION_NAME = TABLE + '_y{month:%Y}m{month:%m}'
+DEFAULT_PARTITION = TABLE + '_default'
+COLUMNS = 'id, user_id, restaurant_id, date, amount, score'
+
+
+def month_start(date: datetime.date) -> datetime.date:
+    return date.replace(day=1)
+
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    year, month_index = divmod(month.year * 12 + month.month - 1 + months, 12)
+    return datetime.date(year, month_index + 1, 1)
+
+
+def get_partitions() -> dict[datetime.date, str]:
+    with connection.cursor() as cursor:
+        cursor.execute(PARTITIONS_SQL, [TABLE])
+        names = [name for name, in cursor.fetchall()]
+
+    partitions = {}
+    for name in names:
+        if name != DEFAULT_PARTITION:
+            month = datetime.datetime.strptime(name[len(TABLE):], '_y%Ym%m').date()
+            partitions[month] = name
+    return partitions
+
+
+def create_partition(month: datetime.date) -> bool:
+    month = month_start(month)
+    name = PARTITION_NAME.format(month=month)
+    if month in get_partitions():
+        return False
+
+    # votes of the month which got into the default partition are moved, otherwise attaching would fail
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(CREATE_PARTITION_SQL.format(partition=name), {
+            'month_from': month,
+            'month_to': add_months(month, 1),
+        })
+    return True
+
+
+def create_future_partitions(months_ahead: int) -> list[datetime.date]:
+    current_month = month_start(datetime.date.today())
+    months = [add_months(current_month, months) for months in range(months_ahead + 1)]
+    return [month for month in months if create_partition(month)]
+
+
+def archive_partition(month: datetime.date, directory: Path) -> Path:
+    name = PARTITION_NAME.format(month=month_start(month))
+    path = Path(directory) / f'{name}.csv.gz'
+
+    # the partition is dropped only once the file is written,
+    # deferred foreign key checks of the transaction have to be fired before that
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+        with gzip.open(path, 'wt') as file:
+            cursor.copy_expert(f'COPY {name} ({COLUMNS}) TO STDOUT WITH (FORMAT csv, HEADER)', file)
+        cursor.execute(f'DROP TABLE {name}')
+    return path
+
+
+def restore_partition(month: datetime.date, directory: Path) -> Path:
+    month = month_start(month)
+    path = Path(directory) / f'{PARTITION_NAME.format(month=month)}.csv.gz'
+
+    with transaction.atomic():
+        create_partition(month)
+        with gzip.open(path, 'rt') as file, connection.cursor() as cursor:
+            cursor.copy_expert(f'COPY {TABLE} ({COLUMNS}) FROM STDIN WITH (FORMAT csv, HEADER)', file)
+    return path
+
+
+PARTITIONS_SQL = """
+    SELECT child.relname
+    FROM pg_inherits
+    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = %s
+    ORDER BY child.relname
+"""
+
+CREATE_PARTITION_SQL = f"""
+    LOCK TABLE {DEFAULT_PARTITION} IN EXCLUSIVE MODE;
+
+    CREATE TABLE {{partition}} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);
+
+    WITH moved AS (
+        DELETE FROM {DEFAULT_PARTITION}
+        WHERE date >= %(month_from)s AND date < %(month_to)s
+        RETURNING {COLUMNS}
+    )
+    INSERT INTO {{partition}} ({COLUMNS})
+    SELECT {COLUMNS} FROM moved;
+
+    ALTER TABLE {TABLE} ATTACH PARTITION {{partition}} FOR VALUES FROM (%(month_from)s) TO (%(month_to)s);
+"""
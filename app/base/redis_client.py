@@ -0,0 +1,22 @@
+import asyncio
+import weakref
+from functools import lru_cache
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+# async connections can't be shared between event loops
+_async_clients = weakref.WeakKeyDictionary()
+
+
+@lru_cache(maxsize=None)
+def get_redis() -> redis.Redis:
+    return redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        _async_clients[loop] = redis.asyncio.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _async_clients[loop]
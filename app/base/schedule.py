@@ -0,0 +1,45 @@
+import datetime
+
+from base.models import Team
+from base.redis_client import get_redis
+from base.utils import next_cutoff
+
+# The next cutoff of every team by its id, 0 for the shared pool. It's checked every WINNERS_SCHEDULE_INTERVAL,
+# so the winners of every team are determined at its own local time and the work is spread over the day
+SCHEDULE_KEY = 'winners:schedule'
+
+
+def pop_due(teams: list[Team], now: datetime.datetime) -> list[tuple[Team, datetime.date]]:
+    redis = get_redis()
+    teams = {str(team.pk or 0): team for team in teams}
+    scheduled = dict(redis.zrange(SCHEDULE_KEY, 0, -1, withscores=True))
+
+    removed = scheduled.keys() - teams.keys()
+    added = {
+        member: next_cutoff(team.timezone, team.cutoff, now).timestamp()
+        for member, team in teams.items() if member not in scheduled
+    }
+
+    due, rescheduled = [], {}
+    for member, timestamp in scheduled.items():
+        if member in teams and timestamp <= now.timestamp():
+            team = teams[member]
+            cutoff_at = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+            # the day which ended at the cutoff, a tick after a downtime catches up one missed day at a time
+            due.append((team, team.voting_date(cutoff_at) - datetime.timedelta(days=1)))
+            rescheduled[member] = next_cutoff(team.timezone, team.cutoff, cutoff_at).timestamp()
+
+    pipeline = redis.pipeline()
+    if removed:
+        pipeline.zrem(SCHEDULE_KEY, *removed)
+    if added or rescheduled:
+        pipeline.zadd(SCHEDULE_KEY, {**added, **rescheduled})
+    pipeline.execute()
+    return due
+
+
+def reschedule(team: Team, now: datetime.datetime):
+    # the cutoff or timezone of the team was changed, its last cutoff is due right away in case the day
+    # which ended at it is not determined yet, repeated subtasks for the same day don't change the winners
+    last_cutoff = next_cutoff(team.timezone, team.cutoff, now - datetime.timedelta(days=1))
+    get_redis().zadd(SCHEDULE_KEY, {str(team.pk or 0): last_cutoff.timestamp()})
@@ -1,48 +1,139 @@
 import datetime
+import time
 
+from celery import group
 from celery.schedules import crontab
-from django.contrib.postgres.aggregates import ArrayAgg
-from django.db.models import Count, Sum, Window
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import Rank
+from django.utils import timezone
+from knox.models import AuthToken
 
 from lunch_voter.celery import app
-from base.models import Vote, WinnerRestaurant
+from base import metrics, partitions, schedule, vote_buffer
+from base.models import DailyRestaurantTally, RestaurantStats, Team, WinnerRestaurant
+
+PRUNE_TOKENS_BATCH_SIZE = 1000
+
+_tasks_started = {}
 
 
 @app.on_after_finalize.connect
 def setup_periodic_tasks(sender, **kwargs):
     sender.add_periodic_task(
-        crontab(minute=0, hour=0),
-        determine_winner.s()
+        settings.WINNERS_SCHEDULE_INTERVAL,
+        run_winners_schedule.s()
     )
+    sender.add_periodic_task(
+        crontab(minute=30),
+        prune_expired_tokens.s()
+    )
+    sender.add_periodic_task(
+        crontab(minute=0, hour=1),
+        create_vote_partitions.s()
+    )
+
+    if settings.VOTES_WRITE_BEHIND:
+        sender.add_periodic_task(
+            settings.VOTES_FLUSH_INTERVAL,
+            flush_vote_buffer.s()
+        )
+
+
+@task_prerun.connect
+def task_started(task_id, **kwargs):
+    _tasks_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def task_finished(task_id, task, retval, state, **kwargs):
+    started = _tasks_started.pop(task_id, None)
+    if started is not None:
+        metrics.observe('celery_task_duration_seconds', time.perf_counter() - started, task=task.name)
+    metrics.inc('celery_tasks_total', task=task.name, state=state)
+    # tasks processing rows return their amount
+    if type(retval) is int:
+        metrics.inc('celery_task_rows_total', retval, task=task.name)
+
+
+@app.task
+def flush_vote_buffer():
+    return vote_buffer.flush()
+
+
+@app.task
+def create_vote_partitions():
+    return [str(month) for month in partitions.create_future_partitions(settings.VOTES_PARTITIONS_AHEAD)]
+
+
+@app.task
+def prune_expired_tokens():
+    # deleted in batches to keep the locks short while the users keep authenticating
+    now = timezone.now()
+    pruned = 0
+    while digests := list(AuthToken.objects.filter(expiry__lt=now)
+                          .values_list('digest', flat=True)[:PRUNE_TOKENS_BATCH_SIZE]):
+        pruned += AuthToken.objects.filter(digest__in=digests).delete()[0]
+    return pruned
+
+
+@app.task
+def run_winners_schedule() -> int:
+    # starts the subtasks of the teams whose voting day has ended since the previous run
+    due = schedule.pop_due([Team.shared_pool(), *Team.objects.order_by('pk')], timezone.now())
+    for team, date in due:
+        determine_team_winner.delay(date.isoformat(), team.pk)
+    return len(due)
 
 
 @app.task
 def determine_winner():
-    date = datetime.date.today() - datetime.timedelta(days=1)
-
-    vote_results = Vote.objects.filter(date=date)\
-        .values('restaurant_id')\
-        .annotate(
-            score_sum=Sum('score'),
-            users_count=Count('user_id'),
-            restaurants_ids=Window(
-                expression=ArrayAgg('restaurant_id'),
-                partition_by=['score_sum', 'users_count'],
-                order_by=['-score_sum', '-users_count']
-            )
-        )\
-        .values('score_sum', 'users_count', 'restaurants_ids')\
-        .order_by('-score_sum', '-users_count')\
-        .first()
-
-    if vote_results:
-        winner_results = (
-            WinnerRestaurant(
-                restaurant_id=rest_id,
-                score=vote_results['score_sum'],
-                unique_voters=vote_results['users_count']
+    # determines the last ended voting day of every team at once, e.g. to catch up after a downtime
+    now = timezone.now()
+    group(
+        determine_team_winner.s((team.voting_date(now) - datetime.timedelta(days=1)).isoformat(), team.pk)
+        for team in [Team.shared_pool(), *Team.objects.order_by('pk')]
+    ).apply_async()
+
+
+@app.task
+def determine_team_winner(date: str, team_id: int = None) -> int:
+    date = datetime.date.fromisoformat(date)
+
+    if settings.VOTES_WRITE_BEHIND:
+        vote_buffer.flush(date)
+
+    with transaction.atomic():
+        # repeated and concurrent runs for the same team and date don't add the winners twice
+        WinnerRestaurant.objects.lock_team(team_id)
+        determined = WinnerRestaurant.objects.filter(team_id=team_id, date=date + datetime.timedelta(days=1))
+        created_winners = []
+        if not determined.exists():
+            winners = DailyRestaurantTally.objects.filter(date=date, restaurant__team_id=team_id)\
+                .annotate(
+                    rank=Window(
+                        expression=Rank(),
+                        order_by=[F('score_sum').desc(), F('voter_count').desc()]
+                    )
+                )\
+                .filter(rank=1)
+
+            winner_results = (
+                WinnerRestaurant(
+                    team_id=team_id,
+                    restaurant_id=tally.restaurant_id,
+                    date=date + datetime.timedelta(days=1),
+                    score=tally.score_sum,
+                    unique_voters=tally.voter_count
+                )
+                for tally in winners
             )
-            for rest_id in vote_results['restaurants_ids']
-        )
+            created_winners = WinnerRestaurant.objects.bulk_create(winner_results)
+
+        # the amount of the restaurants' tallies of the day which were processed
+        rolled_up = RestaurantStats.objects.roll_up(date, team_id)
 
-        WinnerRestaurant.objects.bulk_create(winner_results)
+    WinnerRestaurant.objects.invalidate_list_cache({winner.date for winner in created_winners}, team_id)
+    return rolled_up
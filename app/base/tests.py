@@ -1,11 +1,556 @@
+import contextlib
 import datetime
+import io
+import json
+import os
+import tempfile
+import threading
+import time
 from unittest import mock
 
-from django.test import TestCase
+from constance import config
+from django.db import connection
+from django.db.models import Max, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from knox.models import AuthToken
 
-from base.models import Restaurant, Vote, WinnerRestaurant
-from base.tasks import determine_winner
+from api.tests import clear_redis_keys
+from base import benchmark, db_router, generator, leaderboard, metrics, partitions, schedule, vote_buffer
+from base.exceptions import VotesLimitExceeded
+from base.models import (DailyRestaurantTally, Restaurant, RestaurantPeriodStats, RestaurantStats, Team, Vote,
+                         WinnerRestaurant)
+from base.redis_client import get_redis
+from base.tasks import determine_team_winner, determine_winner, prune_expired_tokens, run_winners_schedule
+from base.utils import next_cutoff, voting_date
+from lunch_voter.celery import app
+
+
+@contextlib.contextmanager
+def eager_tasks():
+    # determine_winner runs the subtasks of the teams in place
+    eager = {'task_always_eager': True, 'task_eager_propagates': True}
+    previous = {name: app.conf[name] for name in eager}
+    app.conf.update(eager)
+    try:
+        yield
+    finally:
+        app.conf.update(previous)
+
+
+class CastVoteTestCase(TestCase):
+    fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.first()
+        cls.restaurant = Restaurant.objects.first()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cast_vote(self):
+        for amount, score in ((1, 1.0), (2, 1.5), (3, 1.75), (4, 2.0)):
+            vote = Vote.objects.cast_vote(self.user.id, self.restaurant.id, max_votes=5, votes_weights=[1, 0.5, 0.25])
+            self.assertEqual(vote.amount, amount)
+            self.assertEqual(vote.score, score)
+
+        self.assertEqual(Vote.objects.get(user=self.user, restaurant=self.restaurant).score, 2.0)
+
+    def test_cast_vote_empty_weights(self):
+        Vote.objects.cast_vote(self.user.id, self.restaurant.id, max_votes=5, votes_weights=[])
+        vote = Vote.objects.cast_vote(self.user.id, self.restaurant.id, max_votes=5, votes_weights=[])
+        self.assertEqual(vote.score, 2.0)
+
+    def test_cast_vote_limit_exceeded(self):
+        Vote.objects.cast_vote(self.user.id, self.restaurant.id, max_votes=1, votes_weights=[1])
+        with self.assertRaises(VotesLimitExceeded):
+            Vote.objects.cast_vote(self.user.id, self.restaurant.id, max_votes=1, votes_weights=[1])
+
+    def test_cast_vote_restaurant_not_found(self):
+        with self.assertRaises(Restaurant.DoesNotExist):
+            Vote.objects.cast_vote(self.user.id, 999, max_votes=1, votes_weights=[1])
+
+    def test_cast_vote_updates_tally(self):
+        users = User.objects.all()
+        Vote.objects.cast_vote(users[0].id, self.restaurant.id, max_votes=5, votes_weights=[1, 0.5])
+        Vote.objects.cast_vote(users[0].id, self.restaurant.id, max_votes=5, votes_weights=[1, 0.5])
+        Vote.objects.cast_vote(users[1].id, self.restaurant.id, max_votes=5, votes_weights=[1, 0.5])
+
+        tally = DailyRestaurantTally.objects.get(date=datetime.date.today(), restaurant=self.restaurant)
+        self.assertEqual(tally.score_sum, 2.5)
+        self.assertEqual(tally.voter_count, 2)
+
+    def test_cast_votes(self):
+        restaurants = Restaurant.objects.order_by('id')
+        Vote.objects.cast_vote(self.user.id, restaurants[0].id, max_votes=5, votes_weights=[1, 0.5, 0.25])
+
+        votes = Vote.objects.cast_votes(self.user.id, {restaurants[0].id: 3, restaurants[1].id: 1},
+                                        max_votes=5, votes_weights=[1, 0.5, 0.25])
+        self.assertEqual([(vote.amount, vote.score) for vote in votes], [(4, 2.0), (1, 1.0)])
+
+        tallies = DailyRestaurantTally.objects.order_by('restaurant_id').values_list('score_sum', 'voter_count')
+        self.assertEqual(list(tallies), [(2.0, 1), (1.0, 1)])
+
+        with self.assertRaises(VotesLimitExceeded):
+            Vote.objects.cast_votes(self.user.id, {restaurants[2].id: 1}, max_votes=5, votes_weights=[1])
+
+    def test_votes_per_day_cached(self):
+        today = datetime.date.today()
+        Vote.objects.create(user=self.user, restaurant=self.restaurant, date=today, score=1, amount=1)
+        self.assertEqual(Vote.objects.votes_per_day(self.user.id), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Vote.objects.cast_vote(self.user.id, self.restaurant.id, max_votes=5, votes_weights=[1])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(Vote.objects.votes_per_day(self.user.id), 2)
+
+    def test_cast_vote_limit_exceeded_cached(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Vote.objects.cast_vote(self.user.id, self.restaurant.id, max_votes=1, votes_weights=[1])
+
+        with self.assertNumQueries(0), self.assertRaises(VotesLimitExceeded):
+            Vote.objects.cast_vote(self.user.id, self.restaurant.id, max_votes=1, votes_weights=[1])
+
+
+class CastVoteConcurrencyTestCase(TransactionTestCase):
+    fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json']
+
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_votes_respect_limit(self):
+        user = User.objects.first()
+        restaurants = list(Restaurant.objects.all())
+        results = []
+
+        def vote(restaurant):
+            try:
+                Vote.objects.cast_vote(user.id, restaurant.id, max_votes=3, votes_weights=[1, 0.5])
+                results.append(True)
+            except VotesLimitExceeded:
+                results.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=vote, args=(restaurants[i % len(restaurants)], )) for i in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 3)
+        self.assertEqual(Vote.objects.votes_per_day(user_id=user.id), 3)
+
+
+class VoteBufferTestCase(TestCase):
+    fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.first()
+        cls.restaurants = Restaurant.objects.all()
+
+    def setUp(self):
+        clear_redis_keys('vote_buffer:*', 'leaderboard:*')
+
+    def test_cast_vote(self):
+        for amount, score in ((1, 1.0), (2, 1.5), (3, 1.75)):
+            vote = vote_buffer.cast_vote(self.user.id, self.restaurants[0].id, max_votes=5,
+                                         votes_weights=[1, 0.5, 0.25])
+            self.assertEqual(vote.amount, amount)
+            self.assertEqual(vote.score, score)
+
+        self.assertFalse(Vote.objects.exists())
+        self.assertEqual(vote_buffer.votes_per_day(self.user.id), 3)
+        self.assertEqual(leaderboard.get_leaderboard(Team.shared_pool().voting_date()),
+                         [leaderboard.LeaderboardEntry(1, self.restaurants[0].id, 1.75, 1)])
+
+    def test_cast_vote_limit_exceeded(self):
+        today = datetime.date.today()
+        Vote.objects.create(user=self.user, restaurant=self.restaurants[0], date=today, score=1, amount=1)
+
+        vote_buffer.cast_vote(self.user.id, self.restaurants[1].id, max_votes=2, votes_weights=[1])
+        with self.assertRaises(VotesLimitExceeded):
+            vote_buffer.cast_vote(self.user.id, self.restaurants[0].id, max_votes=2, votes_weights=[1])
+
+    def test_cast_vote_restaurant_not_found(self):
+        with self.assertRaises(Restaurant.DoesNotExist):
+            vote_buffer.cast_vote(self.user.id, 999, max_votes=1, votes_weights=[1])
+
+    def test_flush(self):
+        today = datetime.date.today()
+        Vote.objects.create(user=self.user, restaurant=self.restaurants[0], date=today, score=1, amount=1)
+        DailyRestaurantTally.objects.rebuild(today)
+
+        vote_buffer.cast_vote(self.user.id, self.restaurants[0].id, max_votes=5, votes_weights=[1, 0.5])
+        vote_buffer.cast_vote(self.user.id, self.restaurants[1].id, max_votes=5, votes_weights=[1, 0.5])
+
+        self.assertEqual(vote_buffer.flush(), 2)
+        self.assertEqual(Vote.objects.get(user=self.user, restaurant=self.restaurants[0]).score, 1.5)
+        self.assertEqual(Vote.objects.get(user=self.user, restaurant=self.restaurants[1]).amount, 1)
+        self.assertEqual(
+            list(DailyRestaurantTally.objects.order_by('restaurant_id').values_list('score_sum', 'voter_count')),
+            [(1.5, 1), (1.0, 1)]
+        )
+        self.assertEqual(vote_buffer.flush(), 0)
+
+    def test_flush_any_voting_day(self):
+        # e.g. a team in Honolulu with the cutoff at 15:00 votes for the day before yesterday at 00:30 UTC
+        date = datetime.date.today() - datetime.timedelta(days=2)
+        vote_buffer.cast_vote(self.user.id, self.restaurants[0].id, max_votes=5, votes_weights=[1], date=date)
+
+        self.assertEqual(vote_buffer.flush(), 1)
+        self.assertEqual(Vote.objects.get().date, date)
+        self.assertFalse(get_redis().exists(vote_buffer.DIRTY_DATES_KEY))
+
+    def test_flush_skips_deleted_restaurants(self):
+        restaurant = Restaurant.objects.create(name='Closed')
+        vote_buffer.cast_vote(self.user.id, restaurant.id, max_votes=5, votes_weights=[1])
+        vote_buffer.cast_vote(self.user.id, self.restaurants[0].id, max_votes=5, votes_weights=[1])
+        restaurant.delete()
+
+        self.assertEqual(vote_buffer.flush(), 1)
+        self.assertEqual(Vote.objects.count(), 1)
+
+    @eager_tasks()
+    @override_settings(VOTES_WRITE_BEHIND=True)
+    def test_determine_winner_flushes_votes(self):
+        vote_buffer.cast_vote(self.user.id, self.restaurants[1].id, max_votes=5, votes_weights=[1])
+
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + datetime.timedelta(days=1)):
+            determine_winner()
+
+        winner_restaurant = WinnerRestaurant.objects.get()
+        self.assertEqual(winner_restaurant.restaurant, self.restaurants[1])
+        self.assertEqual(winner_restaurant.score, 1.0)
+
+
+class LeaderboardTestCase(TestCase):
+    fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.all()
+        cls.restaurants = Restaurant.objects.all()
+
+    def setUp(self):
+        cache.clear()
+        clear_redis_keys('leaderboard:*')
+
+    def test_record_votes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Vote.objects.cast_vote(self.users[0].id, self.restaurants[0].id, max_votes=5, votes_weights=[1, 0.5])
+            Vote.objects.cast_vote(self.users[0].id, self.restaurants[0].id, max_votes=5, votes_weights=[1, 0.5])
+            Vote.objects.cast_vote(self.users[1].id, self.restaurants[1].id, max_votes=5, votes_weights=[1, 0.5])
+
+        self.assertEqual(leaderboard.get_leaderboard(Team.shared_pool().voting_date()), [
+            leaderboard.LeaderboardEntry(1, self.restaurants[0].id, 1.5, 1),
+            leaderboard.LeaderboardEntry(2, self.restaurants[1].id, 1.0, 1),
+        ])
+
+    def test_ranking_ties(self):
+        today = datetime.date.today()
+        leaderboard.rebuild([
+            (self.restaurants[0].id, 3.0, 2),
+            (self.restaurants[1].id, 4.0, 3),
+            (self.restaurants[2].id, 4.0, 3),
+        ], today)
+
+        self.assertEqual(
+            [(entry.rank, entry.restaurant_id) for entry in leaderboard.get_leaderboard(today)],
+            [(1, self.restaurants[1].id), (1, self.restaurants[2].id), (3, self.restaurants[0].id)]
+        )
+
+    def test_rebuild_command(self):
+        today = Team.shared_pool().voting_date()
+        Vote.objects.create(user=self.users[0], restaurant=self.restaurants[0], date=today, score=3, amount=3)
+        Vote.objects.create(user=self.users[0], restaurant=self.restaurants[1], date=today, score=1, amount=1)
+        Vote.objects.create(user=self.users[1], restaurant=self.restaurants[1], date=today, score=2, amount=2)
+        DailyRestaurantTally.objects.rebuild(today)
+        leaderboard.record_vote(self.restaurants[2].id, 10, new_voter=True, date=today)
+
+        call_command('rebuild_leaderboard', stdout=io.StringIO())
+
+        self.assertEqual(leaderboard.get_leaderboard(today), [
+            leaderboard.LeaderboardEntry(1, self.restaurants[1].id, 3.0, 2),
+            leaderboard.LeaderboardEntry(2, self.restaurants[0].id, 3.0, 1),
+        ])
+
+
+class CheckTalliesCommandTestCase(TestCase):
+    fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json']
+
+    def setUp(self):
+        cache.clear()
+
+    def test_consistent_tallies(self):
+        user, restaurant = User.objects.first(), Restaurant.objects.first()
+        Vote.objects.cast_vote(user.id, restaurant.id, max_votes=5, votes_weights=[1, 0.5])
+        Vote.objects.cast_vote(user.id, restaurant.id, max_votes=5, votes_weights=[1, 0.5])
+
+        call_command('check_tallies', stdout=io.StringIO())
+
+    def test_inconsistent_tallies(self):
+        today = datetime.date.today()
+        user, restaurant = User.objects.first(), Restaurant.objects.first()
+        Vote.objects.create(user=user, restaurant=restaurant, date=today, score=1, amount=1)
+
+        with self.assertRaises(CommandError):
+            call_command('check_tallies', stdout=io.StringIO())
+
+        call_command('check_tallies', fix=True, stdout=io.StringIO())
+        call_command('check_tallies', stdout=io.StringIO())
+        self.assertEqual(DailyRestaurantTally.objects.get().score_sum, 1.0)
+
+
+class LocalCachedDatabaseBackendTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.backend = config._backend
+        self.backend._bump_version()
+
+    def test_reads_are_served_from_process_memory(self):
+        config.MAX_VOTES_PER_DAY = 3
+        self.assertEqual(config.MAX_VOTES_PER_DAY, 3)
+        self.assertEqual(config.VOTES_WEIGHTS, [1, 0.5, 0.25])
+
+        with self.assertNumQueries(0), mock.patch.object(cache, 'get', wraps=cache.get) as cache_get:
+            for _ in range(10):
+                self.assertEqual(config.MAX_VOTES_PER_DAY, 3)
+                self.assertEqual(config.VOTES_WEIGHTS, [1, 0.5, 0.25])
+        cache_get.assert_not_called()
+
+    def test_set_invalidates_values(self):
+        config.MAX_VOTES_PER_DAY = 3
+        self.assertEqual(config.MAX_VOTES_PER_DAY, 3)
+        config.MAX_VOTES_PER_DAY = 7
+        self.assertEqual(config.MAX_VOTES_PER_DAY, 7)
+
+    def test_change_from_other_process_is_applied_after_timeout(self):
+        config.MAX_VOTES_PER_DAY = 3
+        self.assertEqual(config.MAX_VOTES_PER_DAY, 3)
+
+        # other process changes the value and bumps the shared version
+        self.backend._values['MAX_VOTES_PER_DAY'] = 3
+        cache.set(self.backend.add_prefix('MAX_VOTES_PER_DAY'), 7)
+        self.backend._model.objects.filter(key=self.backend.add_prefix('MAX_VOTES_PER_DAY')).update(value=7)
+        cache.set(self.backend.add_prefix(self.backend.version_key), 1, timeout=None)
+        self.assertEqual(config.MAX_VOTES_PER_DAY, 3)
+
+        with mock.patch('base.constance_backend.time.monotonic', return_value=time.monotonic() + 60):
+            self.assertEqual(config.MAX_VOTES_PER_DAY, 7)
+
+
+class PruneExpiredTokensTestCase(TestCase):
+    fixtures = ['fixtures/tests/users.json']
+
+    def test_prune_expired_tokens(self):
+        user = User.objects.first()
+        for _ in range(3):
+            AuthToken.objects.create(user, expiry=datetime.timedelta(hours=-1))
+        valid_token, _ = AuthToken.objects.create(user)
+
+        with mock.patch('base.tasks.PRUNE_TOKENS_BATCH_SIZE', 2):
+            self.assertEqual(prune_expired_tokens(), 3)
+        self.assertEqual(list(AuthToken.objects.all()), [valid_token])
+
+
+class QueryPlansTestCase(TestCase):
+    date = datetime.date(2023, 4, 16)
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(User(username=f'user{i}') for i in range(200))
+        restaurants = Restaurant.objects.bulk_create(Restaurant(name=f'Restaurant {i}') for i in range(10))
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO base_vote (user_id, restaurant_id, date, amount, score)
+                SELECT user_id, restaurant_id, %s::date - day, 1, 1
+                FROM unnest(%s::bigint[]) AS user_id, unnest(%s::bigint[]) AS restaurant_id,
+                     generate_series(0, 29) AS day
+            """, [cls.date, [user.id for user in users], [restaurant.id for restaurant in restaurants]])
+            cursor.execute("""
+                INSERT INTO base_winnerrestaurant (restaurant_id, date, score, unique_voters)
+                SELECT restaurant_id, %s::date - day, 1, 1
+                FROM unnest(%s::bigint[]) AS restaurant_id, generate_series(0, 999) AS day
+            """, [cls.date, [restaurant.id for restaurant in restaurants]])
+            cursor.execute('ANALYZE base_vote, base_winnerrestaurant')
+        cls.user = users[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def assertNoSeqScan(self, func, small_tables: tuple[str, ...] = ()):
+        with CaptureQueriesContext(connection) as queries:
+            func()
+
+        with connection.cursor() as cursor:
+            for query in queries:
+                cursor.execute(f"EXPLAIN {query['sql']}")
+                plan = [row[0] for row in cursor.fetchall()]
+                seq_scans = [line for line in plan if 'Seq Scan' in line
+                             and not any(f'Seq Scan on {table} ' in line for table in small_tables)]
+                self.assertFalse(seq_scans, msg=f"{query['sql']}\n" + '\n'.join(plan))
+
+    def test_votes_per_day(self):
+        self.assertNoSeqScan(lambda: Vote.objects.votes_per_day(self.user.id, self.date))
+
+    def test_aggregate_votes(self):
+        self.assertNoSeqScan(lambda: list(DailyRestaurantTally.objects.aggregate_votes(self.date)))
+
+    def test_simulate_winners(self):
+        # the restaurants are joined for their teams, the table is scanned as a whole being a lot smaller
+        self.assertNoSeqScan(lambda: WinnerRestaurant.objects.simulate(self.date, self.date, [1, 0.5]),
+                             small_tables=('base_restaurant', ))
+
+    def test_winners_by_date(self):
+        self.assertNoSeqScan(lambda: list(WinnerRestaurant.objects.filter(date=self.date).values_list('restaurant_id')))
+
+    def test_search_restaurants(self):
+        # the table is too small for the planner to pick the indexes by itself
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            sql, params = Restaurant.objects.search('restaurnt 1')[:50].query.sql_with_params()
+            cursor.execute(f'EXPLAIN {sql}', params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        for index in ['base_restaurant_search_idx', 'base_restaurant_name_trgm_idx', 'base_restaurant_desc_trgm_idx']:
+            self.assertIn(index, plan)
+        self.assertNotIn('Seq Scan', plan)
+
+
+class RestaurantSearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.pizza = Restaurant.objects.create(name='Pizza Place', description='Wood-fired pizzas')
+        cls.noodles = Restaurant.objects.create(name='Noodle Bar', description='Noodles and a pizza of the day')
+        Restaurant.objects.create(name='Burger Lab', description=None)
+
+    def test_search(self):
+        self.assertEqual(list(Restaurant.objects.search('pizza')), [self.pizza, self.noodles])
+        self.assertEqual(list(Restaurant.objects.search('Pizza Plaec')), [self.pizza])
+        self.assertEqual(list(Restaurant.objects.search('noodle')), [self.noodles])
+        self.assertFalse(Restaurant.objects.search('sushi').exists())
+
+    def test_search_fallback(self):
+        # other databases than Postgres match a substring
+        with mock.patch.object(connection, 'vendor', 'sqlite'):
+            self.assertEqual(list(Restaurant.objects.search('PIZZA')), [self.pizza, self.noodles])
+            self.assertFalse(Restaurant.objects.search('piza').exists())
+
+
+class VotePartitionsTestCase(TestCase):
+    fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json']
+
+    def setUp(self):
+        self.user, self.restaurant = User.objects.first(), Restaurant.objects.first()
+
+    def create_vote(self, date: datetime.date) -> Vote:
+        return Vote.objects.create(user=self.user, restaurant=self.restaurant, date=date, amount=1, score=1)
+
+    def count_rows(self, table: str) -> int:
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {table}')
+            return cursor.fetchone()[0]
+
+    def test_create_partition_moves_default_votes(self):
+        self.create_vote(datetime.date(2023, 4, 16))
+        self.assertEqual(self.count_rows('base_vote_default'), 1)
+
+        self.assertTrue(partitions.create_partition(datetime.date(2023, 4, 16)))
+        self.assertFalse(partitions.create_partition(datetime.date(2023, 4, 1)))
+        self.assertEqual(self.count_rows('base_vote_default'), 0)
+        self.assertEqual(self.count_rows('base_vote_y2023m04'), 1)
+        self.assertIn(datetime.date(2023, 4, 1), partitions.get_partitions())
+
+    def test_create_future_partitions(self):
+        current_month = datetime.date.today().replace(day=1)
+        self.assertEqual(partitions.create_future_partitions(3), [])
+        self.assertEqual(partitions.create_future_partitions(4), [partitions.add_months(current_month, 4)])
+
+    def test_daily_query_touches_single_partition(self):
+        partitions.create_partition(datetime.date(2023, 4, 1))
+        partitions.create_partition(datetime.date(2023, 5, 1))
+        self.create_vote(datetime.date(2023, 4, 16))
+
+        with CaptureQueriesContext(connection) as queries:
+            list(DailyRestaurantTally.objects.aggregate_votes(datetime.date(2023, 4, 16)))
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN {queries[0]['sql']}")
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn('base_vote_y2023m04', plan)
+        self.assertNotIn('base_vote_y2023m05', plan)
+        self.assertNotIn('base_vote_default', plan)
+
+    def test_archive_and_restore(self):
+        partitions.create_partition(datetime.date(2023, 4, 1))
+        vote = self.create_vote(datetime.date(2023, 4, 16))
+        today_vote = Vote.objects.cast_vote(self.user.id, self.restaurant.id, max_votes=5, votes_weights=[1])
+
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('archive_votes', dir=directory, stdout=io.StringIO())
+            self.assertTrue(os.path.exists(os.path.join(directory, 'base_vote_y2023m04.csv.gz')))
+            self.assertNotIn(datetime.date(2023, 4, 1), partitions.get_partitions())
+            self.assertEqual(list(Vote.objects.values_list('id', flat=True)), [today_vote.id])
+
+            call_command('archive_votes', dir=directory, restore_months=[datetime.date(2023, 4, 1)],
+                         stdout=io.StringIO())
+
+        self.assertEqual(Vote.objects.get(date=datetime.date(2023, 4, 16)).id, vote.id)
+        self.assertEqual(Vote.objects.count(), 2)
+
+    def test_restore_missing_archive(self):
+        with tempfile.TemporaryDirectory() as directory, self.assertRaises(CommandError):
+            call_command('archive_votes', dir=directory, restore_months=[datetime.date(2023, 4, 1)],
+                         stdout=io.StringIO())
+
+
+class RestaurantStatsTestCase(TestCase):
+    fixtures = ['fixtures/tests/restaurants.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.first, cls.second = Restaurant.objects.order_by('id')[:2]
+        # the first restaurant wins on Monday, Tuesday and Thursday, the second one on Wednesday
+        cls.dates = [datetime.date(2023, 4, 10) + datetime.timedelta(days=days) for days in range(4)]
+        for date, first_score in zip(cls.dates, [3, 3, 1, 3]):
+            DailyRestaurantTally.objects.create(date=date, restaurant=cls.first, score_sum=first_score, voter_count=2)
+            DailyRestaurantTally.objects.create(date=date, restaurant=cls.second, score_sum=2, voter_count=1)
+
+    def assertStats(self):
+        first = RestaurantStats.objects.get(restaurant=self.first)
+        second = RestaurantStats.objects.get(restaurant=self.second)
+        self.assertEqual((first.total_wins, first.current_win_streak, first.longest_win_streak), (3, 1, 2))
+        self.assertEqual(first.last_win_date, datetime.date(2023, 4, 14))
+        self.assertEqual((first.voted_days, first.total_score, first.total_voters), (4, 10, 8))
+        self.assertEqual(first.average_daily_score, 2.5)
+        self.assertEqual((second.total_wins, second.current_win_streak, second.longest_win_streak), (1, 0, 1))
+
+        self.assertEqual(
+            list(RestaurantPeriodStats.objects.filter(restaurant=self.first).order_by('period')
+                 .values_list('period', 'start', 'score_sum', 'voter_count', 'voted_days', 'wins')),
+            [
+                ('month', datetime.date(2023, 4, 1), 10, 8, 4, 3),
+                ('week', datetime.date(2023, 4, 10), 10, 8, 4, 3),
+            ]
+        )
+
+    def test_roll_up(self):
+        for date in self.dates:
+            self.assertEqual(RestaurantStats.objects.roll_up(date), 2)
+        self.assertEqual(RestaurantStats.objects.roll_up(self.dates[-1]), 0)
+        self.assertStats()
+
+    def test_backfill(self):
+        call_command('backfill_restaurant_stats', stdout=io.StringIO())
+        self.assertStats()
 
 
 class DetermineTodayWinnerTestCase(TestCase):
@@ -16,20 +561,38 @@ class DetermineTodayWinnerTestCase(TestCase):
         cls.user = User.objects.first()
         cls.restaurants = Restaurant.objects.all()
 
-    def test_determine_winner(self):
-        Vote.objects.create(user=self.user, restaurant=self.restaurants[0], score=4, amount=2)
-        Vote.objects.create(user=self.user, restaurant=self.restaurants[1], score=2, amount=1)
+    def setUp(self):
+        self.enterContext(eager_tasks())
 
-        with mock.patch('base.tasks.datetime', wraps=datetime) as mock_datetime:
-            mock_datetime.date.today.return_value = datetime.date.today() + datetime.timedelta(days=1)
+    def test_determine_winner(self):
+        today = datetime.date.today()
+        Vote.objects.create(user=self.user, restaurant=self.restaurants[0], date=today, score=4, amount=2)
+        Vote.objects.create(user=self.user, restaurant=self.restaurants[1], date=today, score=2, amount=1)
+        DailyRestaurantTally.objects.rebuild(today)
 
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + datetime.timedelta(days=1)):
             determine_winner()
 
-            winner_restaurant = WinnerRestaurant.objects.filter(date=datetime.date.today()).first()
+            tomorrow = today + datetime.timedelta(days=1)
+            winner_restaurant = WinnerRestaurant.objects.filter(date=tomorrow).first()
             self.assertIsNotNone(winner_restaurant)
             self.assertEqual(winner_restaurant.restaurant, self.restaurants[0])
             self.assertEqual(winner_restaurant.score, 4.0)
             self.assertEqual(winner_restaurant.unique_voters, 1)
+            self.assertEqual(RestaurantStats.objects.get(restaurant=self.restaurants[0]).total_wins, 1)
+
+    def test_determine_winner_invalidates_winners_cache(self):
+        today = datetime.date.today()
+        tomorrow = today + datetime.timedelta(days=1)
+        cache_key = WinnerRestaurant.objects.list_cache_key.format(date=tomorrow)
+        cache.set(cache_key, {'data': []})
+        Vote.objects.create(user=self.user, restaurant=self.restaurants[0], date=today, score=1, amount=1)
+        DailyRestaurantTally.objects.rebuild(today)
+
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + datetime.timedelta(days=1)):
+            determine_winner()
+
+        self.assertIsNone(cache.get(cache_key))
 
     def test_determine_winner_no_votes(self):
         determine_winner()
@@ -47,12 +610,12 @@ class DetermineTodayWinnerTestCase(TestCase):
         Vote.objects.create(user=users[0], restaurant=self.restaurants[1], date=vote_date, score=1, amount=1)
         Vote.objects.create(user=users[1], restaurant=self.restaurants[1], date=vote_date, score=1, amount=1)
         Vote.objects.create(user=users[2], restaurant=self.restaurants[1], date=vote_date, score=2, amount=2)
+        DailyRestaurantTally.objects.rebuild(vote_date)
 
-        with mock.patch('base.tasks.datetime', wraps=datetime) as mock_datetime:
-            mock_datetime.date.today.return_value = datetime.date.today() + datetime.timedelta(days=1)
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + datetime.timedelta(days=1)):
             determine_winner()
 
-            winners = WinnerRestaurant.objects.filter(date=vote_date)
+            winners = WinnerRestaurant.objects.filter(date=vote_date + datetime.timedelta(days=1))
             self.assertIsNotNone(winners)
             self.assertEqual(len(winners), 1)
 
@@ -74,13 +637,12 @@ class DetermineTodayWinnerTestCase(TestCase):
                     score=1,
                     amount=1
                 )
+        DailyRestaurantTally.objects.rebuild(vote_date)
 
-        with mock.patch('base.tasks.datetime', wraps=datetime) as mock_datetime:
-            mock_datetime.date.today.return_value = datetime.date.today() + datetime.timedelta(days=1)
-
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + datetime.timedelta(days=1)):
             determine_winner()
 
-            winners = WinnerRestaurant.objects.filter(date=vote_date)
+            winners = WinnerRestaurant.objects.filter(date=vote_date + datetime.timedelta(days=1))
             self.assertIsNotNone(winners)
             self.assertEqual(len(winners), 3)
             self.assertEqual(
@@ -91,3 +653,287 @@ class DetermineTodayWinnerTestCase(TestCase):
             for winner in winners:
                 self.assertEqual(winner.score, 3.0)
                 self.assertEqual(winner.unique_voters, 3)
+
+
+class TeamsTestCase(TestCase):
+    fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.order_by('pk')
+        cls.shared = Restaurant.objects.order_by('pk').first()
+        cls.team = Team.objects.create(name='Team')
+        cls.team.members.add(cls.users[0])
+        cls.team_restaurants = [Restaurant.objects.create(team=cls.team, name=f'Team {i}') for i in range(2)]
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(eager_tasks())
+
+    def test_cast_vote_of_another_team(self):
+        with self.assertRaises(Restaurant.DoesNotExist):
+            Vote.objects.cast_vote(self.users[0].id, self.shared.id, max_votes=5, votes_weights=[1],
+                                   team=self.team)
+        with self.assertRaises(Restaurant.DoesNotExist):
+            Vote.objects.cast_votes(self.users[0].id, {self.team_restaurants[0].id: 1}, max_votes=5,
+                                    votes_weights=[1])
+
+        vote = Vote.objects.cast_vote(self.users[0].id, self.team_restaurants[0].id, max_votes=5, votes_weights=[1],
+                                      team=self.team)
+        self.assertEqual(vote.restaurant_id, self.team_restaurants[0].id)
+
+    def test_determine_winner_per_team(self):
+        today = datetime.date.today()
+        Vote.objects.create(user=self.users[0], restaurant=self.shared, date=today, score=1, amount=1)
+        Vote.objects.create(user=self.users[0], restaurant=self.team_restaurants[0], date=today, score=1, amount=1)
+        Vote.objects.create(user=self.users[1], restaurant=self.team_restaurants[1], date=today, score=3, amount=2)
+        DailyRestaurantTally.objects.rebuild(today)
+
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + datetime.timedelta(days=1)):
+            determine_winner()
+
+        self.assertEqual(
+            sorted(WinnerRestaurant.objects.values_list('team_id', 'restaurant_id'), key=str),
+            sorted([(None, self.shared.id), (self.team.id, self.team_restaurants[1].id)], key=str)
+        )
+        self.assertEqual(RestaurantStats.objects.get(restaurant=self.shared).total_wins, 1)
+        self.assertEqual(RestaurantStats.objects.get(restaurant=self.team_restaurants[0]).total_wins, 0)
+
+    def test_determine_team_winner_twice(self):
+        date = datetime.date.today() - datetime.timedelta(days=1)
+        DailyRestaurantTally.objects.create(date=date, restaurant=self.team_restaurants[0], score_sum=1, voter_count=1)
+
+        self.assertEqual(determine_team_winner(date.isoformat(), self.team.id), 1)
+        self.assertEqual(determine_team_winner(date.isoformat(), self.team.id), 0)
+        self.assertEqual(WinnerRestaurant.objects.filter(team=self.team).count(), 1)
+        self.assertEqual(RestaurantStats.objects.get(restaurant=self.team_restaurants[0]).total_wins, 1)
+
+
+class WinnersScheduleTestCase(TestCase):
+    fixtures = ['fixtures/tests/users.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.team = Team.objects.create(name='Tokyo', timezone='Asia/Tokyo', cutoff=datetime.time(11, 30))
+        cls.restaurant = Restaurant.objects.create(team=cls.team, name='Ramen')
+
+    def setUp(self):
+        cache.clear()
+        get_redis().delete(schedule.SCHEDULE_KEY)
+        self.enterContext(eager_tasks())
+
+    @staticmethod
+    def utc(*args) -> datetime.datetime:
+        return datetime.datetime(*args, tzinfo=datetime.timezone.utc)
+
+    def test_voting_date(self):
+        # 10:00 and 12:00 in Tokyo
+        self.assertEqual(voting_date('Asia/Tokyo', datetime.time(11, 30), self.utc(2023, 4, 17, 1)),
+                         datetime.date(2023, 4, 16))
+        self.assertEqual(voting_date('Asia/Tokyo', datetime.time(11, 30), self.utc(2023, 4, 17, 3)),
+                         datetime.date(2023, 4, 17))
+        self.assertEqual(voting_date('UTC', datetime.time.min, self.utc(2023, 4, 17)), datetime.date(2023, 4, 17))
+
+    def test_next_cutoff(self):
+        self.assertEqual(next_cutoff('Asia/Tokyo', datetime.time(11, 30), self.utc(2023, 4, 17, 1)),
+                         self.utc(2023, 4, 17, 2, 30))
+        self.assertEqual(next_cutoff('Asia/Tokyo', datetime.time(11, 30), self.utc(2023, 4, 17, 2, 30)),
+                         self.utc(2023, 4, 18, 2, 30))
+        # the clocks go forward in Berlin on 2023-03-26
+        self.assertEqual(next_cutoff('Europe/Berlin', datetime.time(12), self.utc(2023, 3, 25, 12)),
+                         self.utc(2023, 3, 26, 10))
+
+    def test_seconds_until_voting_day_end(self):
+        # the voting day of 2023-04-16 in Tokyo ends at 02:30 UTC on 2023-04-17
+        date = datetime.date(2023, 4, 16)
+        self.assertEqual(self.team.seconds_until_voting_day_end(date, self.utc(2023, 4, 17, 1)), 90 * 60)
+        self.assertEqual(self.team.seconds_until_voting_day_end(date, self.utc(2023, 4, 17, 3)), 1)
+
+    def test_votes_counter_kept_till_cutoff(self):
+        user = User.objects.first()
+        date = self.team.voting_date()
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set, self.captureOnCommitCallbacks(execute=True):
+            Vote.objects.cast_vote(user.id, self.restaurant.id, max_votes=5, votes_weights=[1], date=date,
+                                   team=self.team)
+
+        key = Vote.objects.votes_per_day_cache_key.format(date=date, user_id=user.id)
+        timeouts = [call.kwargs['timeout'] for call in cache_set.call_args_list if call.args[0] == key]
+        self.assertEqual(len(timeouts), 1)
+        self.assertAlmostEqual(timeouts[0], self.team.seconds_until_voting_day_end(date), delta=5)
+
+    def test_pop_due(self):
+        teams = [Team.shared_pool(), self.team]
+        self.assertEqual(schedule.pop_due(teams, self.utc(2023, 4, 17, 1)), [])
+
+        due = schedule.pop_due(teams, self.utc(2023, 4, 17, 2, 31))
+        self.assertEqual(due, [(self.team, datetime.date(2023, 4, 16))])
+        self.assertEqual(schedule.pop_due(teams, self.utc(2023, 4, 17, 2, 32)), [])
+
+        # the missed days are caught up one at a time, the shared pool is dropped being left out of the teams
+        due = schedule.pop_due([self.team], self.utc(2023, 4, 20))
+        self.assertEqual(due, [(self.team, datetime.date(2023, 4, 17))])
+        due = schedule.pop_due([self.team], self.utc(2023, 4, 20))
+        self.assertEqual(due, [(self.team, datetime.date(2023, 4, 18))])
+        self.assertIsNone(get_redis().zscore(schedule.SCHEDULE_KEY, '0'))
+
+    def test_run_winners_schedule(self):
+        DailyRestaurantTally.objects.create(date=datetime.date(2023, 4, 16), restaurant=self.restaurant,
+                                            score_sum=2, voter_count=1)
+
+        with mock.patch('django.utils.timezone.now', return_value=self.utc(2023, 4, 17, 1)):
+            self.assertEqual(run_winners_schedule(), 0)
+        with mock.patch('django.utils.timezone.now', return_value=self.utc(2023, 4, 17, 2, 31)):
+            self.assertEqual(run_winners_schedule(), 1)
+
+        winner = WinnerRestaurant.objects.get(team=self.team)
+        self.assertEqual((winner.restaurant, winner.date), (self.restaurant, datetime.date(2023, 4, 17)))
+
+
+class ReplicaRouterTestCase(TestCase):
+    def test_router(self):
+        router = db_router.ReplicaRouter()
+        with db_router.replica_reads():
+            # without a replica configured
+            self.assertEqual(router.db_for_read(Restaurant), 'default')
+
+        with mock.patch('base.db_router.has_replica', return_value=True):
+            self.assertEqual(router.db_for_read(Restaurant), 'default')
+            with db_router.replica_reads():
+                self.assertEqual(router.db_for_read(Restaurant), 'replica')
+                self.assertEqual(router.db_for_write(Restaurant), 'default')
+
+        self.assertFalse(db_router.reads_from_replica())
+        self.assertFalse(router.allow_migrate('replica', 'base'))
+        self.assertTrue(router.allow_migrate('default', 'base'))
+
+
+class GenerateDataTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_generate_data(self):
+        out = io.StringIO()
+        call_command('generate_data', users=20, restaurants=5, days=10, seed=1, stdout=out)
+        self.assertIn('Generated 20 users, 5 restaurants', out.getvalue())
+
+        today = datetime.date.today()
+        votes = Vote.objects.filter(user__username__startswith='generated-user-')
+        self.assertEqual(votes.values('date').distinct().count(), 10)
+        self.assertEqual(votes.aggregate(date=Max('date'))['date'], today - datetime.timedelta(days=1))
+        self.assertLessEqual(
+            votes.values('user', 'date').annotate(amount=Sum('amount')).aggregate(Max('amount'))['amount__max'],
+            config.MAX_VOTES_PER_DAY
+        )
+
+        # the most popular restaurant gets the most votes
+        restaurant_votes = votes.values('restaurant').annotate(amount=Sum('amount')).order_by('-amount')
+        self.assertEqual(restaurant_votes[0]['restaurant'], Restaurant.objects.get(name='generated-restaurant-0').pk)
+
+        call_command('check_tallies', dates=[today - datetime.timedelta(days=1)], stdout=io.StringIO())
+        self.assertEqual(WinnerRestaurant.objects.values('date').distinct().count(), 9)
+        self.assertFalse(WinnerRestaurant.objects.filter(date=today).exists())
+        self.assertEqual(RestaurantStats.objects.aggregate(Max('rolled_up_date'))['rolled_up_date__max'],
+                         today - datetime.timedelta(days=2))
+
+        with self.assertRaises(CommandError):
+            call_command('generate_data', users=1, restaurants=1, days=1)
+
+    def test_generate_votes_reproducible(self):
+        dates = [datetime.date(2023, 4, 15), datetime.date(2023, 4, 16)]
+        votes = list(generator.generate_votes([1, 2, 3], [1, 2], dates, max_votes=3, votes_weights=[1, 0.5], seed=1))
+        self.assertEqual(votes, list(generator.generate_votes([1, 2, 3], [1, 2], dates, 3, [1, 0.5], seed=1)))
+        for user_id, restaurant_id, date, amount, score in votes:
+            self.assertEqual(score, 1 + 0.5 * (amount - 1))
+
+
+class ImportRestaurantsCommandTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Restaurant.objects.create(name='Restaurant 0', description='Old')
+        self.team = Team.objects.create(name='Team')
+
+    def write_file(self, suffix: str, content: str) -> str:
+        file = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False)
+        self.addCleanup(os.remove, file.name)
+        with file:
+            file.write(content)
+        return file.name
+
+    def test_import_chunks(self):
+        path = self.write_file('.csv', 'name,description\n' + ''.join(
+            f'Restaurant {num},Restaurant #{num}\n' for num in range(5)
+        ) + 'Restaurant 0,Restaurant #0\n,\n')
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_restaurants', path, chunk_size=2, stdout=out, stderr=err)
+        self.assertIn('Created 4, updated 1 and left 1 restaurants unchanged, 1 rows were invalid', out.getvalue())
+        self.assertIn('Line 8:', err.getvalue())
+        self.assertEqual(
+            list(Restaurant.objects.order_by('name').values_list('name', 'description')),
+            [(f'Restaurant {num}', f'Restaurant #{num}') for num in range(5)]
+        )
+
+    def test_import_broken_line(self):
+        path = self.write_file('.csv', 'name\n' + ''.join(f'Restaurant {num}\n' for num in range(1, 4)))
+        with open(path, 'ab') as file:
+            file.write(b'Restaurant\xff 4\n')
+        Restaurant.objects.get_list_cache_key('/restaurants/')
+        version = cache.get(Restaurant.objects.list_cache_version_key)
+
+        with self.assertRaises(CommandError):
+            call_command('import_restaurants', path, chunk_size=2, stdout=io.StringIO())
+        # the first chunk was imported, so the cached pages are dropped
+        self.assertEqual(Restaurant.objects.filter(name__in=['Restaurant 1', 'Restaurant 2']).count(), 2)
+        self.assertNotEqual(cache.get(Restaurant.objects.list_cache_version_key), version)
+
+    def test_import_team(self):
+        path = self.write_file('.json', json.dumps({'name': 'Restaurant 0'}) + '\n')
+        with self.assertRaises(CommandError):
+            call_command('import_restaurants', path, stdout=io.StringIO())
+
+        call_command('import_restaurants', path, format='ndjson', team=self.team.id, stdout=io.StringIO())
+        self.assertEqual(list(self.team.restaurants.values_list('name', flat=True)), ['Restaurant 0'])
+        self.assertEqual(Restaurant.objects.get(team=None).description, 'Old')
+
+
+class BenchmarkTestCase(TestCase):
+    def test_summarize(self):
+        summary = benchmark.summarize([num / 1000 for num in range(1, 101)], elapsed=0.5)
+        self.assertEqual(summary['requests'], 100)
+        self.assertEqual(summary['rps'], 200)
+        self.assertEqual(summary['p50_ms'], 51)
+        self.assertEqual(summary['p99_ms'], 100)
+
+    def test_find_regressions(self):
+        baseline = [{'size': 'small', 'scenario': 'winners_list', 'mean_ms': 10, 'p99_ms': 20}]
+        results = [
+            {'size': 'small', 'scenario': 'winners_list', 'mean_ms': 11, 'p99_ms': 30},
+            {'size': 'medium', 'scenario': 'winners_list', 'mean_ms': 100, 'p99_ms': 200},
+        ]
+        self.assertEqual(benchmark.find_regressions(results, baseline, threshold=0.2),
+                         ['winners_list (small): p99_ms 20 -> 30'])
+        self.assertEqual(benchmark.find_regressions(results, baseline, threshold=0.5), [])
+
+
+class TaskMetricsTestCase(TestCase):
+    fixtures = ['fixtures/tests/users.json', 'fixtures/tests/restaurants.json']
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(eager_tasks())
+        metrics.flush()
+        get_redis().delete(metrics.METRICS_KEY)
+
+    def test_determine_winner_metrics(self):
+        date = datetime.date.today() - datetime.timedelta(days=1)
+        for restaurant in Restaurant.objects.all()[:2]:
+            Vote.objects.create(user=User.objects.first(), restaurant=restaurant, date=date, score=1, amount=1)
+        DailyRestaurantTally.objects.rebuild(date)
+
+        determine_winner.apply()
+
+        lines = metrics.render().splitlines()
+        self.assertIn('celery_tasks_total{task="base.tasks.determine_winner",state="SUCCESS"} 1', lines)
+        self.assertIn('celery_task_duration_seconds_count{task="base.tasks.determine_winner"} 1', lines)
+        self.assertIn('celery_tasks_total{task="base.tasks.determine_team_winner",state="SUCCESS"} 1', lines)
+        self.assertIn('celery_task_rows_total{task="base.tasks.determine_team_winner"} 2', lines)
@@ -0,0 +1,35 @@
+import datetime
+import zoneinfo
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+
+def validate_timezone(value: str):
+    if value not in zoneinfo.available_timezones():
+        raise ValidationError(f'Unknown timezone "{value}"')
+
+
+def voting_date(timezone_name: str, cutoff: datetime.time, now: datetime.datetime = None) -> datetime.date:
+    # the voting day ends at the cutoff of the local time, the votes after it count for the next day
+    local_now = (now or timezone.now()).astimezone(zoneinfo.ZoneInfo(timezone_name))
+    if local_now.time() < cutoff:
+        return local_now.date() - datetime.timedelta(days=1)
+    return local_now.date()
+
+
+def next_cutoff(timezone_name: str, cutoff: datetime.time, after: datetime.datetime) -> datetime.datetime:
+    tz = zoneinfo.ZoneInfo(timezone_name)
+    local_after = after.astimezone(tz)
+    cutoff_at = datetime.datetime.combine(local_after.date(), cutoff, tzinfo=tz)
+    if cutoff_at <= local_after:
+        cutoff_at = datetime.datetime.combine(local_after.date() + datetime.timedelta(days=1), cutoff, tzinfo=tz)
+    return cutoff_at
+
+
+def seconds_until_voting_day_end(timezone_name: str, cutoff: datetime.time, date: datetime.date,
+                                 now: datetime.datetime = None) -> int:
+    # the voting day of the date starts at its cutoff and ends at the next one
+    started_at = datetime.datetime.combine(date, cutoff, tzinfo=zoneinfo.ZoneInfo(timezone_name))
+    ends_at = next_cutoff(timezone_name, cutoff, started_at)
+    return max(int((ends_at - (now or timezone.now())).total_seconds()), 1)
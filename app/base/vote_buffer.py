@@ -0,0 +1,274 @@
+import datetime
+import itertools
+
+from base import leaderboard
+from base.exceptions import VotesLimitExceeded
+from base.models import Restaurant, Team, Vote
+from base.redis_client import get_async_redis, get_redis
+
+VOTES_KEY = 'vote_buffer:{date}:{user_id}'
+DIRTY_USERS_KEY = 'vote_buffer:{date}:dirty'
+# dates with not flushed votes, the voting days of the teams may be anywhere around the server's date
+DIRTY_DATES_KEY = 'vote_buffer:dirty_dates'
+# ids of the restaurants of a team, 0 stands for the shared pool. The key changes with the version of the
+# restaurant list cache, a restaurant deleted in the meantime is still voted for, its votes are dropped by the flush
+RESTAURANTS_KEY = 'vote_buffer:restaurants:{version}:{team_id}'
+KEY_TTL = 2 * 24 * 60 * 60
+FLUSH_BATCH_SIZE = 500
+
+# KEYS: user's votes hash, set of the users with not flushed votes, leaderboard scores and voters, dirty dates,
+#       restaurant ids of the team
+# ARGV: user id, max votes per day, key ttl, default weight, date, weights count, votes weights...,
+#       restaurant id and votes count pairs
+# Returns nil if the user's votes are not seeded, -1 if the limit is exceeded, -2 for a restaurant of another team
+# or a missing one and -3 if the restaurant ids are not seeded
+CAST_VOTES_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+if redis.call('EXISTS', KEYS[6]) == 0 then
+    return -3
+end
+
+local weights_count = tonumber(ARGV[6])
+local votes_start = 7 + weights_count
+
+for i = votes_start, #ARGV, 2 do
+    if redis.call('SISMEMBER', KEYS[6], ARGV[i]) == 0 then
+        return -2
+    end
+end
+
+local requested = 0
+for i = votes_start, #ARGV, 2 do
+    requested = requested + tonumber(ARGV[i + 1])
+end
+if tonumber(redis.call('HGET', KEYS[1], 'total')) + requested > tonumber(ARGV[2]) then
+    return -1
+end
+
+local results = {}
+for i = votes_start, #ARGV, 2 do
+    local restaurant_id, count = ARGV[i], tonumber(ARGV[i + 1])
+    local amount = tonumber(redis.call('HGET', KEYS[1], restaurant_id .. ':amount') or 0)
+
+    local weight = 0
+    for vote_num = amount + 1, amount + count do
+        if weights_count > 0 then
+            weight = weight + tonumber(ARGV[6 + math.min(vote_num, weights_count)])
+        else
+            weight = weight + tonumber(ARGV[4])
+        end
+    end
+
+    redis.call('HINCRBY', KEYS[1], restaurant_id .. ':amount', count)
+    local score = redis.call('HINCRBYFLOAT', KEYS[1], restaurant_id .. ':score', weight)
+
+    redis.call('ZINCRBY', KEYS[3], weight, restaurant_id)
+    if amount == 0 then
+        redis.call('ZINCRBY', KEYS[4], 1, restaurant_id)
+    end
+
+    table.insert(results, amount + count)
+    table.insert(results, score)
+end
+
+redis.call('HINCRBY', KEYS[1], 'total', requested)
+redis.call('SADD', KEYS[2], ARGV[1])
+redis.call('SADD', KEYS[5], ARGV[5])
+for _, key in ipairs(KEYS) do
+    redis.call('EXPIRE', key, ARGV[3])
+end
+return results
+"""
+
+# KEYS: user's votes hash
+# ARGV: key ttl, field/value pairs
+SEED_VOTES_SCRIPT = """
+for i = 2, #ARGV, 2 do
+    redis.call('HSETNX', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+"""
+
+# KEYS: dirty dates, set of the users with not flushed votes of the date
+# ARGV: date
+# The date is forgotten only if no vote was cast since its users were flushed
+FORGET_DATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    redis.call('SREM', KEYS[1], ARGV[1])
+end
+"""
+
+
+def cast_vote(user_id: int, restaurant_id: int, max_votes: int, votes_weights: list[float],
+              date: datetime.date = None, default_weight: float = 1.0, team: Team = None) -> Vote:
+    return cast_votes(user_id, {restaurant_id: 1}, max_votes, votes_weights, date, default_weight, team)[0]
+
+
+def cast_votes(user_id: int, votes: dict[int, int], max_votes: int, votes_weights: list[float],
+               date: datetime.date = None, default_weight: float = 1.0, team: Team = None) -> list[Vote]:
+    team = team or Team.shared_pool()
+    if not date:
+        date = team.voting_date()
+
+    restaurants_key = RESTAURANTS_KEY.format(version=Restaurant.objects.get_list_cache_version(), team_id=team.pk or 0)
+    cast = get_redis().register_script(CAST_VOTES_SCRIPT)
+    keys, args = _cast_votes_params(user_id, votes, max_votes, votes_weights, date, default_weight, restaurants_key)
+
+    results = cast(keys=keys, args=args)
+    if results is None:
+        _seed_votes(user_id, date)
+        results = cast(keys=keys, args=args)
+    if results == -3:
+        _seed_restaurants(restaurants_key, team)
+        results = cast(keys=keys, args=args)
+
+    return _cast_votes_results(user_id, votes, date, results)
+
+
+async def acast_vote(user_id: int, restaurant_id: int, max_votes: int, votes_weights: list[float],
+                     date: datetime.date = None, default_weight: float = 1.0, team: Team = None) -> Vote:
+    return (await acast_votes(
+        user_id, {restaurant_id: 1}, max_votes, votes_weights, date, default_weight, team
+    ))[0]
+
+
+async def acast_votes(user_id: int, votes: dict[int, int], max_votes: int, votes_weights: list[float],
+                      date: datetime.date = None, default_weight: float = 1.0, team: Team = None) -> list[Vote]:
+    team = team or Team.shared_pool()
+    if not date:
+        date = team.voting_date()
+
+    restaurants_key = RESTAURANTS_KEY.format(
+        version=await Restaurant.objects.aget_list_cache_version(), team_id=team.pk or 0
+    )
+    cast = get_async_redis().register_script(CAST_VOTES_SCRIPT)
+    keys, args = _cast_votes_params(user_id, votes, max_votes, votes_weights, date, default_weight, restaurants_key)
+
+    results = await cast(keys=keys, args=args)
+    if results is None:
+        await _aseed_votes(user_id, date)
+        results = await cast(keys=keys, args=args)
+    if results == -3:
+        await _aseed_restaurants(restaurants_key, team)
+        results = await cast(keys=keys, args=args)
+
+    return _cast_votes_results(user_id, votes, date, results)
+
+
+def votes_per_day(user_id: int, date: datetime.date = None, team: Team = None) -> int:
+    # the buffered votes are kept for KEY_TTL whichever the team
+    if not date:
+        date = (team or Team.shared_pool()).voting_date()
+
+    key = VOTES_KEY.format(date=date, user_id=user_id)
+    total = get_redis().hget(key, 'total')
+    if total is None:
+        _seed_votes(user_id, date)
+        total = get_redis().hget(key, 'total')
+    return int(total)
+
+
+def flush(date: datetime.date = None) -> int:
+    redis = get_redis()
+    dates = [date] if date else sorted(map(datetime.date.fromisoformat, redis.smembers(DIRTY_DATES_KEY)))
+    forget_date = redis.register_script(FORGET_DATE_SCRIPT)
+    flushed = 0
+
+    for date in dates:
+        dirty_key = DIRTY_USERS_KEY.format(date=date)
+
+        while user_ids := redis.spop(dirty_key, FLUSH_BATCH_SIZE):
+            pipeline = redis.pipeline(transaction=False)
+            for user_id in user_ids:
+                pipeline.hgetall(VOTES_KEY.format(date=date, user_id=user_id))
+
+            votes = [
+                Vote(user_id=int(user_id), restaurant_id=int(field.split(':')[0]), date=date,
+                     amount=int(user_votes[field]), score=float(user_votes[field.replace(':amount', ':score')]))
+                for user_id, user_votes in zip(user_ids, pipeline.execute())
+                for field in user_votes if field.endswith(':amount')
+            ]
+
+            try:
+                flushed += Vote.objects.bulk_upsert(date, votes)
+            except Exception:
+                redis.sadd(dirty_key, *user_ids)
+                raise
+
+        forget_date(keys=[DIRTY_DATES_KEY, dirty_key], args=[date.isoformat()])
+
+    return flushed
+
+
+def _cast_votes_params(user_id: int, votes: dict[int, int], max_votes: int, votes_weights: list[float],
+                       date: datetime.date, default_weight: float, restaurants_key: str) -> tuple[list, list]:
+    keys = [
+        VOTES_KEY.format(date=date, user_id=user_id),
+        DIRTY_USERS_KEY.format(date=date),
+        leaderboard.SCORES_KEY.format(date=date),
+        leaderboard.VOTERS_KEY.format(date=date),
+        DIRTY_DATES_KEY,
+        restaurants_key,
+    ]
+    args = [
+        user_id, max_votes, KEY_TTL, default_weight, date.isoformat(), len(votes_weights), *votes_weights,
+        *itertools.chain.from_iterable(votes.items())
+    ]
+    return keys, args
+
+
+def _cast_votes_results(user_id: int, votes: dict[int, int], date: datetime.date, results: list | int) -> list[Vote]:
+    if results == -1:
+        raise VotesLimitExceeded
+    if results == -2:
+        raise Restaurant.DoesNotExist
+
+    return [
+        Vote(user_id=user_id, restaurant_id=restaurant_id, date=date, amount=amount, score=float(score))
+        for restaurant_id, amount, score in zip(votes, results[::2], results[1::2])
+    ]
+
+
+def _seed_votes(user_id: int, date: datetime.date):
+    votes = list(Vote.objects.filter(user_id=user_id, date=date).values_list('restaurant_id', 'amount', 'score'))
+
+    seed = get_redis().register_script(SEED_VOTES_SCRIPT)
+    seed(keys=[VOTES_KEY.format(date=date, user_id=user_id)], args=[KEY_TTL, *_seed_fields(votes)])
+
+
+async def _aseed_votes(user_id: int, date: datetime.date):
+    votes = [
+        vote async for vote in Vote.objects.filter(user_id=user_id, date=date)
+        .values_list('restaurant_id', 'amount', 'score')
+    ]
+
+    seed = get_async_redis().register_script(SEED_VOTES_SCRIPT)
+    await seed(keys=[VOTES_KEY.format(date=date, user_id=user_id)], args=[KEY_TTL, *_seed_fields(votes)])
+
+
+def _seed_restaurants(key: str, team: Team):
+    restaurant_ids = list(Restaurant.objects.filter(team_id=team.pk).values_list('id', flat=True))
+    _restaurants_pipeline(get_redis().pipeline(), key, restaurant_ids).execute()
+
+
+async def _aseed_restaurants(key: str, team: Team):
+    restaurant_ids = [
+        restaurant_id async for restaurant_id in Restaurant.objects.filter(team_id=team.pk).values_list('id', flat=True)
+    ]
+    await _restaurants_pipeline(get_async_redis().pipeline(), key, restaurant_ids).execute()
+
+
+def _restaurants_pipeline(pipeline, key: str, restaurant_ids: list[int]):
+    # the empty member keeps the key of a team without restaurants
+    pipeline.sadd(key, '', *restaurant_ids)
+    pipeline.expire(key, KEY_TTL)
+    return pipeline
+
+
+def _seed_fields(votes: list[tuple[int, int, float]]) -> list:
+    fields = ['total', sum(amount for _, amount, _ in votes)]
+    for restaurant_id, amount, score in votes:
+        fields.extend((f'{restaurant_id}:amount', amount, f'{restaurant_id}:score', score))
+    return fields
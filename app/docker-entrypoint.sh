@@ -13,6 +13,13 @@ fi
 
 ./manage.py migrate
 ./manage.py createsuperuser --noinput
-./manage.py runserver 0.0.0.0:8000
+
+# SERVER=asgi serves the async endpoints without blocking a worker per request
+if [ "$SERVER" = "asgi" ]
+then
+    uvicorn lunch_voter.asgi:application --host 0.0.0.0 --port 8000 --workers ${WEB_CONCURRENCY:-2}
+else
+    ./manage.py runserver 0.0.0.0:8000
+fi
 
 exec "$@"
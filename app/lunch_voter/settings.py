@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'drf_yasg',
     'constance',
     'constance.backends.database',
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'base.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,6 +58,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'base.middleware.ReadYourWritesMiddleware',
 ]
 
 ROOT_URLCONF = 'lunch_voter.urls'
@@ -85,10 +88,11 @@ WSGI_APPLICATION = 'lunch_voter.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Postgres is required, the votes, tallies, winners and stats are written by its SQL
 DATABASES = {
     'default': {
-        'ENGINE': os.environ.get('SQL_ENGINE', 'django.db.backends.sqlite3'),
-        'NAME': os.environ.get('SQL_DATABASE', BASE_DIR / 'db.sqlite3'),
+        'ENGINE': os.environ.get('SQL_ENGINE', 'django.db.backends.postgresql'),
+        'NAME': os.environ.get('SQL_DATABASE', 'lunch_voter'),
         'USER': os.environ.get('SQL_USER', 'user'),
         'PASSWORD': os.environ.get('SQL_PASSWORD', 'password'),
         'HOST': os.environ.get('SQL_HOST', 'localhost'),
@@ -97,6 +101,18 @@ DATABASES = {
 
 }
 
+# Optional read replica for the read-heavy endpoints. A user who has written is pinned to the primary
+# for REPLICA_PIN_SECONDS, which must cover the replication lag
+if os.environ.get('SQL_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ.get('SQL_REPLICA_HOST'),
+        'PORT': os.environ.get('SQL_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['base.db_router.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', default=5))
+
 
 CACHES = {
     'default': {
@@ -149,9 +165,18 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': ('knox.auth.TokenAuthentication', ),
+    'DEFAULT_AUTHENTICATION_CLASSES': ('api.authentication.CachedTokenAuthentication', ),
+    # behind nginx the client address is the one it adds to X-Forwarded-For, set to 1 there.
+    # Without a proxy the header is up to the client, so the throttles by IP use the peer address
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', default=0)),
 }
 
+# Seconds a verified token is trusted without looking it up in the database
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.environ.get('AUTH_TOKEN_CACHE_TIMEOUT', default=60))
+
+# Seconds the responses to the requests with the Idempotency-Key header are replayed to their retries
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', default=24 * 60 * 60))
+
 REST_KNOX = {
     'AUTH_HEADER_PREFIX': 'Bearer',
 }
@@ -159,14 +184,43 @@ REST_KNOX = {
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER", "redis://127.0.0.1:6379/0")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_BACKEND", "redis://127.0.0.1:6379/0")
 
-CONSTANCE_BACKEND = 'constance.backends.database.DatabaseBackend'
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/2')
+
+# Votes are applied to Redis and periodically flushed to the database
+VOTES_WRITE_BEHIND = int(os.environ.get('VOTES_WRITE_BEHIND', default=0))
+VOTES_FLUSH_INTERVAL = int(os.environ.get('VOTES_FLUSH_INTERVAL', default=5))
+
+# Timezone and local time of the end of the voting day of the restaurants without a team, teams have their own.
+# The schedule of the teams' cutoffs is checked every WINNERS_SCHEDULE_INTERVAL seconds
+VOTING_TIMEZONE = os.environ.get('VOTING_TIMEZONE', 'UTC')
+VOTING_CUTOFF = os.environ.get('VOTING_CUTOFF', '00:00')
+WINNERS_SCHEDULE_INTERVAL = int(os.environ.get('WINNERS_SCHEDULE_INTERVAL', default=60))
+
+# Votes are partitioned by month, partitions are created ahead of time and archived once they get old
+VOTES_PARTITIONS_AHEAD = int(os.environ.get('VOTES_PARTITIONS_AHEAD', default=3))
+VOTES_KEEP_MONTHS = int(os.environ.get('VOTES_KEEP_MONTHS', default=12))
+VOTES_ARCHIVE_DIR = os.environ.get('VOTES_ARCHIVE_DIR', BASE_DIR / 'archive')
+
+# Prometheus metrics of the requests and Celery tasks, served on METRICS_PATH, which nginx doesn't proxy.
+# Samples are summed up in every process and added to the shared totals in Redis every METRICS_FLUSH_INTERVAL seconds
+METRICS_ENABLED = int(os.environ.get('METRICS_ENABLED', default=1))
+METRICS_PATH = os.environ.get('METRICS_PATH', 'metrics')
+METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', default=5))
+
+CONSTANCE_BACKEND = 'base.constance_backend.LocalCachedDatabaseBackend'
 CONSTANCE_DATABASE_CACHE_BACKEND = 'default'
+# Max delay in seconds for a settings change to reach every process
+CONSTANCE_LOCAL_CACHE_TIMEOUT = int(os.environ.get('CONSTANCE_LOCAL_CACHE_TIMEOUT', default=5))
 CONSTANCE_ADDITIONAL_FIELDS = {
     'list_int_field': ['base.fields.IntegerListField', {}],
 }
 CONSTANCE_CONFIG = {
     'MAX_VOTES_PER_DAY': (5, 'Max votes per user per day'),
-    'VOTES_WEIGHTS': ([1, 0.5, 0.25], 'Votes weights', 'list_int_field')
+    'VOTES_WEIGHTS': ([1, 0.5, 0.25], 'Votes weights', 'list_int_field'),
+    'VOTES_THROTTLE_RATE': (60, 'Max vote requests per user per minute, 0 to switch the throttle off'),
+    'VOTES_THROTTLE_BURST': (10, 'Max vote requests per user in a burst'),
+    'AUTH_THROTTLE_RATE': (10, 'Max login and registration requests per IP per minute, 0 to switch the throttle off'),
+    'AUTH_THROTTLE_BURST': (10, 'Max login and registration requests per IP in a burst'),
 }
 
 SWAGGER_SETTINGS = {